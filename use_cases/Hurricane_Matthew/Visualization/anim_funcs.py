@@ -0,0 +1,348 @@
+"""
+anim_funcs.py
+
+This file contains functions to stream map frames (RGBA pixel buffers, see image_funcs.render_rgba) into an
+animation file: an animated GIF or WebP (with Pillow), or an MP4 video (with a local ffmpeg program). No image file
+is written for each frame. The frames are encoded by a background thread as they are submitted, and at most a few
+frames wait in memory at once, so the memory use does not grow with the number of frames:
+    with anim_funcs.AnimationWriter(fname, {'format': 'gif', 'fps': 4}, n_frames) as writer:
+        for fig in frames:
+            writer.submit(image_funcs.render_rgba(fig), fname)
+    anim_stats = writer.stats   # {'fname': ..., 'format': 'gif', 'n_frames': ..., 'bytes': ..., 'encode_s': ...}
+
+An AnimationWriter has the same submit method as image_funcs.ImageWriter, so it can be passed as the image_writer of
+map_funcs.map_plot to make each plot the next frame of the animation.
+"""
+
+import os
+import time
+import queue
+import shutil
+import threading
+import subprocess
+import concurrent.futures
+import numpy as np
+from PIL import Image, GifImagePlugin
+
+# File name extension of each animation format
+anim_formats = {'gif': 'gif', 'webp': 'webp', 'mp4': 'mp4'}
+
+# Default animation options (see get_anim_opts)
+anim_defaults = {'format': 'gif', 'fps': 4, 'loop': 0, 'lossless': True, 'quality': 90, 'crf': 20, 'colors': 256}
+
+def get_ffmpeg():
+    """
+    Function to find the ffmpeg program, needed for MP4 animations.
+    -- Output:
+        - ffmpeg: string, path of the ffmpeg program, or None if it is not on the PATH
+    """
+    return shutil.which('ffmpeg')
+
+def get_anim_opts(anim_opts):
+    """
+    Function to check a dictionary of animation options and fill in the defaults.
+    -- Input:
+        - anim_opts: dictionary with any of the keys:
+            - format: string, 'gif', 'webp', or 'mp4' (default: 'gif'); 'mp4' needs the ffmpeg program
+            - fps: float, frames per second (default: 4)
+            - loop: integer, number of times GIF & WebP animations play, or 0 to loop forever (default: 0)
+            - lossless: boolean, lossless (True) or lossy (False) WebP (default: True)
+            - quality: integer, lossy WebP quality from 1 to 100; for lossless WebP, the compression effort
+                       (default: 90)
+            - crf: integer, MP4 (H.264) constant rate factor from 0 (lossless, largest) to 51 (smallest) (default: 20)
+            - colors: integer, number of colors of each GIF frame, from 2 to 256 (default: 256)
+    -- Output:
+        - anim_opts: new dictionary with all keys set
+    """
+    anim_opts = dict(anim_defaults, **anim_opts)
+    if anim_opts['format'] not in anim_formats:
+        raise ValueError('Unknown animation format ' + str(anim_opts['format']) + ', expected one of: ' +
+                         ', '.join(anim_formats))
+    if anim_opts['format'] == 'mp4' and get_ffmpeg() is None:
+        raise ValueError('MP4 animations need the ffmpeg program, which was not found on the PATH')
+    if anim_opts['fps'] <= 0:
+        raise ValueError('Animation fps should be positive, got ' + str(anim_opts['fps']))
+    if not 1 <= anim_opts['quality'] <= 100:
+        raise ValueError('Animation quality should be from 1 to 100, got ' + str(anim_opts['quality']))
+    if not 0 <= anim_opts['crf'] <= 51:
+        raise ValueError('MP4 crf should be from 0 to 51, got ' + str(anim_opts['crf']))
+    if not 2 <= anim_opts['colors'] <= 256:
+        raise ValueError('GIF colors should be from 2 to 256, got ' + str(anim_opts['colors']))
+    return anim_opts
+
+def fit_frame(rgba, height, width):
+    """
+    Function to crop or pad a frame to the size of the animation. The maps of a product are all cropped to nearly the
+    same bounding box, but a longer title can make a frame a few pixels larger than the first one.
+    -- Inputs:
+        - rgba: 3D array of uint8 (rows, columns, RGBA)
+        - height, width: integers, frame size of the animation [pixels]
+    -- Output:
+        - rgba: 3D array of uint8 (height, width, RGBA), padded at the bottom & right with white
+    """
+    if rgba.shape[0] == height and rgba.shape[1] == width:
+        return rgba
+    fitted = np.full((height, width, 4), 255, dtype=np.uint8)
+    n_rows = min(height, rgba.shape[0])
+    n_cols = min(width, rgba.shape[1])
+    fitted[:n_rows, :n_cols] = rgba[:n_rows, :n_cols]
+    return fitted
+
+class FrameStream(Image.Image):
+    """
+    Class of a multi-frame Pillow image whose frames are pulled from an iterator of RGBA arrays as Pillow seeks to
+    them, so that Pillow's WebP animation encoder (which takes its frames as one multi-frame image) gets them one at
+    a time instead of all at once. It can only seek forward.
+    """
+
+    def __init__(self, frames, n_frames):
+        super().__init__()
+        self.frames = frames
+        self.n_frames_total = n_frames
+        self.frame_idx = -1
+        self.seek(0)
+
+    @property
+    def n_frames(self):
+        return self.n_frames_total
+
+    @property
+    def is_animated(self):
+        return self.n_frames_total > 1
+
+    def seek(self, frame):
+        if frame == self.frame_idx:
+            return
+        if frame != self.frame_idx + 1 or frame >= self.n_frames_total:
+            raise EOFError('FrameStream can only seek to its next frame')
+        rgba = next(self.frames, None)
+        if rgba is None:
+            raise EOFError('Animation ended after ' + str(frame) + ' of ' + str(self.n_frames_total) + ' frames')
+        image = Image.fromarray(rgba, 'RGBA')
+        self.im = image.im
+        self._mode = image.mode
+        self._size = image.size
+        self.frame_idx = frame
+
+    def tell(self):
+        return self.frame_idx
+
+class AnimationWriter:
+    """
+    Class that streams frames into an animation file, encoding them in a background thread. The file is written
+    under a temporary name and renamed when all frames are in, so a partial animation never appears under its
+    final name.
+    -- Usage:
+        - writer = AnimationWriter(fname, anim_opts, n_frames)
+        - writer.submit(rgba) for each frame, in order (it waits while max_queued frames are waiting to be encoded)
+        - writer.close() waits for the last frames and finishes the file; writer.stats then has its summary
+        - writer.close(abort=True), or leaving a with block with an exception, discards the animation
+    """
+
+    def __init__(self, fname, anim_opts, n_frames, max_queued=2):
+        self.fname = fname
+        self.anim_opts = get_anim_opts(anim_opts)
+        self.n_frames = n_frames
+        self.tmp_fname = str(fname) + '.tmp'
+        self.frame_queue = queue.Queue(maxsize=max_queued)
+        self.n_submitted = 0
+        self.queue_done = False
+        self.frame_size = None
+        self.error = None
+        self.aborted = False
+        self.closed = False
+        self.stats = None
+        self.wait_s = 0.0
+        self.encode_s = 0.0
+        self.encode_cpu_s = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(fname)), exist_ok=True)
+        self.thread = threading.Thread(target=self.run, name='anim_writer', daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close(abort=exc_type is not None)
+
+    def submit(self, rgba, fname=None):
+        """
+        Function to add the next frame to the animation.
+        -- Inputs:
+            - rgba: 3D array of uint8 (rows, columns, RGBA), e.g., from image_funcs.render_rgba (it must not be
+                    changed after); frames are cropped or padded to the size of the first frame (see fit_frame)
+            - fname: ignored (for the same call as image_funcs.ImageWriter.submit)
+        -- Output:
+            - future: concurrent.futures.Future, whose result is a dictionary with the keys fname and frame (index)
+                      once the frame has been encoded
+        """
+        if self.error is not None:
+            raise self.error
+        if self.closed:
+            raise ValueError('Animation ' + str(self.fname) + ' is already closed')
+        if self.n_submitted >= self.n_frames:
+            raise ValueError('Animation ' + str(self.fname) + ' only has ' + str(self.n_frames) + ' frames')
+        if self.frame_size is None:
+            height, width = rgba.shape[:2]
+            # H.264 with 4:2:0 chroma subsampling needs an even frame width & height
+            if self.anim_opts['format'] == 'mp4':
+                height, width = height // 2 * 2, width // 2 * 2
+            self.frame_size = (height, width)
+        future = concurrent.futures.Future()
+        self.frame_queue.put((fit_frame(rgba, *self.frame_size), future))
+        self.n_submitted += 1
+        return future
+
+    def get_frames(self):
+        """
+        Function (generator) run by the writer thread to take the submitted frames from the queue, until close.
+        The future of each frame is resolved when the next frame is taken, as the frame has been encoded by then.
+        -- Output:
+            - yields 3D arrays of uint8 (rows, columns, RGBA)
+        """
+        prev = None
+        frame_idx = 0
+        while True:
+            wait_beg = time.perf_counter()
+            item = self.frame_queue.get()
+            self.wait_s += time.perf_counter() - wait_beg
+            if prev is not None:
+                prev.set_result({'fname': self.fname, 'frame': frame_idx - 1})
+            if item is None:
+                self.queue_done = True
+                return
+            rgba, prev = item
+            frame_idx += 1
+            yield rgba
+
+    def run(self):
+        """
+        Procedure run by the writer thread to encode the frames into the temporary file.
+        """
+        wall_beg = time.perf_counter()
+        cpu_beg = time.thread_time()
+        try:
+            if self.anim_opts['format'] == 'gif':
+                self.write_gif()
+            elif self.anim_opts['format'] == 'webp':
+                self.write_webp()
+            else:
+                self.write_mp4()
+        except BaseException as e:
+            if not self.aborted:
+                self.error = e
+            # Keep taking frames until close, so the frames being submitted do not wait forever
+            while not self.queue_done:
+                item = self.frame_queue.get()
+                if item is None:
+                    self.queue_done = True
+                else:
+                    item[1].set_exception(e)
+        # The time spent waiting for the next frame to be drawn is not part of the encoding
+        self.encode_s = time.perf_counter() - wall_beg - self.wait_s
+        self.encode_cpu_s = time.thread_time() - cpu_beg
+
+    def write_gif(self):
+        """
+        Procedure to encode the frames into an animated GIF, one frame at a time. Each frame has its own palette of up
+        to anim_opts['colors'] colors, without dithering, to keep the flat color fills of the maps clean.
+        """
+        duration = 1000.0 / self.anim_opts['fps']
+        with open(self.tmp_fname, 'wb') as f:
+            for frame_idx, rgba in enumerate(self.get_frames()):
+                frame = Image.fromarray(rgba, 'RGBA').convert('RGB').quantize(
+                    self.anim_opts['colors'], method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+                if frame_idx == 0:
+                    header, _ = GifImagePlugin.getheader(frame, info={'loop': self.anim_opts['loop'],
+                                                                      'duration': duration})
+                    for chunk in header:
+                        f.write(chunk)
+                for chunk in GifImagePlugin.getdata(frame, include_color_table=True, duration=duration):
+                    f.write(chunk)
+            f.write(b';')
+
+    def write_webp(self):
+        """
+        Procedure to encode the frames into an animated WebP. Pillow's encoder keeps only the compressed frames.
+        """
+        frames = self.get_frames()
+        first = next(frames, None)
+        if first is None:
+            raise EOFError('Animation ' + str(self.fname) + ' has no frames')
+        append_images = []
+        if self.n_frames > 1:
+            append_images = [FrameStream(frames, self.n_frames - 1)]
+        save_kwargs = {'quality': self.anim_opts['quality'], 'method': 4}
+        if self.anim_opts['lossless']:
+            save_kwargs['lossless'] = True
+        Image.fromarray(first, 'RGBA').save(self.tmp_fname, format='WEBP', save_all=True, append_images=append_images,
+                                            duration=1000.0 / self.anim_opts['fps'], loop=self.anim_opts['loop'],
+                                            **save_kwargs)
+        # Take the end of the queue, which also resolves the future of the last frame
+        for _ in frames:
+            pass
+
+    def write_mp4(self):
+        """
+        Procedure to encode the frames into an H.264 MP4 video, by piping their pixels to ffmpeg.
+        """
+        frames = self.get_frames()
+        first = next(frames, None)
+        if first is None:
+            raise EOFError('Animation ' + str(self.fname) + ' has no frames')
+        height, width = first.shape[:2]
+        cmd = [get_ffmpeg(), '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgba',
+               '-s', str(width) + 'x' + str(height), '-r', str(self.anim_opts['fps']), '-i', '-', '-an',
+               '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-crf', str(self.anim_opts['crf']),
+               '-movflags', '+faststart', '-f', 'mp4', self.tmp_fname]
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            proc.stdin.write(first.tobytes())
+            for rgba in frames:
+                proc.stdin.write(rgba.tobytes())
+        except BrokenPipeError:
+            # ffmpeg stopped early; its error message is reported below
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            stderr = proc.stderr.read()
+            proc.wait()
+        if proc.returncode != 0:
+            raise RuntimeError('ffmpeg failed with exit code ' + str(proc.returncode) + ': ' +
+                               stderr.decode(errors='replace').strip())
+
+    def close(self, abort=False):
+        """
+        Function to wait for the submitted frames to be encoded and finish the animation file.
+        -- Input:
+            - abort: boolean, discard the animation instead (e.g., after a frame failed) (default: False)
+        -- Output:
+            - stats: dictionary with the keys fname, format, width, height, n_frames, bytes (file size), encode_s
+                     (wall time of the writer thread spent encoding), and encode_cpu_s (CPU time of the writer thread), or None if
+                     the animation was discarded
+        """
+        if self.closed:
+            return self.stats
+        self.closed = True
+        if abort or (self.n_submitted < self.n_frames and self.error is None):
+            if not abort:
+                self.error = EOFError('Animation ' + str(self.fname) + ' got ' + str(self.n_submitted) + ' of ' +
+                                      str(self.n_frames) + ' frames')
+            self.aborted = True
+        self.frame_queue.put(None)
+        self.thread.join()
+        if self.aborted or self.error is not None:
+            if os.path.exists(self.tmp_fname):
+                os.remove(self.tmp_fname)
+            if self.error is not None and not abort:
+                raise self.error
+            return None
+        os.replace(self.tmp_fname, self.fname)
+        self.stats = {'fname': self.fname, 'format': self.anim_opts['format'], 'width': self.frame_size[1],
+                      'height': self.frame_size[0], 'n_frames': self.n_submitted,
+                      'bytes': os.path.getsize(self.fname), 'encode_s': round(self.encode_s, 6),
+                      'encode_cpu_s': round(self.encode_cpu_s, 6)}
+        return self.stats
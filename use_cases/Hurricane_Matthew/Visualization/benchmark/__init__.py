@@ -0,0 +1,12 @@
+"""
+benchmark
+
+Benchmarks for the plot_wrf visualization pipeline, run on synthetic WRF output so they need no real model data and
+no network access:
+    - synth_wrf.py: writes synthetic wrfout, wrfout_zlev, and wrfout_plev files of any grid size
+    - bench_plot_wrf.py: times each stage of making a plot (file open, diagnostics, contourf, raster, barbs, features,
+      savefig) and writes the timings to a JSON file, optionally comparing them to an earlier run
+
+Run them as modules from the Visualization directory (e.g., python -m benchmark.bench_plot_wrf -h), so that
+map_funcs, plan_funcs, and wrf_funcs can be imported.
+"""
@@ -0,0 +1,680 @@
+#! /usr/bin/env python3
+
+"""
+bench_plot_wrf.py
+
+This script benchmarks the stages of making plot_wrf maps, on synthetic WRF output of one or more grid sizes (see
+synth_wrf.py), so that the effect of code changes or of upgrading Cartopy, wrf-python, Matplotlib, etc. can be measured.
+It runs offline: the Cartopy features stage is skipped (and noted in the results) if the Natural Earth shapefiles it
+needs have not already been downloaded.
+
+The stages are timed separately, each on a fresh map so that they do not include each other's drawing time:
+    - open: opening the wrfout, wrfout_zlev, and wrfout_plev files
+    - grid: getting the map projection & limits, and projecting the lat/lon grid into map coordinates
+    - diagnostics: reading all fields of the plot plan, including the diagnostics of diag_funcs and refl_funcs
+    - contourf: filled contours of every product in the plot plan, drawn in map coordinates
+    - raster: the same products drawn as colored grid cells (plot_wrf render_mode = 'raster'), with the fraction of
+      pixels that differ from the contourf map, to check that the raster maps still look the same
+    - barbs: 10-m wind barbs, thinned as in plot_wrf.py
+    - features: Cartopy borders, states, oceans, lakes, and coastlines
+    - savefig: saving a complete map (features, filled contours, barbs, colorbar) to PNG with Matplotlib's savefig
+    - render: drawing the same map into an RGBA pixel buffer (image_funcs.render_rgba), as plot_wrf does
+
+Compressing the rendered map to each of the image formats in bench_images is also timed, and reported with the file
+sizes (images in the results). The lowest-level and composite reflectivity of refl_funcs are checked against
+wrf-python's dbz and mdbz diagnostics (largest difference, with the time and peak memory of each, refl in the results),
+and the surface diagnostics of diag_funcs against those of wrf.getvar (largest difference and time, diags in the
+results), on the Mercator grid and on a Lambert conformal grid of the same size, whose 10-m winds are rotated from
+grid-relative to earth-relative (uvmet10). The fields computed in tiles of grid rows with a memory budget of tile_budget_mb are checked against the
+same fields computed from their full 3D inputs (largest difference, time, and peak memory, tiles in the results).
+
+Each stage is run --repeat times. The timings are written to a JSON file with the library versions and machine
+details, and can be compared with those of an earlier run with --compare. Results that must stay within a limit (the
+fraction of pixels of each raster map that differ from its contourf map, see raster_diff_max, and the largest
+differences of the reflectivity and surface diagnostics, see refl_diff_max and diag_diff_max) are checked after each
+grid size; the script prints an error for each one beyond its limit (failures in the results) and then exits with
+status 1, after writing the JSON file.
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import pathlib
+import argparse
+import platform
+import statistics
+import tempfile
+import tracemalloc
+import datetime as dt
+import numpy as np
+import matplotlib as mpl
+mpl.use('Agg')
+import matplotlib.pyplot as plt
+import netCDF4
+import wrf
+import cartopy
+import cartopy.crs as ccrs
+from cartopy.io import Downloader
+
+# Import functions from local files
+import diag_funcs
+import image_funcs
+import map_funcs
+import plan_funcs
+import refl_funcs
+import wrf_funcs
+import plot_wrf
+from benchmark import synth_wrf
+
+stages = ['open', 'grid', 'diagnostics', 'contourf', 'raster', 'barbs', 'features', 'savefig', 'render']
+
+# Natural Earth shapefiles drawn by map_funcs.draw_map_features, at each scale that Cartopy may pick for a map
+feature_files = [('cultural', 'admin_0_boundary_lines_land', ['10m', '50m', '110m']),
+                 ('cultural', 'admin_1_states_provinces_lakes', ['10m']),
+                 ('physical', 'ocean', ['10m', '50m', '110m']),
+                 ('physical', 'lakes', ['10m', '50m', '110m']),
+                 ('physical', 'coastline', ['10m', '50m', '110m'])]
+
+# A stage is flagged in --compare if its median time grew by more than this fraction
+slower_frac = 0.2
+
+# Image formats & options to time the encoding of (see image_funcs.get_image_opts)
+bench_images = {'png': {'format': 'png'},
+                'png_fast': {'format': 'png', 'compress_level': 1},
+                'webp_lossless': {'format': 'webp', 'lossless': True},
+                'webp_lossy': {'format': 'webp', 'lossless': False, 'quality': 90},
+                'jpeg': {'format': 'jpeg', 'quality': 90}}
+
+# A pixel of a raster map differs from the contourf map if any of its RGBA values differs by more than this
+raster_diff_tol = 40
+
+# Largest fraction of the pixels of the raster map of a product that may differ from its contourf map, by product
+# (raster_diff_max_default for the others); the edges between colors differ most on fields with narrow features
+raster_diff_max = {'REFL': 0.1, 'CREFL': 0.1, 'TERRAIN': 0.03}
+raster_diff_max_default = 0.01
+
+# Largest difference [dBZ] allowed between the reflectivity of refl_funcs and wrf-python's dbz & mdbz diagnostics
+refl_diff_max = 1e-4
+
+# Largest difference allowed between the surface diagnostics of diag_funcs and wrf-python's, in the units of each
+# (slp [hPa], rh2 [%], uvmet10 & wspd10 [m s-1], t2c [°C]); diag_funcs computes them in float32
+diag_diff_max = {'slp': 1e-3, 'rh2': 1e-3, 'uvmet10': 1e-4, 'wspd10': 1e-4, 't2c': 1e-4}
+
+# Memory budget [MB] to compute the fields from 3D inputs in tiles of grid rows (see wrf_funcs.read_tiled_field)
+tile_budget_mb = 10
+
+cycle_dt = dt.datetime(2016, 10, 6, 0)
+valid_lead_h = 6
+json_indent = 1
+
+def get_missing_features():
+    """
+    Function to find the Natural Earth shapefiles for map features that are not available locally. Cartopy would try
+    to download these when drawing the features.
+    -- Output:
+        - missing: list of missing shapefile names (e.g., ne_10m_ocean)
+    """
+    missing = []
+    for category, name, scales in feature_files:
+        downloader = Downloader.from_config(('shapefiles', 'natural_earth', category))
+        for scale in scales:
+            fmt = {'category': category, 'name': name, 'resolution': scale, 'config': cartopy.config}
+            paths = [downloader.pre_downloaded_path(fmt), downloader.target_path(fmt)]
+            if not any(path is not None and os.path.exists(path) for path in paths):
+                missing.append('ne_' + scale + '_' + name)
+    return missing
+
+def get_versions():
+    """
+    Function to get the versions of Python and of the libraries used to make the plots.
+    -- Output:
+        - versions: dictionary of package name to version string
+    """
+    import shapely
+    import pyproj
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'matplotlib': mpl.__version__,
+            'cartopy': cartopy.__version__, 'wrf-python': wrf.__version__, 'netCDF4': netCDF4.__version__,
+            'shapely': shapely.__version__, 'pyproj': pyproj.__version__}
+
+def new_map(cart_proj, cart_xlim, cart_ylim):
+    """
+    Function to create an empty map, drawn once so that later timings do not include setting up the figure.
+    -- Inputs:
+        - cart_proj: Cartopy object, map projection
+        - cart_xlim, cart_ylim: map limits in projected coordinates
+    -- Outputs:
+        - fig, ax: Matplotlib figure and Cartopy GeoAxes
+    """
+    fig = plt.figure(figsize=(10, 8))
+    ax = plt.subplot(projection=cart_proj)
+    ax.set_xlim(cart_xlim)
+    ax.set_ylim(cart_ylim)
+    fig.canvas.draw()
+    return fig, ax
+
+def get_rgba(fig):
+    """
+    Function to get the rendered pixels of a figure that has been drawn.
+    -- Input:
+        - fig: Matplotlib figure
+    -- Output:
+        - rgba: 3D array of integers (rows, columns, RGBA)
+    """
+    return np.asarray(fig.canvas.buffer_rgba()).astype(np.int16)
+
+def draw_barbs(ax, lons, lats, u, v):
+    """
+    Function to draw 10-m wind barbs, thinned and styled as in plot_wrf.py.
+    -- Inputs:
+        - ax: Cartopy GeoAxes
+        - lons, lats, u, v: 2D arrays
+    -- Output:
+        - barbs: Matplotlib Barbs object
+    """
+    thin = plot_wrf.barb_thin
+    return ax.barbs(lons[::thin, ::thin], lats[::thin, ::thin], u[::thin, ::thin], v[::thin, ::thin], length=5,
+                    transform=ccrs.PlateCarree(), linewidth=plot_wrf.barb_width,
+                    barb_increments={'half': 2.5, 'full': 5, 'flag': 25})
+
+def bench_case(wrf_dir, products, repeat, features):
+    """
+    Function to time each stage of making maps from one set of wrfout, wrfout_zlev, and wrfout_plev files.
+    -- Inputs:
+        - wrf_dir: pathlib object, directory with the synthetic WRF output files
+        - products: list of product dictionaries (see plan_funcs.read_plot_plan)
+        - repeat: integer, number of times to run each stage
+        - features: boolean, time drawing the Cartopy features
+    -- Outputs:
+        - timings: dictionary of stage to list of times [s] (one per repeat)
+        - product_timings: dictionary of product name to list of contourf times [s]
+        - raster_timings: dictionary of product name to list of raster times [s]
+        - raster_diffs: dictionary of product name to the fraction of pixels of the raster map that differ from the
+                        contourf map (see raster_diff_tol)
+        - image_timings: dictionary of image format name (see bench_images) to list of encoding times [s]
+        - image_bytes: dictionary of image format name to the file size [bytes]
+    """
+    valid_dt = cycle_dt + dt.timedelta(hours=valid_lead_h)
+    fnames = {}
+    for stream, (_, prefix) in synth_wrf.stream_writers.items():
+        fnames[stream] = wrf_dir.joinpath(prefix + 'd01_' + valid_dt.strftime(synth_wrf.wrf_fmt))
+    product_fields = [plan_funcs.get_product_fields(product, product['barbs']) for product in products]
+    read_plan = plan_funcs.get_read_plan(product_fields)
+    wind_fields = [(wind_var, None) for wind_var in wrf_funcs.wind_vars['wrfout']]
+    wrfout_fields = read_plan.setdefault('wrfout', [])
+    wrfout_fields.extend([fld for fld in wind_fields if fld not in wrfout_fields])
+
+    timings = {stage: [] for stage in stages if features or stage != 'features'}
+    product_timings = {product['name']: [] for product in products}
+    raster_timings = {product['name']: [] for product in products}
+    raster_diffs = {}
+    image_timings = {name: [] for name in bench_images}
+    image_bytes = {}
+    for rr in range(repeat):
+        t_beg = time.perf_counter()
+        ds_by_stream = {stream: netCDF4.Dataset(fname) for stream, fname in fnames.items()}
+        timings['open'].append(time.perf_counter() - t_beg)
+
+        t_beg = time.perf_counter()
+        ds = ds_by_stream['wrfout']
+        lats = ds.variables['XLAT'][0].data
+        lons = ds.variables['XLONG'][0].data
+        cart_proj = wrf.get_cartopy(wrfin=ds)
+        cart_xlim = wrf.cartopy_xlim(wrfin=ds)
+        cart_ylim = wrf.cartopy_ylim(wrfin=ds)
+        proj_x, proj_y = map_funcs.get_projected_coords(cart_proj, lons, lats)
+        timings['grid'].append(time.perf_counter() - t_beg)
+
+        t_beg = time.perf_counter()
+        field_vals = {}
+        for stream, stream_fields in read_plan.items():
+            stream_vals = wrf_funcs.read_fields(ds_by_stream[stream], stream, stream_fields)
+            for (field, level), val in stream_vals.items():
+                field_vals[(stream, field, level)] = wrf.to_np(val)
+        timings['diagnostics'].append(time.perf_counter() - t_beg)
+        for ds_stream in ds_by_stream.values():
+            ds_stream.close()
+
+        contourf_tot = 0.0
+        raster_tot = 0.0
+        for product in products:
+            fill_var = field_vals[(product['stream'], product['field'], product['level'])]
+            cmap, bounds, norm = plan_funcs.get_product_cmap(product)
+            fig, ax = new_map(cart_proj, cart_xlim, cart_ylim)
+            t_beg = time.perf_counter()
+            ax.contourf(proj_x, proj_y, fill_var, bounds, cmap=cmap, norm=norm, extend=product['extend'],
+                        transform=cart_proj)
+            fig.canvas.draw()
+            t_product = time.perf_counter() - t_beg
+            contourf_rgba = get_rgba(fig)
+            plt.close(fig)
+            product_timings[product['name']].append(t_product)
+            contourf_tot += t_product
+
+            raster_opts = {'bounds': bounds, 'extend': product['extend'], 'cmap': cmap, 'norm': norm,
+                           'proj_x': proj_x, 'proj_y': proj_y, 'cart_proj': cart_proj, 'lons': lons, 'lats': lats}
+            fig, ax = new_map(cart_proj, cart_xlim, cart_ylim)
+            t_beg = time.perf_counter()
+            map_funcs.draw_raster(ax, fill_var, raster_opts)
+            fig.canvas.draw()
+            t_product = time.perf_counter() - t_beg
+            if rr == 0:
+                diff = np.abs(get_rgba(fig) - contourf_rgba).max(axis=2)
+                raster_diffs[product['name']] = float(np.mean(diff > raster_diff_tol))
+            plt.close(fig)
+            raster_timings[product['name']].append(t_product)
+            raster_tot += t_product
+        timings['contourf'].append(contourf_tot)
+        timings['raster'].append(raster_tot)
+
+        u10 = field_vals[('wrfout',) + wind_fields[0]]
+        v10 = field_vals[('wrfout',) + wind_fields[1]]
+        fig, ax = new_map(cart_proj, cart_xlim, cart_ylim)
+        t_beg = time.perf_counter()
+        draw_barbs(ax, lons, lats, u10, v10)
+        fig.canvas.draw()
+        timings['barbs'].append(time.perf_counter() - t_beg)
+        plt.close(fig)
+
+        borders, states, oceans, lakes, _, _ = map_funcs.get_cartopy_features()
+        feature_opts = {'borders': borders, 'states': states, 'oceans': oceans, 'lakes': lakes,
+                        'water_color': 'none', 'border_width': 1.5}
+        if features:
+            fig, ax = new_map(cart_proj, cart_xlim, cart_ylim)
+            t_beg = time.perf_counter()
+            map_funcs.draw_map_features(ax, feature_opts)
+            fig.canvas.draw()
+            timings['features'].append(time.perf_counter() - t_beg)
+            plt.close(fig)
+
+        # Complete map of the first product, saved as plot_wrf.py saves its maps
+        product = products[0]
+        fill_var = field_vals[(product['stream'], product['field'], product['level'])]
+        cmap, bounds, norm = plan_funcs.get_product_cmap(product)
+        with mpl.rc_context({'savefig.bbox': 'tight'}):
+            fig, ax = new_map(cart_proj, cart_xlim, cart_ylim)
+            if features:
+                map_funcs.draw_map_features(ax, feature_opts)
+            contours = ax.contourf(proj_x, proj_y, fill_var, bounds, cmap=cmap, norm=norm, extend=product['extend'],
+                                   transform=cart_proj)
+            draw_barbs(ax, lons, lats, u10, v10)
+            fig.colorbar(contours, ax=ax, orientation='horizontal', label=product['label'])
+            ax.gridlines(draw_labels=True)
+            t_beg = time.perf_counter()
+            fig.savefig(io.BytesIO(), format='png')
+            timings['savefig'].append(time.perf_counter() - t_beg)
+            t_beg = time.perf_counter()
+            rgba = image_funcs.render_rgba(fig)
+            timings['render'].append(time.perf_counter() - t_beg)
+            plt.close(fig)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name, image_opts in bench_images.items():
+                image_opts = image_funcs.get_image_opts(image_opts)
+                fname = os.path.join(tmp_dir, name + '.' + image_funcs.image_formats[image_opts['format']])
+                image_stats = image_funcs.encode_image(rgba, fname, image_opts)
+                image_timings[name].append(image_stats['encode_s'])
+                image_bytes[name] = image_stats['bytes']
+
+    return timings, product_timings, raster_timings, raster_diffs, image_timings, image_bytes
+
+def bench_refl(wrf_dir, repeat):
+    """
+    Function to check the reflectivity computed by refl_funcs against wrf-python's dbz (lowest model level) and
+    mdbz (composite) diagnostics, and time both.
+    -- Inputs:
+        - wrf_dir: pathlib object, directory with the synthetic WRF output files
+        - repeat: integer, number of times to compute each
+    -- Output:
+        - refl: dictionary of lowest and composite to a dictionary with the keys max_abs_diff [dBZ], and
+                wrf_python & refl_funcs (timings, see summarize, with the extra key peak_mb, the largest array
+                allocated while computing it [MB], from tracemalloc)
+    """
+    valid_dt = cycle_dt + dt.timedelta(hours=valid_lead_h)
+    fname = wrf_dir.joinpath(synth_wrf.stream_writers['wrfout'][1] + 'd01_' + valid_dt.strftime(synth_wrf.wrf_fmt))
+    methods = {
+        'lowest': {'wrf_python': lambda ds: wrf.getvar(ds, 'dbz', squeeze=False, meta=False)[0, 0, :, :],
+                   'refl_funcs': refl_funcs.get_lowest_refl},
+        'composite': {'wrf_python': lambda ds: wrf.getvar(ds, 'mdbz', squeeze=False, meta=False)[0, :, :],
+                      'refl_funcs': refl_funcs.get_composite_refl},
+    }
+    refl = {}
+    with netCDF4.Dataset(fname) as ds:
+        for name, funcs in methods.items():
+            refl[name] = {}
+            dbz = {}
+            for method, func in funcs.items():
+                times = []
+                for rr in range(repeat):
+                    t_beg = time.perf_counter()
+                    dbz[method] = func(ds)
+                    times.append(time.perf_counter() - t_beg)
+                # Memory is traced in a separate run, as tracing slows down the allocations
+                tracemalloc.start()
+                func(ds)
+                _, peak_bytes = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                refl[name][method] = dict(peak_mb=peak_bytes / 1e6, **summarize(times))
+            refl[name]['max_abs_diff'] = float(np.max(np.abs(dbz['refl_funcs'] - dbz['wrf_python'])))
+    return refl
+
+def bench_diags(wrf_dir, repeat):
+    """
+    Function to check the surface diagnostics computed by diag_funcs against wrf-python's (wrf.getvar), and time both
+    on the same raw variables (read once, see wrf_funcs.read_diag_cache), so that only the computation is timed.
+    -- Inputs:
+        - wrf_dir: pathlib object, directory with the synthetic WRF output files
+        - repeat: integer, number of times to compute each
+    -- Output:
+        - diags: dictionary of slp, rh2, uvmet10 (both earth-relative wind components), wspd10, and t2c to a
+                 dictionary with the keys max_abs_diff (in the units of the diagnostic), and wrf_python & diag_funcs
+                 (timings, see summarize)
+    """
+    valid_dt = cycle_dt + dt.timedelta(hours=valid_lead_h)
+    fname = wrf_dir.joinpath(synth_wrf.stream_writers['wrfout'][1] + 'd01_' + valid_dt.strftime(synth_wrf.wrf_fmt))
+    with netCDF4.Dataset(fname) as ds:
+        cache, _ = wrf_funcs.read_diag_cache(ds, list(wrf_funcs.diag_raw_vars.keys()))
+        cache.update(wrf.extract_vars(ds, 0, ['T2'], squeeze=False, meta=False))
+        map_attrs = wrf_funcs.get_map_attrs(ds)
+        buffers = diag_funcs.DiagBuffers()
+        shape = cache['T2'].shape[-2:]
+
+        def getvar(var):
+            return wrf.getvar(ds, var, cache=cache, squeeze=False, meta=False)
+
+        def calc_uvmet10():
+            return np.stack(diag_funcs.calc_uvmet10(cache['U10'][0], cache['V10'][0], cache['XLAT'][0],
+                                                    cache['XLONG'][0], map_attrs, out_u=buffers.get('u10', shape),
+                                                    out_v=buffers.get('v10', shape)))
+
+        def calc_wspd10():
+            u10, v10 = diag_funcs.calc_uvmet10(cache['U10'][0], cache['V10'][0], cache['XLAT'][0], cache['XLONG'][0],
+                                               map_attrs, out_u=buffers.get('u10', shape),
+                                               out_v=buffers.get('v10', shape))
+            return diag_funcs.calc_wspd(u10, v10, out=buffers.get('wspd10', shape))
+
+        methods = {
+            'slp': {'wrf_python': lambda: getvar('slp')[0, :, :],
+                    'diag_funcs': lambda: diag_funcs.calc_slp(cache['T'][0], cache['P'][0], cache['PB'][0],
+                                                              cache['QVAPOR'][0], cache['PH'][0], cache['PHB'][0],
+                                                              out=buffers.get('slp', shape))},
+            'rh2': {'wrf_python': lambda: getvar('rh2')[0, :, :],
+                    'diag_funcs': lambda: diag_funcs.calc_rh2(cache['T2'][0], cache['PSFC'][0], cache['Q2'][0],
+                                                              out=buffers.get('rh2', shape))},
+            'uvmet10': {'wrf_python': lambda: getvar('uvmet10')[:, 0, :, :],
+                        'diag_funcs': calc_uvmet10},
+            'wspd10': {'wrf_python': lambda: getvar('wspd_wdir10')[0, 0, :, :],
+                       'diag_funcs': calc_wspd10},
+            't2c': {'wrf_python': lambda: getvar('T2')[0, :, :] - 273.15,
+                    'diag_funcs': lambda: diag_funcs.calc_t2c(cache['T2'][0], out=buffers.get('t2c', shape))},
+        }
+        diags = {}
+        for name, funcs in methods.items():
+            diags[name] = {}
+            vals = {}
+            for method, func in funcs.items():
+                times = []
+                for rr in range(repeat):
+                    t_beg = time.perf_counter()
+                    vals[method] = func()
+                    times.append(time.perf_counter() - t_beg)
+                diags[name][method] = summarize(times)
+            diags[name]['max_abs_diff'] = float(np.max(np.abs(vals['diag_funcs'] - vals['wrf_python'])))
+    return diags
+
+def bench_tiles(wrf_dir, repeat):
+    """
+    Function to check that the fields computed from 3D inputs in tiles of grid rows with a memory budget (plot_wrf
+    memory_budget_mb) are the same as when their inputs are read in full, and measure the time & peak memory of both.
+    -- Inputs:
+        - wrf_dir: pathlib object, directory with the synthetic WRF output files
+        - repeat: integer, number of times to compute each
+    -- Output:
+        - tiles: dictionary of each of wrf_funcs.tiled_fields to a dictionary with the keys max_abs_diff, and full &
+                 tiled (timings, see summarize, with the extra key peak_mb, the largest memory allocated while
+                 reading & computing it [MB], from tracemalloc)
+    """
+    valid_dt = cycle_dt + dt.timedelta(hours=valid_lead_h)
+    fname = wrf_dir.joinpath(synth_wrf.stream_writers['wrfout'][1] + 'd01_' + valid_dt.strftime(synth_wrf.wrf_fmt))
+    budgets = {'full': None, 'tiled': int(tile_budget_mb * 1e6)}
+    tiles = {}
+    with netCDF4.Dataset(fname) as ds:
+        for field in wrf_funcs.tiled_fields:
+            tiles[field] = {}
+            vals = {}
+            for method, budget in budgets.items():
+                times = []
+                for rr in range(repeat):
+                    t_beg = time.perf_counter()
+                    vals[method] = wrf_funcs.read_fields(ds, 'wrfout', [(field, None)],
+                                                         memory_budget=budget)[(field, None)]
+                    times.append(time.perf_counter() - t_beg)
+                tracemalloc.start()
+                wrf_funcs.read_fields(ds, 'wrfout', [(field, None)], memory_budget=budget)
+                _, peak_bytes = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                tiles[field][method] = dict(peak_mb=peak_bytes / 1e6, **summarize(times))
+            tiles[field]['max_abs_diff'] = float(np.max(np.abs(vals['tiled'] - vals['full'])))
+    return tiles
+
+def check_limits(case):
+    """
+    Function to check the results of a grid size that must stay within limits for the benchmark to pass.
+    -- Input:
+        - case: dictionary of the results of a grid size (see main)
+    -- Output:
+        - failures: list of strings, one per result beyond its limit
+    """
+    failures = []
+    for name, diff_frac in case['raster_diff_frac'].items():
+        diff_max = raster_diff_max.get(name, raster_diff_max_default)
+        if diff_frac > diff_max:
+            failures.append(case['size'] + ': ' + f'{diff_frac:.4f}' + ' of the pixels of the raster map of ' + name +
+                            ' differ from the contourf map (at most ' + f'{diff_max:g}' + ' allowed)')
+    # A difference of NaN (e.g., NaN in only one of the fields) is a failure as well
+    for name, refl in case['refl'].items():
+        if not refl['max_abs_diff'] <= refl_diff_max:
+            failures.append(case['size'] + ': the ' + name + ' reflectivity of refl_funcs differs from wrf-python by ' +
+                            f'{refl["max_abs_diff"]:.2e}' + ' dBZ (at most ' + f'{refl_diff_max:g}' + ' allowed)')
+    for map_proj, diags in case['diags'].items():
+        for name, diag in diags.items():
+            if not diag['max_abs_diff'] <= diag_diff_max[name]:
+                failures.append(case['size'] + ' ' + map_proj + ': ' + name + ' of diag_funcs differs from wrf-python '
+                                'by ' + f'{diag["max_abs_diff"]:.2e}' + ' (at most ' + f'{diag_diff_max[name]:g}' +
+                                ' allowed)')
+    return failures
+
+def summarize(times):
+    """
+    Function to summarize the repeated timings of a stage.
+    -- Input:
+        - times: list of times [s]
+    -- Output:
+        - summary: dictionary with the times, and their minimum, median, and maximum
+    """
+    return {'times': times, 'min': min(times), 'median': statistics.median(times), 'max': max(times)}
+
+def compare_results(results, ref_results):
+    """
+    Procedure to print the median time of each stage next to that of an earlier run, for the grid sizes in both.
+    -- Inputs:
+        - results: dictionary of benchmark results (see main)
+        - ref_results: dictionary of benchmark results of an earlier run
+    """
+    ref_cases = {(case['nx'], case['ny']): case for case in ref_results['cases']}
+    print('\nComparison to ' + ref_results['meta']['run_time'] + ' (' + ref_results['meta']['hostname'] + '):')
+    for key in ['cartopy', 'wrf-python', 'matplotlib', 'numpy']:
+        old = ref_results['meta']['versions'].get(key)
+        new = results['meta']['versions'].get(key)
+        if old != new:
+            print('   ' + key + ': ' + str(old) + ' -> ' + str(new))
+    for case in results['cases']:
+        ref_case = ref_cases.get((case['nx'], case['ny']))
+        if ref_case is None:
+            print('   ' + case['size'] + ': not in the earlier run')
+            continue
+        print('   ' + case['size'] + ':')
+        for stage, summary in case['stages'].items():
+            ref_summary = ref_case['stages'].get(stage)
+            if ref_summary is None:
+                continue
+            ratio = summary['median'] / max(ref_summary['median'], 1e-9)
+            flag = '   SLOWER' if ratio > 1.0 + slower_frac else ''
+            print(f'      {stage:12s} {ref_summary["median"]:9.4f} s -> {summary["median"]:9.4f} s  '
+                  f'({ratio:5.2f}x){flag}')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the stages of making plot_wrf maps on synthetic WRF output')
+    parser.add_argument('-g', '--grids', default='91x100',
+                        help='comma-separated grid sizes to benchmark, as NXxNY (default: 91x100, the size of the '
+                             'Hurricane Matthew domain; e.g., 91x100,500x500,1000x1000)')
+    parser.add_argument('--nz', default=synth_wrf.grid_defaults['nz'], type=int,
+                        help='number of vertical levels in the synthetic wrfout files (default: '
+                             + str(synth_wrf.grid_defaults['nz']) + ')')
+    parser.add_argument('-r', '--repeat', default=3, type=int,
+                        help='number of times to run each stage (default: 3)')
+    parser.add_argument('-p', '--plot_plan', default=None,
+                        help='YAML plot plan file, listing the products to contour (default: the plot_wrf.py plot plan)')
+    parser.add_argument('-o', '--out_json', default='bench_plot_wrf.json',
+                        help='JSON file to write the results to (default: bench_plot_wrf.json)')
+    parser.add_argument('-c', '--compare', default=None,
+                        help='JSON file of an earlier run, to compare the results to')
+    parser.add_argument('-w', '--work_dir', default=None,
+                        help='directory to write (or reuse) the synthetic WRF output in, kept after the run '
+                             '(default: a temporary directory, deleted after the run)')
+    parser.add_argument('--no_features', action='store_true',
+                        help='skip timing the Cartopy features')
+
+    args = parser.parse_args()
+    grids = []
+    for text in args.grids.split(','):
+        try:
+            nx, ny = [int(val) for val in text.lower().split('x')]
+        except ValueError:
+            print('ERROR! Incorrect format for argument grids. Expected NXxNY, got ' + text)
+            sys.exit(1)
+        grids.append((nx, ny))
+    if args.repeat < 1:
+        print('ERROR! repeat must be at least 1')
+        sys.exit(1)
+    plot_plan = plot_wrf.plot_plan_fname if args.plot_plan is None else args.plot_plan
+    try:
+        products = plan_funcs.read_plot_plan(plot_plan)
+    except (OSError, ValueError, plan_funcs.yaml.YAMLError) as e:
+        print('ERROR! Could not read plot plan ' + str(plot_plan) + ': ' + str(e))
+        sys.exit(1)
+
+    bench_config_opts = {'grids': grids, 'nz': args.nz, 'repeat': args.repeat, 'products': products,
+                         'out_json': args.out_json, 'compare': args.compare, 'work_dir': args.work_dir,
+                         'features': not args.no_features}
+    return bench_config_opts
+
+def main(bench_config_opts):
+    notes = []
+    features = bench_config_opts['features']
+    if features:
+        missing = get_missing_features()
+        if len(missing) > 0:
+            features = False
+            notes.append('features stage skipped, Natural Earth shapefiles not available offline: ' + ', '.join(missing))
+            print('WARNING: ' + notes[-1])
+    else:
+        notes.append('features stage skipped with --no_features')
+
+    results = {'meta': {'run_time': dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                        'hostname': platform.node(), 'platform': platform.platform(),
+                        'processor': platform.processor(), 'cpu_count': os.cpu_count(),
+                        'versions': get_versions(), 'repeat': bench_config_opts['repeat'],
+                        'products': [product['name'] for product in bench_config_opts['products']],
+                        'notes': notes},
+               'cases': []}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = pathlib.Path(tmp_dir if bench_config_opts['work_dir'] is None else bench_config_opts['work_dir'])
+        for nx, ny in bench_config_opts['grids']:
+            size = str(nx) + 'x' + str(ny)
+            wrf_dir = work_dir.joinpath(size + 'x' + str(bench_config_opts['nz']))
+            grid = synth_wrf.get_grid(nx, ny, nz=bench_config_opts['nz'])
+            if not wrf_dir.is_dir():
+                print('\nWriting synthetic WRF output on the ' + size + ' grid to ' + str(wrf_dir))
+                synth_wrf.write_cycle(wrf_dir, grid, cycle_dt, valid_lead_h, 60, beg_lead_h=valid_lead_h)
+            # The surface diagnostics are also checked on a Lambert conformal grid, whose winds have to be rotated
+            lambert_dir = work_dir.joinpath(size + 'x' + str(bench_config_opts['nz']) + '_lambert')
+            if not lambert_dir.is_dir():
+                print('\nWriting synthetic WRF output on the ' + size + ' Lambert conformal grid to ' + str(lambert_dir))
+                lambert_grid = synth_wrf.get_grid(nx, ny, nz=bench_config_opts['nz'], map_proj='lambert')
+                synth_wrf.write_cycle(lambert_dir, lambert_grid, cycle_dt, valid_lead_h, 60, beg_lead_h=valid_lead_h,
+                                      streams=('wrfout',))
+            print('\nBenchmarking the ' + size + ' grid')
+            timings, product_timings, raster_timings, raster_diffs, image_timings, image_bytes = bench_case(
+                wrf_dir, bench_config_opts['products'], bench_config_opts['repeat'], features)
+            file_bytes = {fname.name.split('_d01')[0]: fname.stat().st_size for fname in sorted(wrf_dir.iterdir())}
+            case = {'size': size, 'nx': nx, 'ny': ny, 'nz': bench_config_opts['nz'], 'dx': grid['dx'],
+                    'file_bytes': file_bytes,
+                    'stages': {stage: summarize(times) for stage, times in timings.items()},
+                    'contourf_products': {name: summarize(times) for name, times in product_timings.items()},
+                    'raster_products': {name: summarize(times) for name, times in raster_timings.items()},
+                    'raster_diff_tol': raster_diff_tol, 'raster_diff_frac': raster_diffs,
+                    'raster_diff_max': {name: raster_diff_max.get(name, raster_diff_max_default)
+                                        for name in raster_diffs},
+                    'images': {name: dict(bytes=image_bytes[name], **summarize(times))
+                               for name, times in image_timings.items()}}
+            case['refl'] = bench_refl(wrf_dir, bench_config_opts['repeat'])
+            case['refl_diff_max'] = refl_diff_max
+            case['diags'] = {'mercator': bench_diags(wrf_dir, bench_config_opts['repeat']),
+                             'lambert': bench_diags(lambert_dir, bench_config_opts['repeat'])}
+            case['diag_diff_max'] = diag_diff_max
+            case['tile_budget_mb'] = tile_budget_mb
+            case['tiles'] = bench_tiles(wrf_dir, bench_config_opts['repeat'])
+            case['failures'] = check_limits(case)
+            results['cases'].append(case)
+            for stage, summary in case['stages'].items():
+                print(f'   {stage:12s} median {summary["median"]:9.4f} s   min {summary["min"]:9.4f} s')
+            # Raster maps are not faster on all grids (e.g., not on small ones), so both times are printed
+            print(f'   raster median {case["stages"]["raster"]["median"]:.4f} s vs. contourf '
+                  f'{case["stages"]["contourf"]["median"]:.4f} s; fraction of pixels that differ:')
+            for name, diff_frac in raster_diffs.items():
+                print(f'      {name:12s} {diff_frac:8.4f}   (at most {case["raster_diff_max"][name]:g})')
+            print(f'   reflectivity of refl_funcs vs. wrf-python (max diff at most {refl_diff_max:g} dBZ):')
+            for name, refl in case['refl'].items():
+                print(f'      {name:10s} max diff {refl["max_abs_diff"]:.2e} dBZ   median '
+                      f'{refl["refl_funcs"]["median"]:8.4f} s vs. {refl["wrf_python"]["median"]:8.4f} s   peak '
+                      f'{refl["refl_funcs"]["peak_mb"]:7.1f} MB vs. {refl["wrf_python"]["peak_mb"]:7.1f} MB')
+            for map_proj, diags in case['diags'].items():
+                print('   surface diagnostics of diag_funcs vs. wrf-python (' + map_proj + '):')
+                for name, diag in diags.items():
+                    speedup = diag['wrf_python']['median'] / max(diag['diag_funcs']['median'], 1e-9)
+                    print(f'      {name:10s} max diff {diag["max_abs_diff"]:.2e} (at most {diag_diff_max[name]:g})   '
+                          f'median {diag["diag_funcs"]["median"]:8.4f} s vs. {diag["wrf_python"]["median"]:8.4f} s   '
+                          f'({speedup:.1f}x faster)')
+            print(f'   fields computed in tiles with a {tile_budget_mb:g}-MB memory budget vs. in full:')
+            for name, tile in case['tiles'].items():
+                print(f'      {name:10s} max diff {tile["max_abs_diff"]:.2e}   median {tile["tiled"]["median"]:8.4f} s vs. '
+                      f'{tile["full"]["median"]:8.4f} s   peak {tile["tiled"]["peak_mb"]:7.1f} MB vs. '
+                      f'{tile["full"]["peak_mb"]:7.1f} MB')
+            print('   image encoding of the complete map:')
+            for name, summary in case['images'].items():
+                print(f'      {name:14s} {summary["bytes"] / 1e3:8.1f} kB   median {summary["median"]:9.4f} s')
+
+    with open(bench_config_opts['out_json'], 'w') as f:
+        json.dump(results, f, indent=json_indent)
+    print('\nWrote ' + bench_config_opts['out_json'])
+
+    if bench_config_opts['compare'] is not None:
+        with open(bench_config_opts['compare'], 'r') as f:
+            compare_results(results, json.load(f))
+
+    failures = [failure for case in results['cases'] for failure in case['failures']]
+    if len(failures) > 0:
+        print('')
+        for failure in failures:
+            print('ERROR! ' + failure)
+    return results
+
+if __name__ == '__main__':
+    bench_config_opts = parse_args()
+    results = main(bench_config_opts)
+    # Fail (e.g., in a CI job) if any result is beyond its limit, after the results were written
+    if any(len(case['failures']) > 0 for case in results['cases']):
+        sys.exit(1)
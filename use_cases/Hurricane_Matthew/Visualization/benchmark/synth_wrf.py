@@ -0,0 +1,454 @@
+#! /usr/bin/env python3
+
+"""
+synth_wrf.py
+
+This file writes synthetic WRF output for benchmarking and testing plot_wrf without real model data: wrfout,
+wrfout_zlev, and wrfout_plev files on a Mercator (or Lambert conformal) grid of any size, with the variables,
+dimensions, and attributes that plot_wrf and wrf-python read. The fields are smooth and loosely hurricane-like (a moving vortex with spiral rain bands
+over a warm ocean, with some terrain to the northwest), so that contouring and drawing them costs about as much as
+real output on the same grid.
+
+It can also be run as a script to write a cycle of files under <wrf_dir_parent>/<YYYYMMDD_HH>/, optionally dripping
+them out one valid time at a time like a running WRF simulation (e.g., to try plot_wrf.py --follow).
+"""
+
+import sys
+import time
+import pathlib
+import argparse
+import datetime as dt
+import numpy as np
+import netCDF4
+
+# Earth radius [m] used by WRF
+earth_radius = 6370000.0
+
+# Grid settings of the Hurricane Matthew domain, which the synthetic grids default to
+matthew_nx, matthew_ny, matthew_dx = 91, 100, 27000.0
+grid_defaults = {'nz': 45, 'cen_lat': 28.0, 'cen_lon': -75.0, 'truelat1': 30.0}
+
+# True latitudes [deg] of the Lambert conformal grids (those of the WRF Preprocessing System's default namelist), and
+# the WRF MAP_PROJ & MAP_PROJ_CHAR attributes of each map projection
+lambert_truelats = (30.0, 60.0)
+map_projs = {'mercator': (3, 'Mercator'), 'lambert': (1, 'Lambert Conformal')}
+
+# Vertical levels of the wrfout_zlev [m AGL, negative in WRF] and wrfout_plev [Pa] files
+z_levels = [-80.0, -100.0, -200.0, -300.0, -400.0, -500.0]
+p_levels = [92500.0, 85000.0, 70000.0, 50000.0, 40000.0, 30000.0, 25000.0, 20000.0, 15000.0, 10000.0]
+
+# Vortex track: position at the start of the simulation [deg], and motion [deg/h]
+vortex_lat0, vortex_lon0 = 25.5, -75.5
+vortex_dlat, vortex_dlon = 0.15, -0.10
+
+G = 9.81
+Rd = 287.0
+Cp = 1004.5
+p_sfc = 101300.0
+p_top = 5000.0
+wrf_fmt = '%Y-%m-%d_%H:%M:%S'
+cycle_fmt = '%Y%m%d_%H'
+
+def get_grid(nx, ny, dx=None, nz=grid_defaults['nz'], cen_lat=grid_defaults['cen_lat'],
+             cen_lon=grid_defaults['cen_lon'], truelat1=grid_defaults['truelat1'], map_proj='mercator'):
+    """
+    Function to define a synthetic Mercator or Lambert conformal grid.
+    -- Inputs:
+        - nx, ny: integers, number of (unstaggered) grid points in the west-east and south-north directions
+        - dx: grid spacing [m] (default: keep the extent of the Matthew domain, i.e., 27 km for 91 x 100 points)
+        - nz: integer, number of (unstaggered) vertical levels
+        - cen_lat, cen_lon: latitude & longitude of the domain center [deg]
+        - truelat1: true latitude of the Mercator projection [deg]
+        - map_proj: string, map projection of the grid (a key of map_projs); the Lambert conformal grid has the true
+                    latitudes lambert_truelats and its standard longitude at cen_lon, so its grid-relative winds have
+                    to be rotated to earth-relative winds (default: 'mercator')
+    -- Output:
+        - grid: dictionary with the inputs, truelat2 [deg], the cone factor of the projection (0 for Mercator), and the
+                2D arrays lats & lons [deg]
+    """
+    if dx is None:
+        dx = matthew_dx * (matthew_nx - 1) / (nx - 1)
+    xs = (np.arange(nx) - (nx - 1) / 2.0) * dx
+    ys = (np.arange(ny) - (ny - 1) / 2.0) * dx
+    x2d, y2d = np.meshgrid(xs, ys)
+    if map_proj == 'lambert':
+        # Spherical Lambert conformal projection, with the domain center at the origin (Snyder, 1987, eqs. 15-1 to 15-5)
+        truelat1, truelat2 = lambert_truelats
+        phi1, phi2, phi0 = np.radians([truelat1, truelat2, cen_lat])
+        cone = (np.log(np.cos(phi1) / np.cos(phi2)) /
+                np.log(np.tan(np.pi / 4.0 + phi2 / 2.0) / np.tan(np.pi / 4.0 + phi1 / 2.0)))
+        scale = earth_radius * np.cos(phi1) * np.tan(np.pi / 4.0 + phi1 / 2.0) ** cone / cone
+        rho0 = scale / np.tan(np.pi / 4.0 + phi0 / 2.0) ** cone
+        rho = np.hypot(x2d, rho0 - y2d)
+        lons = cen_lon + np.degrees(np.arctan2(x2d, rho0 - y2d) / cone)
+        lats = np.degrees(2.0 * np.arctan((scale / rho) ** (1.0 / cone)) - np.pi / 2.0)
+    else:
+        truelat2 = truelat1
+        cone = 0.0
+        scale = earth_radius * np.cos(np.radians(truelat1))
+        y_cen = scale * np.log(np.tan(np.pi / 4.0 + np.radians(cen_lat) / 2.0))
+        lons = cen_lon + np.degrees(x2d / scale)
+        lats = np.degrees(2.0 * np.arctan(np.exp((y2d + y_cen) / scale)) - np.pi / 2.0)
+    return {'nx': nx, 'ny': ny, 'nz': nz, 'dx': dx, 'cen_lat': cen_lat, 'cen_lon': cen_lon, 'truelat1': truelat1,
+            'truelat2': truelat2, 'map_proj': map_proj, 'cone': cone, 'lats': lats, 'lons': lons}
+
+def get_waves(grid, seed, n_waves=6):
+    """
+    Function to get a smooth random pattern (a sum of plane waves with wavelengths of 3-15 degrees), scaled to [-1, 1].
+    -- Inputs:
+        - grid: dictionary (see get_grid)
+        - seed: integer, random seed
+        - n_waves: integer, number of plane waves
+    -- Output:
+        - waves: 2D array
+    """
+    rng = np.random.default_rng(seed)
+    waves = np.zeros(grid['lats'].shape)
+    for _ in range(n_waves):
+        wavelength = rng.uniform(3.0, 15.0)
+        angle = rng.uniform(0.0, 2.0 * np.pi)
+        phase = rng.uniform(0.0, 2.0 * np.pi)
+        dist = grid['lons'] * np.cos(angle) + grid['lats'] * np.sin(angle)
+        waves = waves + np.sin(2.0 * np.pi * dist / wavelength + phase)
+    return waves / n_waves
+
+def get_vortex(grid, lead_h):
+    """
+    Function to get the distance and azimuth of each grid point from the synthetic vortex center.
+    -- Inputs:
+        - grid: dictionary (see get_grid)
+        - lead_h: float, hours since the start of the simulation
+    -- Outputs:
+        - dist: 2D array of distances from the vortex center [km]
+        - azim: 2D array of azimuths (counterclockwise from east) from the vortex center [rad]
+    """
+    lat_c = vortex_lat0 + vortex_dlat * lead_h
+    lon_c = vortex_lon0 + vortex_dlon * lead_h
+    dy = np.radians(grid['lats'] - lat_c) * earth_radius / 1000.0
+    dx = np.radians(grid['lons'] - lon_c) * earth_radius / 1000.0 * np.cos(np.radians(lat_c))
+    return np.hypot(dx, dy), np.arctan2(dy, dx)
+
+def get_vortex_wind(dist, azim, vmax=45.0, rmw=40.0):
+    """
+    Function to get the wind components of a Rankine-like cyclonic vortex.
+    -- Inputs:
+        - dist, azim: 2D arrays of distance [km] and azimuth [rad] from the vortex center (see get_vortex)
+        - vmax: maximum wind speed [m/s]
+        - rmw: radius of maximum winds [km]
+    -- Outputs:
+        - u, v: 2D arrays of wind components [m/s]
+    """
+    spd = np.where(dist < rmw, vmax * dist / rmw, vmax * np.sqrt(rmw / np.maximum(dist, rmw)))
+    return -spd * np.sin(azim), spd * np.cos(azim)
+
+def get_rain_bands(dist, azim):
+    """
+    Function to get a pattern of spiral rain bands around the vortex center, between 0 and 1.
+    -- Inputs:
+        - dist, azim: 2D arrays of distance [km] and azimuth [rad] from the vortex center (see get_vortex)
+    -- Output:
+        - bands: 2D array
+    """
+    bands = np.clip(np.cos(2.0 * azim + dist / 60.0), 0.0, None) ** 2 * np.exp(-dist / 400.0)
+    eyewall = np.exp(-((dist - 45.0) / 20.0) ** 2)
+    return np.maximum(bands, eyewall)
+
+def create_file(fname, grid, valid_dt, start_dt):
+    """
+    Function to create a WRF output file with the dimensions, global attributes, and time & lat/lon variables that
+    all of wrfout, wrfout_zlev, and wrfout_plev share.
+    -- Inputs:
+        - fname: string or pathlib object, output file name
+        - grid: dictionary (see get_grid)
+        - valid_dt: datetime object, valid time of the file
+        - start_dt: datetime object, start time of the simulation
+    -- Output:
+        - ds: netCDF4 Dataset, open for writing
+    """
+    nx, ny, nz = grid['nx'], grid['ny'], grid['nz']
+    ds = netCDF4.Dataset(fname, 'w', format='NETCDF4')
+    ds.createDimension('Time', None)
+    ds.createDimension('DateStrLen', 19)
+    ds.createDimension('west_east', nx)
+    ds.createDimension('south_north', ny)
+    ds.createDimension('bottom_top', nz)
+    ds.createDimension('west_east_stag', nx + 1)
+    ds.createDimension('south_north_stag', ny + 1)
+    ds.createDimension('bottom_top_stag', nz + 1)
+
+    ds.setncatts({
+        'TITLE': ' OUTPUT FROM SYNTHETIC WRF (synth_wrf.py)',
+        'START_DATE': start_dt.strftime(wrf_fmt), 'SIMULATION_START_DATE': start_dt.strftime(wrf_fmt),
+        'WEST_EAST_GRID_DIMENSION': np.int32(nx + 1), 'SOUTH_NORTH_GRID_DIMENSION': np.int32(ny + 1),
+        'BOTTOM-TOP_GRID_DIMENSION': np.int32(nz + 1), 'DX': np.float32(grid['dx']), 'DY': np.float32(grid['dx']),
+        'GRIDTYPE': 'C', 'DT': np.float32(6.0 * grid['dx'] / 1000.0), 'GRID_ID': np.int32(1),
+        'PARENT_ID': np.int32(0), 'MAP_PROJ': np.int32(map_projs[grid['map_proj']][0]),
+        'MAP_PROJ_CHAR': map_projs[grid['map_proj']][1],
+        'CEN_LAT': np.float32(grid['cen_lat']), 'CEN_LON': np.float32(grid['cen_lon']),
+        'TRUELAT1': np.float32(grid['truelat1']), 'TRUELAT2': np.float32(grid['truelat2']),
+        'MOAD_CEN_LAT': np.float32(grid['cen_lat']), 'STAND_LON': np.float32(grid['cen_lon']),
+        'POLE_LAT': np.float32(90.0), 'POLE_LON': np.float32(0.0),
+    })
+
+    times = ds.createVariable('Times', 'S1', ('Time', 'DateStrLen'))
+    times[0, :] = netCDF4.stringtochar(np.array([valid_dt.strftime(wrf_fmt)], 'S19'))
+    xtime = ds.createVariable('XTIME', 'f4', ('Time',))
+    xtime.units = 'minutes since ' + start_dt.strftime('%Y-%m-%d %H:%M:%S')
+    xtime.description = xtime.units
+    xtime.calendar = 'standard'
+    xtime[0] = (valid_dt - start_dt).total_seconds() / 60.0
+    add_var(ds, 'XLAT', ('south_north', 'west_east'), grid['lats'], 'degree_north', 'LATITUDE, SOUTH IS NEGATIVE')
+    add_var(ds, 'XLONG', ('south_north', 'west_east'), grid['lons'], 'degree_east', 'LONGITUDE, WEST IS NEGATIVE')
+    return ds
+
+def add_var(ds, name, dims, data, units, description, stagger=''):
+    """
+    Procedure to add a WRF-style float variable (with a leading Time dimension) to a file.
+    -- Inputs:
+        - ds: netCDF4 Dataset, open for writing
+        - name: string, variable name
+        - dims: tuple of the non-Time dimension names
+        - data: array with the values of the variable, or a function returning the 2D array of each vertical level
+                (so that large 3D variables are written one level at a time)
+        - units, description: strings, variable attributes
+        - stagger: string, WRF stagger attribute ('Z' for variables on the vertical staggered grid)
+    """
+    var = ds.createVariable(name, 'f4', ('Time',) + dims)
+    var.FieldType = np.int32(104)
+    var.MemoryOrder = 'XY ' if len(dims) == 2 else 'XYZ'
+    var.description = description
+    var.units = units
+    var.stagger = stagger
+    var.coordinates = 'XLONG XLAT XTIME'
+    if callable(data):
+        for kk in range(ds.dimensions[dims[0]].size):
+            var[0, kk] = data(kk)
+    else:
+        var[0] = data
+
+def get_eta_pressure(nz):
+    """
+    Function to get the base-state pressure on the full (staggered) and half (unstaggered) vertical levels.
+    -- Input:
+        - nz: integer, number of unstaggered vertical levels
+    -- Outputs:
+        - p_full: 1D array of pressure on the nz+1 staggered levels [Pa]
+        - p_half: 1D array of pressure on the nz unstaggered levels [Pa]
+    """
+    p_full = p_top + (p_sfc - p_top) * np.linspace(1.0, 0.0, nz + 1)
+    return p_full, 0.5 * (p_full[:-1] + p_full[1:])
+
+def write_wrfout(fname, grid, valid_dt, start_dt, seed=0):
+    """
+    Procedure to write a synthetic wrfout file.
+    -- Inputs:
+        - fname: string or pathlib object, output file name
+        - grid: dictionary (see get_grid)
+        - valid_dt, start_dt: datetime objects, valid time of the file and start time of the simulation
+        - seed: integer, random seed of the smooth perturbations
+    """
+    lead_h = (valid_dt - start_dt).total_seconds() / 3600.0
+    lats, lons = grid['lats'], grid['lons']
+    dist, azim = get_vortex(grid, lead_h)
+    bands = get_rain_bands(dist, azim)
+    waves = get_waves(grid, seed)
+    terrain = get_waves(grid, 999)
+    p_full, p_half = get_eta_pressure(grid['nz'])
+    hz = ('south_north', 'west_east')
+
+    # Land with hills to the northwest of the domain; lowered sea-level pressure and a warm core near the vortex
+    land = np.clip((lats - 0.6 * lons - 72.5) / 1.5, 0.0, 1.0)
+    hgt = land * (150.0 + 900.0 * np.clip(terrain + 0.3, 0.0, None) * np.clip((lats - 28.0) / 8.0, 0.0, 1.0))
+    p_anom = -5000.0 * (1.0 - np.exp(-(40.0 / np.maximum(dist, 1.0)) ** 1.5)) + 300.0 * waves
+    u_vort, v_vort = get_vortex_wind(dist, azim)
+    damp = 1.0 - 0.4 * land
+
+    ds = create_file(fname, grid, valid_dt, start_dt)
+    add_var(ds, 'HGT', hz, hgt, 'm', 'Terrain Height')
+    add_var(ds, 'LANDMASK', hz, (land > 0.5).astype(np.float32), '', 'LAND MASK (1 FOR LAND, 0 FOR WATER)')
+    # The grid of a Lambert conformal projection is rotated from north by the cone factor times the longitude difference
+    alpha = grid['cone'] * np.radians(lons - grid['cen_lon'])
+    add_var(ds, 'SINALPHA', hz, np.sin(alpha), '', 'Local sine of map rotation')
+    add_var(ds, 'COSALPHA', hz, np.cos(alpha), '', 'Local cosine of map rotation')
+    add_var(ds, 'T2', hz, 301.0 - 0.6 * (lats - 25.0) - 0.0065 * hgt + 1.5 * waves + 2.0 * np.exp(-dist / 100.0),
+            'K', 'TEMP at 2 M')
+    add_var(ds, 'Q2', hz, (0.019 - 0.0006 * (lats - 25.0)) * (0.85 + 0.1 * waves + 0.05 * bands), 'kg kg-1',
+            'QV at 2 M')
+    add_var(ds, 'PSFC', hz, (p_sfc + p_anom) * np.exp(-hgt / 8000.0), 'Pa', 'SFC PRESSURE')
+    add_var(ds, 'U10', hz, damp * (u_vort - 5.0 + 2.0 * waves), 'm s-1', 'U at 10 M')
+    add_var(ds, 'V10', hz, damp * (v_vort + 1.0 - 2.0 * waves), 'm s-1', 'V at 10 M')
+    add_var(ds, 'RAINNC', hz, lead_h * 8.0 * bands, 'mm', 'ACCUMULATED TOTAL GRID SCALE PRECIPITATION')
+    add_var(ds, 'RAINC', hz, lead_h * 1.5 * np.clip(waves, 0.0, None) * np.exp(-dist / 800.0), 'mm',
+            'ACCUMULATED TOTAL CUMULUS PRECIPITATION')
+
+    # 3D fields are written one level at a time, so that large grids fit in memory
+    # Base-state heights of the staggered levels follow the hypsometric equation for the mean potential temperature
+    sigma = p_half / p_sfc
+    t_half = (300.0 + 40.0 * (1.0 - sigma)) * (p_half / 100000.0) ** (Rd / Cp)
+    z_full = np.concatenate([[0.0], np.cumsum(Rd * t_half / G * np.log(p_full[:-1] / p_full[1:]))])
+    add_var(ds, 'PHB', ('bottom_top_stag',) + hz, lambda kk: np.full(lats.shape, G * z_full[kk]), 'm2 s-2',
+            'base-state geopotential', 'Z')
+    add_var(ds, 'PH', ('bottom_top_stag',) + hz, lambda kk: G * (hgt * (1.0 - kk / grid['nz']) + 5.0 * waves),
+            'm2 s-2', 'perturbation geopotential', 'Z')
+    add_var(ds, 'PB', ('bottom_top',) + hz, lambda kk: np.full(lats.shape, p_half[kk]), 'Pa',
+            'BASE STATE PRESSURE')
+    add_var(ds, 'P', ('bottom_top',) + hz, lambda kk: (p_anom - 1.2 * hgt * 10.0) * sigma[kk], 'Pa',
+            'perturbation pressure')
+    add_var(ds, 'T', ('bottom_top',) + hz,
+            lambda kk: 40.0 * (1.0 - sigma[kk]) + 0.5 * waves + 6.0 * np.exp(-dist / 150.0) * np.sin(np.pi * sigma[kk]),
+            'K', 'perturbation potential temperature theta-t0')
+    add_var(ds, 'QVAPOR', ('bottom_top',) + hz, lambda kk: 0.019 * sigma[kk] ** 3 * (0.8 + 0.1 * waves + 0.1 * bands),
+            'kg kg-1', 'Water vapor mixing ratio')
+    add_var(ds, 'QRAIN', ('bottom_top',) + hz, lambda kk: 2.5e-3 * bands * np.clip(sigma[kk] - 0.5, 0.0, None),
+            'kg kg-1', 'Rain water mixing ratio')
+    add_var(ds, 'QSNOW', ('bottom_top',) + hz, lambda kk: 5.0e-4 * bands * np.clip(0.7 - sigma[kk], 0.0, None),
+            'kg kg-1', 'Snow mixing ratio')
+    add_var(ds, 'QGRAUP', ('bottom_top',) + hz, lambda kk: 3.0e-4 * bands * np.sin(np.pi * sigma[kk]) ** 4,
+            'kg kg-1', 'Graupel mixing ratio')
+    ds.close()
+
+def write_zlev(fname, grid, valid_dt, start_dt, seed=0):
+    """
+    Procedure to write a synthetic wrfout_zlev file (winds on constant height AGL levels).
+    -- Inputs: same as write_wrfout
+    """
+    lead_h = (valid_dt - start_dt).total_seconds() / 3600.0
+    dist, azim = get_vortex(grid, lead_h)
+    waves = get_waves(grid, seed)
+    u_vort, v_vort = get_vortex_wind(dist, azim)
+    zd = ('num_z_levels_stag', 'south_north', 'west_east')
+    factors = [1.0 + 0.12 * np.log(-z_lev / 10.0) for z_lev in z_levels]
+
+    ds = create_file(fname, grid, valid_dt, start_dt)
+    ds.createDimension('num_z_levels_stag', len(z_levels))
+    z_zl = ds.createVariable('Z_ZL', 'f4', ('Time', 'num_z_levels_stag'))
+    z_zl.units = 'm'
+    z_zl.description = 'Heights AGL (negative) or MSL (positive) of the z levels'
+    z_zl[0] = z_levels
+    u_zl = lambda kk: factors[kk] * (u_vort - 5.0 + 2.0 * waves)
+    v_zl = lambda kk: factors[kk] * (v_vort + 1.0 - 2.0 * waves)
+    add_var(ds, 'U_ZL', zd, u_zl, 'm s-1', 'U on z levels')
+    add_var(ds, 'V_ZL', zd, v_zl, 'm s-1', 'V on z levels')
+    add_var(ds, 'S_ZL', zd, lambda kk: np.hypot(u_zl(kk), v_zl(kk)), 'm s-1', 'wind speed on z levels')
+    ds.close()
+
+def write_plev(fname, grid, valid_dt, start_dt, seed=0):
+    """
+    Procedure to write a synthetic wrfout_plev file (fields on isobaric levels).
+    -- Inputs: same as write_wrfout
+    """
+    lead_h = (valid_dt - start_dt).total_seconds() / 3600.0
+    lats = grid['lats']
+    dist, azim = get_vortex(grid, lead_h)
+    waves = get_waves(grid, seed)
+    u_vort, v_vort = get_vortex_wind(dist, azim)
+    sigma = np.array(p_levels) / 100000.0
+    pd_ = ('num_press_levels_stag', 'south_north', 'west_east')
+
+    ds = create_file(fname, grid, valid_dt, start_dt)
+    ds.createDimension('num_press_levels_stag', len(p_levels))
+    p_pl = ds.createVariable('P_PL', 'f4', ('Time', 'num_press_levels_stag'))
+    p_pl.units = 'Pa'
+    p_pl.description = 'Pressure levels'
+    p_pl[0] = p_levels
+    add_var(ds, 'GHT_PL', pd_, lambda kk: (-7400.0 * np.log(p_levels[kk] / 101325.0) + 8.0 * (25.0 - lats)
+                                           + 30.0 * waves - 120.0 * sigma[kk] ** 2 * np.exp(-dist / 200.0)),
+            'm', 'Geopotential height on pressure levels')
+    add_var(ds, 'T_PL', pd_, lambda kk: (288.0 * sigma[kk] ** 0.19 - 0.5 * (lats - 25.0) + waves
+                                         + 5.0 * np.sin(np.pi * sigma[kk]) * np.exp(-dist / 150.0)),
+            'K', 'Temperature on pressure levels')
+    add_var(ds, 'U_PL', pd_, lambda kk: sigma[kk] * u_vort + 25.0 * (1.0 - sigma[kk]) * np.clip(lats - 25.0, 0.0, 10.0)
+            / 10.0 + 3.0 * waves, 'm s-1', 'U on pressure levels')
+    add_var(ds, 'V_PL', pd_, lambda kk: sigma[kk] * v_vort - 3.0 * waves, 'm s-1', 'V on pressure levels')
+    ds.close()
+
+# Writer and file name prefix of each stream
+stream_writers = {'wrfout': (write_wrfout, 'wrfout_'), 'zlev': (write_zlev, 'wrfout_zlev_'),
+                  'plev': (write_plev, 'wrfout_plev_')}
+
+def write_cycle(wrf_dir, grid, cycle_dt, end_lead_h, stride_min, beg_lead_h=0.0, domain='1',
+                streams=('wrfout', 'zlev', 'plev'), drip_s=0.0):
+    """
+    Function to write the synthetic WRF output files of one simulation (cycle).
+    -- Inputs:
+        - wrf_dir: string or pathlib object, directory to write the files in (created if needed)
+        - grid: dictionary (see get_grid)
+        - cycle_dt: datetime object, start time of the simulation
+        - end_lead_h: float, last lead time to write [h]
+        - stride_min: integer, minutes between output times
+        - beg_lead_h: float, first lead time to write [h]
+        - domain: string, WRF domain number
+        - streams: list of the streams to write ('wrfout', 'zlev', 'plev')
+        - drip_s: seconds to wait between output times, to mimic a running WRF simulation
+    -- Output:
+        - fnames: list of pathlib objects, files written
+    """
+    wrf_dir = pathlib.Path(wrf_dir)
+    wrf_dir.mkdir(parents=True, exist_ok=True)
+    n_times = int((end_lead_h - beg_lead_h) * 60 // stride_min) + 1
+    fnames = []
+    for tt in range(n_times):
+        if tt > 0 and drip_s > 0:
+            time.sleep(drip_s)
+        valid_dt = cycle_dt + dt.timedelta(hours=beg_lead_h, minutes=tt * stride_min)
+        for stream in streams:
+            writer, prefix = stream_writers[stream]
+            fname = wrf_dir.joinpath(prefix + 'd' + domain.zfill(2) + '_' + valid_dt.strftime(wrf_fmt))
+            writer(fname, grid, valid_dt, cycle_dt, seed=int(valid_dt.timestamp()) % 10000)
+            fnames.append(fname)
+            print('Wrote ' + str(fname))
+    return fnames
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Write synthetic WRF output files to benchmark or test plot_wrf.py')
+    parser.add_argument('-w', '--wrf_dir_parent', default='synthetic_wrf',
+                        help='string specifying the parent directory of the cycle subdirectories to write '
+                             '(default: synthetic_wrf)')
+    parser.add_argument('-f', '--cycle_dt', default='20161006_00',
+                        help='beginning date/time of the WRF simulation [YYYYMMDD_HH] (default: 20161006_00)')
+    parser.add_argument('-e', '--end_lead_time', default='06:00',
+                        help='last lead time to write [HH:MM] (default: 06:00)')
+    parser.add_argument('-s', '--str_lead_time', default=180, type=int,
+                        help='minutes between output times (default: 180)')
+    parser.add_argument('-d', '--domain', default='1', help='WRF domain number (default: 1)')
+    parser.add_argument('--nx', default=matthew_nx, type=int,
+                        help='number of grid points in the west-east direction (default: ' + str(matthew_nx) + ')')
+    parser.add_argument('--ny', default=matthew_ny, type=int,
+                        help='number of grid points in the south-north direction (default: ' + str(matthew_ny) + ')')
+    parser.add_argument('--nz', default=grid_defaults['nz'], type=int,
+                        help='number of vertical levels in the wrfout files (default: ' + str(grid_defaults['nz']) + ')')
+    parser.add_argument('--dx', default=None, type=float,
+                        help='grid spacing [m] (default: keep the extent of the Matthew domain)')
+    parser.add_argument('--map_proj', default='mercator', choices=list(map_projs.keys()),
+                        help='map projection of the grid (default: mercator)')
+    parser.add_argument('--drip_s', default=0.0, type=float,
+                        help='seconds to wait between output times, to mimic a running WRF simulation (default: 0)')
+
+    args = parser.parse_args()
+    try:
+        cycle_dt = dt.datetime.strptime(args.cycle_dt, cycle_fmt)
+    except ValueError:
+        print('ERROR! Incorrect format for argument cycle_dt. Expected YYYYMMDD_HH, got ' + args.cycle_dt)
+        sys.exit(1)
+    hh, mm = args.end_lead_time.split(':')
+    end_lead_h = int(hh) + int(mm) / 60.0
+    if args.nx < 2 or args.ny < 2 or args.nz < 2:
+        print('ERROR! nx, ny, and nz must be at least 2')
+        sys.exit(1)
+
+    synth_config_opts = {'wrf_dir': pathlib.Path(args.wrf_dir_parent, args.cycle_dt), 'cycle_dt': cycle_dt,
+                         'end_lead_h': end_lead_h, 'stride_min': args.str_lead_time, 'domain': args.domain,
+                         'nx': args.nx, 'ny': args.ny, 'nz': args.nz, 'dx': args.dx, 'map_proj': args.map_proj,
+                         'drip_s': args.drip_s}
+    return synth_config_opts
+
+def main(synth_config_opts):
+    grid = get_grid(synth_config_opts['nx'], synth_config_opts['ny'], dx=synth_config_opts['dx'],
+                    nz=synth_config_opts['nz'], map_proj=synth_config_opts['map_proj'])
+    write_cycle(synth_config_opts['wrf_dir'], grid, synth_config_opts['cycle_dt'], synth_config_opts['end_lead_h'],
+                synth_config_opts['stride_min'], domain=synth_config_opts['domain'],
+                drip_s=synth_config_opts['drip_s'])
+
+if __name__ == '__main__':
+    synth_config_opts = parse_args()
+    main(synth_config_opts)
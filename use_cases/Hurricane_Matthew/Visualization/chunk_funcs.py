@@ -0,0 +1,82 @@
+"""
+chunk_funcs.py
+
+This file contains functions to process WRF fields in tiles of grid rows (south_north), so that the 3D inputs of a
+2D field (e.g., the sea-level pressure or the composite reflectivity) never need to be read in full, and the memory
+used to compute it is bounded by a budget whatever the size of the domain (see wrf_funcs.read_tiled_field). The
+min/max of the field over a box (e.g., for the plot titles) are computed tile by tile as it is computed (MinMax).
+"""
+
+import numpy as np
+
+def get_tile_rows(n_rows, row_bytes, budget_bytes):
+    """
+    Function to get the number of grid rows of each tile that fit in a memory budget.
+    -- Inputs:
+        - n_rows: integer, number of grid rows (south_north) of the field
+        - row_bytes: integer, memory used to compute one row of the field [bytes]
+        - budget_bytes: integer, memory budget [bytes], or None for a single tile of all rows
+    -- Output:
+        - tile_rows: integer, from 1 (even if one row does not fit in the budget) to n_rows
+    """
+    if budget_bytes is None or row_bytes <= 0:
+        return n_rows
+    return int(max(1, min(n_rows, budget_bytes // row_bytes)))
+
+def iter_row_tiles(n_rows, tile_rows):
+    """
+    Function to iterate over the tiles of grid rows of a field.
+    -- Inputs:
+        - n_rows: integer, number of grid rows (south_north) of the field
+        - tile_rows: integer, number of rows of each tile (the last tile may have fewer)
+    -- Output:
+        - generator of slices of rows, one per tile
+    """
+    for row_beg in range(0, n_rows, tile_rows):
+        yield slice(row_beg, min(n_rows, row_beg + tile_rows))
+
+class MinMax:
+    """
+    Class to compute the minimum & maximum of a 2D field over a box, one tile of rows at a time, ignoring NaN values.
+    -- Usage:
+        - minmax = MinMax(box, shape)
+        - minmax.update(tile_vals, rows) for each tile
+        - min_val, max_val = minmax.get() (NaN if the box only had NaN values)
+    """
+
+    def __init__(self, box, shape):
+        """
+        -- Inputs:
+            - box: tuple of (j,i) slices of the field to compute the min/max over
+            - shape: tuple of integers, shape of the whole field
+        """
+        self.rows = range(*box[0].indices(shape[0]))
+        self.cols = box[1]
+        self.min_val = np.nan
+        self.max_val = np.nan
+
+    def update(self, tile_vals, rows):
+        """
+        Procedure to add a tile of rows of the field.
+        -- Inputs:
+            - tile_vals: 2D array, values of the tile
+            - rows: slice of the rows of the tile in the whole field (see iter_row_tiles)
+        """
+        row_beg = max(rows.start, self.rows.start)
+        row_end = min(rows.stop, self.rows.stop)
+        if row_beg >= row_end:
+            return
+        vals = tile_vals[row_beg - rows.start:row_end - rows.start, self.cols]
+        if vals.size == 0:
+            return
+        # fmin & fmax ignore NaN values unless all are NaN, without copying the tile as nanmin/nanmax would
+        self.min_val = np.fmin(self.min_val, np.fmin.reduce(vals, axis=None))
+        self.max_val = np.fmax(self.max_val, np.fmax.reduce(vals, axis=None))
+
+    def get(self):
+        """
+        Function to get the min/max of the tiles added so far.
+        -- Outputs:
+            - min_val, max_val: floats
+        """
+        return float(self.min_val), float(self.max_val)
@@ -0,0 +1,241 @@
+"""
+diag_funcs.py
+
+This file contains functions to compute the surface diagnostics plotted from wrfout files (sea-level pressure, 2-m
+relative humidity, earth-relative 10-m winds & wind speed, and 2-m temperature in °C) with NumPy, directly on the raw
+variables read from the file. They use the same formulas as wrf-python (wrf.getvar), but do not build xarray objects,
+and sea-level pressure only computes temperature & height on the few model levels it uses instead of on all of them.
+Each result is written into an output array that is reused from one file to the next (see DiagBuffers).
+"""
+
+import numpy as np
+
+# Constants, as in wrf-python (wrf.constants.Constants)
+G = 9.81
+Rd = 287.0
+Cp = 7.0 * Rd / 2.0
+t_base = 300.0
+p_base = 100000.0
+t_celsius = 273.15
+eps = 0.622
+ezero = 6.112
+eslcon1 = 17.67
+eslcon2 = 29.65
+
+# Sea-level pressure: pressure depth above the surface of the level the temperature is extrapolated from [Pa],
+# standard lapse rate [K m-1], and the threshold temperature of the MM5 sea-level temperature adjustment [K]
+slp_p_depth = 10000.0
+lapse_rate = 0.0065
+slp_t_crit = 273.16 + 17.5
+
+class DiagBuffers:
+    """
+    Class to keep the output arrays of the diagnostics, so that computing them for the next file writes into the same
+    arrays instead of allocating new ones. An array got from the buffers is overwritten by the next diagnostic written
+    into the same buffer, so it must not be kept beyond the fields of the current file (copy it to keep it).
+    -- Usage:
+        - buffers = DiagBuffers()
+        - slp = diag_funcs.calc_slp(..., out=buffers.get('slp', shape))
+    """
+
+    def __init__(self):
+        self.arrays = {}
+        self.n_allocated = 0
+        self.n_reused = 0
+
+    def get(self, name, shape, dtype=np.float32):
+        """
+        Function to get the output array of a diagnostic, allocating it the first time (or if its shape changed).
+        -- Inputs:
+            - name: string, name of the buffer
+            - shape: tuple of integers
+            - dtype: NumPy dtype (default: float32)
+        -- Output:
+            - out: array of the shape & dtype (its values are those of the last diagnostic written into it)
+        """
+        out = self.arrays.get(name)
+        if out is None or out.shape != tuple(shape) or out.dtype != dtype:
+            out = np.empty(shape, dtype)
+            self.arrays[name] = out
+            self.n_allocated += 1
+        else:
+            self.n_reused += 1
+        return out
+
+    def get_stats(self):
+        """
+        Function to get counts of the output arrays handed out.
+        -- Output:
+            - stats: dictionary with the keys n_allocated, n_reused, and n_bytes (memory held by the buffers)
+        """
+        return {'n_allocated': self.n_allocated, 'n_reused': self.n_reused,
+                'n_bytes': sum(out.nbytes for out in self.arrays.values())}
+
+def get_out(out, shape):
+    """
+    Function to get the output array of a diagnostic.
+    -- Inputs:
+        - out: float32 array to write the result into, or None
+        - shape: tuple of integers, shape of the result
+    -- Output:
+        - out: out, or a new float32 array
+    """
+    if out is None:
+        return np.empty(shape, np.float32)
+    return out
+
+def get_cone(map_attrs):
+    """
+    Function to get the cone factor used to rotate grid-relative winds to earth-relative winds, as in wrf-python.
+    -- Input:
+        - map_attrs: dictionary of the MAP_PROJ, TRUELAT1, TRUELAT2 global attributes of a wrfout file
+    -- Output:
+        - cone: float, or None if the winds of the projection (e.g., Mercator) need no rotation
+    """
+    if map_attrs['MAP_PROJ'] == 2:
+        return 1.0
+    if map_attrs['MAP_PROJ'] != 1:
+        return None
+    true_lat1 = map_attrs['TRUELAT1']
+    true_lat2 = map_attrs['TRUELAT2']
+    if abs(true_lat1 - true_lat2) > 0.1 and abs(true_lat2 - 90.0) > 0.1:
+        return ((np.log(np.cos(np.radians(true_lat1))) - np.log(np.cos(np.radians(true_lat2)))) /
+                (np.log(np.tan(np.radians(45.0 - abs(true_lat1 / 2.0)))) -
+                 np.log(np.tan(np.radians(45.0 - abs(true_lat2 / 2.0))))))
+    return np.sin(np.radians(abs(true_lat1)))
+
+def calc_uvmet10(u10, v10, lats, lons, map_attrs, out_u=None, out_v=None):
+    """
+    Function to rotate the grid-relative 10-m winds to earth-relative winds (wrf-python's uvmet10).
+    -- Inputs:
+        - u10, v10: 2D arrays of grid-relative 10-m winds [m s-1] (U10, V10)
+        - lats, lons: 2D arrays of latitude & longitude [deg] (XLAT, XLONG)
+        - map_attrs: dictionary of the MAP_PROJ, TRUELAT1, TRUELAT2, STAND_LON global attributes of the file
+        - out_u, out_v: float32 arrays to write the results into (default: None, new arrays)
+    -- Outputs:
+        - u, v: 2D float32 arrays of earth-relative 10-m winds [m s-1]
+    """
+    out_u = get_out(out_u, u10.shape)
+    out_v = get_out(out_v, v10.shape)
+    cone = get_cone(map_attrs)
+    if cone is None:
+        out_u[...] = u10
+        out_v[...] = v10
+        return out_u, out_v
+    lon_diff = np.asarray(lons, np.float64) - map_attrs['STAND_LON']
+    lon_diff = np.where(lon_diff > 180.0, lon_diff - 360.0, np.where(lon_diff < -180.0, lon_diff + 360.0, lon_diff))
+    angle = np.where(np.asarray(lats) < 0.0, -lon_diff, lon_diff) * cone * np.pi / 180.0
+    cos_angle = np.cos(angle)
+    sin_angle = np.sin(angle)
+    out_u[...] = v10 * sin_angle + u10 * cos_angle
+    out_v[...] = v10 * cos_angle - u10 * sin_angle
+    return out_u, out_v
+
+def calc_wspd(u, v, out=None):
+    """
+    Function to compute the wind speed.
+    -- Inputs:
+        - u, v: arrays of wind components [m s-1]
+        - out: float32 array to write the result into (default: None, a new array)
+    -- Output:
+        - wspd: float32 array [m s-1]
+    """
+    return np.hypot(u, v, out=get_out(out, np.shape(u)))
+
+def calc_t2c(t2, out=None):
+    """
+    Function to convert the 2-m temperature to °C.
+    -- Inputs:
+        - t2: 2D array of 2-m temperature [K] (T2)
+        - out: float32 array to write the result into (default: None, a new array)
+    -- Output:
+        - t2c: 2D float32 array [°C]
+    """
+    return np.subtract(t2, np.float32(t_celsius), out=get_out(out, np.shape(t2)))
+
+def calc_rh2(t2, psfc, q2, out=None):
+    """
+    Function to compute the 2-m relative humidity (wrf-python's rh2).
+    -- Inputs:
+        - t2: 2D array of 2-m temperature [K] (T2)
+        - psfc: 2D array of surface pressure [Pa] (PSFC)
+        - q2: 2D array of 2-m water vapor mixing ratio [kg kg-1] (Q2)
+        - out: float32 array to write the result into (default: None, a new array)
+    -- Output:
+        - rh2: 2D float32 array [%]
+    """
+    # Computed in place in float32 (the saturation vapor pressure es is in out, then the saturation mixing ratio)
+    out = get_out(out, np.shape(t2))
+    es = out
+    np.subtract(t2, np.float32(t_celsius), out=es)
+    es /= np.subtract(t2, np.float32(eslcon2))
+    es *= np.float32(eslcon1)
+    np.exp(es, out=es)
+    es *= np.float32(ezero)
+    qvs = np.multiply(psfc, np.float32(0.01))
+    qvs -= np.float32(1.0 - eps) * es
+    np.divide(es, qvs, out=qvs)
+    qvs *= np.float32(eps)
+    np.maximum(q2, np.float32(0.0), out=out)
+    out /= qvs
+    np.clip(out, 0.0, 1.0, out=out)
+    out *= np.float32(100.0)
+    return out
+
+def calc_slp(t, p, pb, qv, ph, phb, out=None):
+    """
+    Function to compute the sea-level pressure (wrf-python's slp, from the MM5/NCL algorithm). The virtual temperature
+    and height are interpolated (in log pressure) to slp_p_depth above the surface, and extrapolated down to sea level
+    with the standard lapse rate. Temperature & height are only computed on the lowest level and on the two levels
+    around slp_p_depth above the surface, not on all model levels.
+    -- Inputs:
+        - t: 3D array (bottom_top, south_north, west_east) of perturbation potential temperature [K] (T)
+        - p, pb: 3D arrays of perturbation & base state pressure [Pa] (P, PB)
+        - qv: 3D array of water vapor mixing ratio [kg kg-1] (QVAPOR)
+        - ph, phb: 3D arrays (bottom_top_stag, south_north, west_east) of perturbation & base state geopotential
+                   [m2 s-2] (PH, PHB)
+        - out: float32 array to write the result into (default: None, a new array)
+    -- Output:
+        - slp: 2D float32 array [hPa]
+    """
+    nz = p.shape[0]
+    pres = np.add(p, pb, dtype=np.float64)
+    p_sfc = pres[0]
+    p_at_depth = p_sfc - slp_p_depth
+    # First level more than slp_p_depth above the surface, and the levels below & above it
+    k_lo = np.maximum(np.argmax(pres < p_at_depth, axis=0) - 1, 0)
+    k_hi = np.minimum(k_lo + 1, nz - 2)
+
+    def at_level(vals, k):
+        # Values of a 3D array at a level index of each column
+        return np.take_along_axis(vals, k[np.newaxis, :, :], axis=0)[0]
+
+    def get_tv(k):
+        # Virtual temperature [K] on a level index of each column
+        p_k = at_level(pres, k)
+        tk = (at_level(t, k).astype(np.float64) + t_base) * (p_k / p_base) ** (Rd / Cp)
+        return p_k, tk * (1.0 + 0.608 * np.maximum(at_level(qv, k), 0.0))
+
+    def get_z(k):
+        # Height [m] of a level index of each column (mass levels are halfway between the geopotential levels)
+        z_beg = at_level(ph, k).astype(np.float64) + at_level(phb, k)
+        z_end = at_level(ph, k + 1).astype(np.float64) + at_level(phb, k + 1)
+        return 0.5 * (z_beg + z_end) / G
+
+    p_lo, tv_lo = get_tv(k_lo)
+    p_hi, tv_hi = get_tv(k_hi)
+    z_lo = get_z(k_lo)
+    z_hi = get_z(k_hi)
+    # The interpolation weight is as in wrf-python & NCL (a product, not a ratio, of the log pressures)
+    weight = np.log(p_at_depth / p_hi) * np.log(p_lo / p_hi)
+    t_at_depth = tv_hi - (tv_hi - tv_lo) * weight
+    z_at_depth = z_hi - (z_hi - z_lo) * weight
+    t_sfc = t_at_depth * (p_sfc / p_at_depth) ** (lapse_rate * Rd / G)
+    t_sea = t_at_depth + lapse_rate * z_at_depth
+    # MM5 adjustment of the sea-level temperature, as in wrf-python
+    t_sea = np.where((t_sfc <= slp_t_crit) & (t_sea >= slp_t_crit), slp_t_crit,
+                     slp_t_crit - 0.005 * (t_sfc - slp_t_crit) ** 2)
+    z_sfc = get_z(np.zeros(p_sfc.shape, np.intp))
+    out = get_out(out, p_sfc.shape)
+    out[...] = 0.01 * p_sfc * np.exp(2.0 * G * z_sfc / (Rd * (t_sea + t_sfc)))
+    return out
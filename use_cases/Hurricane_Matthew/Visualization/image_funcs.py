@@ -0,0 +1,175 @@
+"""
+image_funcs.py
+
+This file contains functions to render Matplotlib figures into RGBA pixel buffers and to encode them to image files
+(PNG, WebP, or JPEG) in background threads, so that the next plot can be drawn while the previous one is compressed.
+
+Rendering a figure with savefig(bbox_inches='tight') draws it twice: once to find the tight bounding box, and once to
+save it. render_rgba finds the tight bounding box from the extents of the artists instead, and draws the figure once.
+The pixels are then handed to an ImageWriter, whose threads encode and write them with Pillow (which releases the
+GIL while compressing):
+    writer = image_funcs.ImageWriter({'format': 'webp', 'lossless': True}, n_threads=2)
+    future = writer.submit(image_funcs.render_rgba(fig), fname)
+    image_stats = future.result()   # {'fname': ..., 'format': 'webp', 'bytes': ..., 'encode_s': ..., ...}
+"""
+
+import io
+import os
+import time
+import concurrent.futures
+import numpy as np
+import matplotlib as mpl
+from PIL import Image
+
+# File name extension of each image format
+image_formats = {'png': 'png', 'webp': 'webp', 'jpeg': 'jpg'}
+
+# Default image encoding options (see encode_image)
+image_defaults = {'format': 'png', 'compress_level': 6, 'lossless': True, 'quality': 90}
+
+def get_image_opts(image_opts):
+    """
+    Function to check a dictionary of image encoding options and fill in the defaults.
+    -- Input:
+        - image_opts: dictionary with any of the keys:
+            - format: string, 'png', 'webp', or 'jpeg' (default: 'png')
+            - compress_level: integer, PNG zlib compression level from 0 (none, fastest) to 9 (smallest) (default: 6)
+            - lossless: boolean, lossless (True) or lossy (False) WebP (default: True)
+            - quality: integer, lossy WebP & JPEG quality from 1 to 100; for lossless WebP, the compression effort
+                       (default: 90)
+    -- Output:
+        - image_opts: new dictionary with all keys set
+    """
+    image_opts = dict(image_defaults, **image_opts)
+    if image_opts['format'] not in image_formats:
+        raise ValueError('Unknown image format ' + str(image_opts['format']) + ', expected one of: ' +
+                         ', '.join(image_formats))
+    if not 0 <= image_opts['compress_level'] <= 9:
+        raise ValueError('PNG compress_level should be from 0 to 9, got ' + str(image_opts['compress_level']))
+    if not 1 <= image_opts['quality'] <= 100:
+        raise ValueError('Image quality should be from 1 to 100, got ' + str(image_opts['quality']))
+    return image_opts
+
+def get_tight_bbox(fig):
+    """
+    Function to get the bounding box of all artists of a figure, padded as savefig(bbox_inches='tight') pads it,
+    without drawing the figure.
+    -- Input:
+        - fig: Matplotlib figure
+    -- Output:
+        - bbox: Matplotlib Bbox [inches]
+    """
+    bbox = fig.get_tightbbox(fig.canvas.get_renderer())
+    return bbox.padded(mpl.rcParams['savefig.pad_inches'])
+
+def render_rgba(fig, bbox_inches='tight'):
+    """
+    Function to draw a figure into an RGBA pixel buffer, as savefig would save it to a PNG file, but drawing it once.
+    -- Inputs:
+        - fig: Matplotlib figure
+        - bbox_inches: 'tight' (default) to crop to the artists of the figure (see get_tight_bbox), a Matplotlib Bbox
+                       [inches], or None for the whole figure
+    -- Output:
+        - rgba: 3D array of uint8 (rows, columns, RGBA), top row first
+    """
+    if bbox_inches == 'tight':
+        bbox_inches = get_tight_bbox(fig)
+    buf = io.BytesIO()
+    fig.savefig(buf, format='rgba', bbox_inches=bbox_inches)
+    # The Agg canvas is the size of the (cropped) figure in pixels, truncated to whole pixels
+    dpi = fig.dpi if mpl.rcParams['savefig.dpi'] == 'figure' else mpl.rcParams['savefig.dpi']
+    height = int((fig.get_size_inches()[1] if bbox_inches is None else bbox_inches.height) * dpi)
+    return np.frombuffer(buf.getbuffer(), dtype=np.uint8).reshape(height, -1, 4)
+
+def encode_image(rgba, fname, image_opts):
+    """
+    Function to encode an RGBA pixel buffer and write it to an image file. The file is written under a temporary name
+    and then renamed, so a partly written image never appears under its final name.
+    -- Inputs:
+        - rgba: 3D array of uint8 (rows, columns, RGBA), e.g., from render_rgba
+        - fname: string or pathlib object, output file name
+        - image_opts: dictionary of image encoding options (see get_image_opts)
+    -- Output:
+        - image_stats: dictionary with the keys fname, format, width, height, bytes (file size), encode_s (wall time
+                       to encode & write), and encode_cpu_s (CPU time of the encoding thread)
+    """
+    wall_beg = time.perf_counter()
+    cpu_beg = time.thread_time()
+    img_format = image_opts['format']
+    image = Image.fromarray(rgba, 'RGBA')
+    # Maps are drawn on an opaque background, so leave out the alpha channel (JPEG has none)
+    if img_format == 'jpeg' or rgba[:, :, 3].min() == 255:
+        image = image.convert('RGB')
+    if img_format == 'png':
+        save_kwargs = {'compress_level': image_opts['compress_level']}
+    elif img_format == 'webp':
+        if image_opts['lossless']:
+            save_kwargs = {'lossless': True, 'quality': image_opts['quality'], 'method': 4}
+        else:
+            save_kwargs = {'quality': image_opts['quality'], 'method': 4}
+    else:
+        save_kwargs = {'quality': image_opts['quality'], 'optimize': True}
+
+    os.makedirs(os.path.dirname(os.path.abspath(fname)), exist_ok=True)
+    tmp_fname = str(fname) + '.tmp'
+    try:
+        image.save(tmp_fname, format=img_format.upper(), **save_kwargs)
+        os.replace(tmp_fname, fname)
+    except BaseException:
+        if os.path.exists(tmp_fname):
+            os.remove(tmp_fname)
+        raise
+    return {'fname': fname, 'format': img_format, 'width': image.width, 'height': image.height,
+            'bytes': os.path.getsize(fname), 'encode_s': round(time.perf_counter() - wall_beg, 6),
+            'encode_cpu_s': round(time.thread_time() - cpu_beg, 6)}
+
+class ImageWriter:
+    """
+    Class that encodes and writes images in a pool of background threads.
+    -- Usage:
+        - writer = ImageWriter(image_opts, n_threads=2)
+        - future = writer.submit(rgba, fname); ...; image_stats = future.result()
+        - writer.close() waits for all submitted images to be written
+        - With n_threads = 0, submit encodes the image before returning (the future is already done)
+    """
+
+    def __init__(self, image_opts, n_threads=2):
+        self.image_opts = get_image_opts(image_opts)
+        self.executor = None
+        if n_threads > 0:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=n_threads,
+                                                                  thread_name_prefix='image_writer')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def submit(self, rgba, fname, image_opts=None):
+        """
+        Function to encode an RGBA pixel buffer and write it to an image file in the background.
+        -- Inputs:
+            - rgba: 3D array of uint8 (rows, columns, RGBA), e.g., from render_rgba (it must not be changed after)
+            - fname: string or pathlib object, output file name
+            - image_opts: dictionary of image encoding options for this image (default: those of the writer)
+        -- Output:
+            - future: concurrent.futures.Future, whose result is the image_stats dictionary of encode_image
+        """
+        image_opts = self.image_opts if image_opts is None else get_image_opts(image_opts)
+        if self.executor is not None:
+            return self.executor.submit(encode_image, rgba, fname, image_opts)
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(encode_image(rgba, fname, image_opts))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def close(self):
+        """
+        Procedure to wait for all submitted images to be written, and stop the threads.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
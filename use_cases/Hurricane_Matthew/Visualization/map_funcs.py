@@ -21,6 +21,10 @@ import cartopy.crs as ccrs
 from cartopy.mpl.ticker import LongitudeFormatter, LatitudeFormatter
 from cartopy.mpl.geoaxes import GeoAxes
 
+# Import functions from local files
+import image_funcs
+import timing_funcs
+
 def calc_bearing(lon1, lat1, lon2, lat2):
     """
     Function to calculate the bearing angle between two points (lon1, lat1) and (lon2, lat2).
@@ -81,79 +85,368 @@ def truncate_cmap(cmap, minval=0.0, maxval=1.0, n=100):
         'trunc({n},{a:.2f},{b:.2f})'.format(n=cmap.name, a=minval, b=maxval), cmap(np.linspace(minval, maxval, n)))
     return new_cmap
 
-def map_plot(opts):
+# Pre-rendered static map layers, keyed by get_basemap_key (one cache per process)
+basemap_cache = {}
+
+def get_projected_coords(cart_proj, lons, lats):
     """
-    Procedure to make a map plot with filled contours using matplotlib and Cartopy.
-    Optionally overlays the map with wind barbs, markers, text labels, a polygon, or cross-section path.
+    Function to project 2D longitude & latitude arrays into the native coordinates of a map projection.
+    Passing these to map_plot as proj_x & proj_y lets contourf work directly in map coordinates, instead of
+    Cartopy transforming the whole lon/lat mesh again for every plot.
+    -- Inputs:
+        - cart_proj: Cartopy object, map projection
+        - lons: 2D array of longitude values
+        - lats: 2D array of latitude values
+    -- Outputs:
+        - proj_x: 2D array of projected x coordinates [m]
+        - proj_y: 2D array of projected y coordinates [m]
+    """
+    proj_xyz = cart_proj.transform_points(ccrs.PlateCarree(), np.asarray(lons), np.asarray(lats))
+    return proj_xyz[..., 0], proj_xyz[..., 1]
+
+def get_barb_index(proj_x, proj_y, spacing, xlim=None, ylim=None):
+    """
+    Function to choose the grid points to draw wind barbs at, evenly spaced in map distance, so the barb density does
+    not depend on the grid spacing or on how the map projection stretches the grid. The map is divided into square
+    bins of the given size, and the grid point nearest the center of each bin is kept.
+    Passing the result to map_plot as barb_index lets every wind field be thinned with a single gather.
+    -- Inputs:
+        - proj_x: 2D array of projected x coordinates of the grid [m] (see get_projected_coords)
+        - proj_y: 2D array of projected y coordinates of the grid [m]
+        - spacing: float, distance between wind barbs [m]
+        - xlim, ylim: tuples of the map limits [m], to leave out grid points outside the map (default: None)
+    -- Output:
+        - barb_index: 1D array of the flat (row-major) indices of the chosen grid points, in increasing order
+    """
+    x = np.asarray(proj_x).ravel()
+    y = np.asarray(proj_y).ravel()
+    keep = np.isfinite(x) & np.isfinite(y)
+    if xlim is not None:
+        keep = keep & (x >= min(xlim)) & (x <= max(xlim))
+    if ylim is not None:
+        keep = keep & (y >= min(ylim)) & (y <= max(ylim))
+    points = np.flatnonzero(keep)
+    if len(points) == 0:
+        return points
+    x = x[points]
+    y = y[points]
+
+    # Bins start at the lower left corner of the map (or of the grid, without map limits)
+    x0 = np.min(x) if xlim is None else min(xlim)
+    y0 = np.min(y) if ylim is None else min(ylim)
+    bin_x = np.floor((x - x0) / spacing)
+    bin_y = np.floor((y - y0) / spacing)
+    bin_id = bin_y * (np.max(bin_x) + 1) + bin_x
+    dist2 = (x - x0 - (bin_x + 0.5) * spacing) ** 2 + (y - y0 - (bin_y + 0.5) * spacing) ** 2
+    # Sort by bin, then by distance to the bin center, and keep the first point of each bin
+    order = np.lexsort((dist2, bin_id))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = bin_id[order[1:]] != bin_id[order[:-1]]
+    return np.sort(points[order[first]])
+
+def get_raster_extent(proj_x, proj_y):
+    """
+    Function to get the extent of a grid drawn as an image in map projection coordinates. This is only possible if
+    the grid is regular in those coordinates, as WRF grids are in their own map projection.
+    -- Inputs:
+        - proj_x: 2D array of projected x coordinates of the grid [m] (see get_projected_coords)
+        - proj_y: 2D array of projected y coordinates of the grid [m]
+    -- Output:
+        - extent: tuple (x0, x1, y0, y1) of the outer edges of the grid cells, or None if the grid is not regular
+    """
+    if proj_x.ndim != 2 or proj_x.shape[0] < 2 or proj_x.shape[1] < 2:
+        return None
+    dx = proj_x[0, 1] - proj_x[0, 0]
+    dy = proj_y[1, 0] - proj_y[0, 0]
+    tol_x = 1e-3 * abs(dx)
+    tol_y = 1e-3 * abs(dy)
+    # Each row must have the same x coordinates, each column the same y coordinates, both evenly spaced
+    if (not np.allclose(proj_x, proj_x[0:1, :], rtol=0.0, atol=tol_x) or
+            not np.allclose(proj_y, proj_y[:, 0:1], rtol=0.0, atol=tol_y) or
+            not np.allclose(np.diff(proj_x[0, :]), dx, rtol=0.0, atol=tol_x) or
+            not np.allclose(np.diff(proj_y[:, 0]), dy, rtol=0.0, atol=tol_y)):
+        return None
+    return (proj_x[0, 0] - dx/2.0, proj_x[0, -1] + dx/2.0, proj_y[0, 0] - dy/2.0, proj_y[-1, 0] + dy/2.0)
+
+def get_raster_values(fill_var, bounds, extend):
+    """
+    Function to prepare a field to be colored cell by cell with the colormap & norm of a filled contour plot, so that
+    each cell gets the color that contourf gives it.
+    -- Inputs:
+        - fill_var: 2D array of values to plot
+        - bounds: array of contour levels
+        - extend: string, colorbar extension beyond the levels ('neither', 'min', 'max', or 'both')
+    -- Output:
+        - fill_var: 2D masked array, masked where contourf would leave the map blank
+    """
+    fill_var = np.ma.masked_invalid(wrf.to_np(fill_var))
+    # Like contourf, leave values beyond the contour levels blank unless the colorbar extends past them
+    if extend in ['neither', 'max']:
+        fill_var = np.ma.masked_less(fill_var, bounds[0])
+    if extend in ['neither', 'min']:
+        fill_var = np.ma.masked_greater(fill_var, bounds[-1])
+    # contourf fills each interval (lower, upper], but the norm maps a value on a level to the interval above it, so
+    # move values that are exactly on a level just below it (e.g., sea-level terrain with levels from 0 m)
+    on_level = np.isin(fill_var.data, bounds[1:] if extend in ['neither', 'max'] else bounds)
+    if on_level.any():
+        fill_var = np.ma.array(np.where(on_level, np.nextafter(fill_var.data, -np.inf), fill_var.data),
+                               mask=np.ma.getmaskarray(fill_var))
+    return fill_var
+
+def draw_raster(ax, fill_var, opts):
+    """
+    Function to draw a field as colored grid cells with the colormap & norm of a filled contour plot, instead of
+    computing contour polygons. If the grid has been projected (proj_x & proj_y) and is regular in map coordinates,
+    it is drawn as a single image without any resampling; otherwise it is drawn with pcolormesh.
+    -- Inputs:
+        - ax: Cartopy GeoAxes
+        - fill_var: 2D array of values to plot
+        - opts: Dictionary containing plotting options (after defaults have been set in map_plot)
+    -- Output:
+        - mappable: Matplotlib image or QuadMesh, for the colorbar
+    """
+    fill_var = get_raster_values(fill_var, opts['bounds'], opts['extend'])
+
+    extent = None
+    if opts['proj_x'] is not None and opts['proj_y'] is not None:
+        extent = get_raster_extent(opts['proj_x'], opts['proj_y'])
+    if extent is not None:
+        # Keep the map limits, which imshow would otherwise change to the image extent
+        with ax.hold_limits():
+            return ax.imshow(fill_var, extent=extent, origin='lower', transform=opts['cart_proj'], cmap=opts['cmap'],
+                             norm=opts['norm'], interpolation='nearest', zorder=1)
+    if opts['proj_x'] is not None and opts['proj_y'] is not None:
+        return ax.pcolormesh(opts['proj_x'], opts['proj_y'], fill_var, cmap=opts['cmap'], norm=opts['norm'],
+                             shading='nearest', transform=opts['cart_proj'])
+    return ax.pcolormesh(wrf.to_np(opts['lons']), wrf.to_np(opts['lats']), fill_var, cmap=opts['cmap'],
+                         norm=opts['norm'], shading='nearest', transform=ccrs.PlateCarree())
+
+def get_feature_key(feature):
+    """
+    Function to get a hashable identifier for a Cartopy feature, for use in the basemap cache key.
     -- Input:
-        - opts: Dictionary containing plotting options
-            Required keys:
-            - fname: string or pathlib object specifying the output file name
-            - fill_var: 2D variable array to be plotted with filled contours
-            - suptitle: string for overall plot title (usually one line)
-            - cbar_lab: string for colorbar label (e.g., 'Wind Speed [m/s]')
-            - cart_proj: Cartopy object, map projection
-            - lons: 1D or 2D array of longitude values
-            - lats: 1D or 2D array of latitude values
-            - cmap: Matplotlib colormap
-            - bounds: Matplotlib colormap bounds
-            - norm: matplotlib colormap norm
-            Optional keys:
-            - cart_xlim: Cartopy object, x-axis limits
-            - cart_ylim: Cartopy object, y-axis limits
-            - extend: string for colorbar caps ('max', 'min', 'both' [default])
-            - fontsize: integer, base fontsize (default: 14)
-            - figsize: 2D tuple, defining the figure size (default: (10, 8))
-            - cbar_loc: string, identifier for positioning of the colorbar ('bottom' [default], 'top', 'right', 'left')
-            - borders, states, oceans, lakes, rivers, land: Cartopy feature objects for the map
-            - border_width: numerical line thickness for national borders & coastlines (default: 1.5)
-            - water_color: string defining water color for the map (default: 'none' [transparent])
-            - lat_labels: array of latitude values to label explicitly on the map
-            - lon_labels: array of longitude values to label explicitly on the map
-            - suptitle_y: float, y-axis position of the suptitle (default: 0.95)
-            - title_l: string, plot subtitle (1 or 2 lines) that gets placed above the top-left corner of the plot axes
-            - title_r: string, plot subtitle (1 or 2 lines) that gets placed above the top-right corner of the plot axes
-            - title_c: string, plot subtitle (1 or 2 lines) that gets placed above the center of the plot axes
-            - map_x_thin: integer, thin wind barb location overlays in x-direction (every Nth grid point) (default: 25)
-            - map_y_thin: integer, thin wind barb location overlays in y-direction (every Nth grid point) (default: 25)
-            - barb_width: float, linewidth of wind barbs (default: 0.25)
-            - u: array-like, define the barb directions
-            - v: array-like, define the barb directions
-            - mark1_lon: array of longitude values for set 1 of markers
-            - mark1_lat: array of latitude values for set 1 of markers
-            - mark1_size: integer specifying marker size for set 1 of markers (default: 100)
-            - mark1_style: string specifying marker style for set 1 of markers (default: 'o')
-            - mark1_color: string specifying the marker color for set 1 of markers
-            - mark1_edgecolor: string specifying the marker edge color for set 1 of markers (default: 'black')
-            - mark1_width: float specifying linewidth for set 1 of markers
-            - mark1_val_fill: boolean flag to fill set 1 of markers from data value, cmap, and norm (default: False)
-            - mark1_var: variable containing data to fill in set 1 of markers (e.g., plot obs station data)
-            - mark1_zorder: integer indicator of the Matplotlib draw order for set 1 of markers (default: 10)
-            - mark2_lon: array of longitude values for set 2 of markers
-            - mark2_lat: array of latitude values for set 2 of markers
-            - mark2_size: integer specifying marker size for set 2 of markers (default: 100)
-            - mark2_style: string specifying marker style for set 2 of markers (default: 'o')
-            - mark2_color: string specifying the marker color for set 2 of markers
-            - mark2_edgecolor: string specifying the marker edge color for set 2 of markers (default: 'black')
-            - mark2_width: float specifying linewidth for set 2 of markers
-            - mark2_val_fill: boolean flag to fill set 2 of markers from data value, cmap, and norm (default: False)
-            - mark2_var: variable containing data to fill in set 2 of markers (e.g., plot obs station data)
-            - mark2_zorder: integer indicator of the Matplotlib draw order for set 2 of markers (default: 11)
-            - text1_lat: array of floats for latitudes for set 1 of text
-            - text1_lon: array of floats for longitudes for set 1 of text
-            - text1_lab: array of strings for labels for set 1 of text
-            - text1_lab_wt: numeric or string indicating font weight for set 1 of text (default: 'normal')
-            - text2_lat: array of floats for latitudes for set 2 of text
-            - text2_lon: array of floats for longitudes for set 2 of text
-            - text2_lab: array of strings for labels for set 2 of text
-            - text2_lab_wt: numeric or string indicating font weight for set 2 of text (default: 'normal')
-            - lg_text: array of legend labels
-            - lg_loc: string, defining legend placement
-            - lg_fontsize: integer fontsize for legend labels
+        - feature: Cartopy feature object or None
     -- Output:
-        - generates a plot saved to fname
+        - tuple identifying the feature (or None)
+    """
+    if feature is None:
+        return None
+    return (type(feature).__name__, getattr(feature, 'category', None), getattr(feature, 'name', None),
+            str(getattr(feature, 'scale', None)))
+
+def get_basemap_key(opts, markers_cached, ax_size=None):
+    """
+    Function to build the basemap cache key from the map plotting options. Two plots with the same key have
+    identical static map layers (projection, extent, features, and station markers).
+    -- Inputs:
+        - opts: Dictionary containing plotting options (after defaults have been set in map_plot)
+        - markers_cached: boolean, True if marker set 1 is rendered into the cached layer
+        - ax_size: (width, height) [inches] of the map axes the layer is rendered for (see get_basemap_layer), or
+                   None for the map of a plot without panels
+    -- Output:
+        - key: tuple
+    """
+    def to_tuple(arr):
+        return None if arr is None else tuple(np.asarray(arr).ravel().tolist())
+
+    cart_xlim = opts['cart_xlim']
+    cart_ylim = opts['cart_ylim']
+    if cart_xlim is not None and cart_ylim is not None:
+        extent = (tuple(cart_xlim), tuple(cart_ylim))
+    else:
+        extent = (float(np.min(opts['lons'])), float(np.max(opts['lons'])),
+                  float(np.min(opts['lats'])), float(np.max(opts['lats'])))
+    features = tuple(get_feature_key(opts[name]) for name in ['borders', 'states', 'oceans', 'lakes'])
+    size = tuple(opts['figsize']) if ax_size is None else ('axes',) + tuple(ax_size)
+    key = (opts['cart_proj'].proj4_init, extent, size, mpl.rcParams['figure.dpi'], features,
+           opts['water_color'], opts['border_width'])
+    if markers_cached:
+        key = key + (to_tuple(opts['mark1_lon']), to_tuple(opts['mark1_lat']), opts['mark1_size'],
+                     opts['mark1_style'], opts['mark1_color'], opts['mark1_edgecolor'], opts['mark1_width'])
+    return key
+
+def draw_map_features(ax, opts):
+    """
+    Procedure to draw the optional Cartopy features (borders, states, oceans, lakes) and coastlines on a map.
+    -- Inputs:
+        - ax: Cartopy GeoAxes
+        - opts: Dictionary containing plotting options (after defaults have been set in map_plot)
+    """
+    borders = opts['borders']
+    states = opts['states']
+    oceans = opts['oceans']
+    lakes = opts['lakes']
+    water_color = opts['water_color']
+    border_width = opts['border_width']
+
+    if borders != None:
+        ax.add_feature(borders, linewidth=border_width, linestyle='-', zorder=3)
+    if states != None:
+        ax.add_feature(states, linewidth=border_width/3.0, edgecolor='black', zorder=4)
+    if oceans != None:
+        # Drawing the oceans can be VERY slow with Cartopy 0.20+ for some domains, so may want to skip it
+        # Can set the facecolor for the axes to water_color instead (usually we want this 'none' except for terrain)
+        ax.add_feature(oceans, facecolor=water_color, zorder=2)
+        # ax.add_feature(oceans, facecolor='none', zorder=2)
+        # ax.set_facecolor(opts['water_color'])
+    if lakes != None:
+        # Unless facecolor='none', lakes w/ facecolor will appear above filled contour plot, which is undesirable
+        ax.add_feature(lakes, facecolor=water_color, linewidth=0.25, edgecolor='black', zorder=5)
+    ax.coastlines(zorder=6, linewidth=border_width)
+
+def set_map_extent(ax, opts):
+    """
+    Procedure to set the plot limits of a map from cart_xlim/cart_ylim, or from the lat/lon data if not provided.
+    -- Inputs:
+        - ax: Cartopy GeoAxes
+        - opts: Dictionary containing plotting options (after defaults have been set in map_plot)
+    """
+    if opts['cart_xlim'] is not None and opts['cart_ylim'] is not None:
+        ax.set_xlim(opts['cart_xlim'])
+        ax.set_ylim(opts['cart_ylim'])
+    else:
+        lons = opts['lons']
+        lats = opts['lats']
+        ax.set_extent([np.min(lons), np.max(lons), np.min(lats), np.max(lats)], crs=opts['cart_proj'])
+
+def get_basemap_layer(opts, markers_cached, ax_size=None):
+    """
+    Function to get the static map layers (features, coastlines, and optionally marker set 1) pre-rendered as an
+    RGBA image covering the map axes. The layer is drawn once per basemap key and then reused from basemap_cache,
+    so that each subsequent plot only has to composite a single image instead of redrawing the Cartopy features.
+    Matplotlib rcParams (figure size, dpi) must already be set as for the plot the layer will be used in, unless the
+    size of its map axes is given.
+    -- Inputs:
+        - opts: Dictionary containing plotting options (after defaults have been set in map_plot)
+        - markers_cached: boolean, True to render marker set 1 into the layer as well
+        - ax_size: (width, height) [inches] of the map axes the layer will be composited into (e.g., a map panel), to
+                   render the layer at that size instead of for the map of a plot without panels (default: None)
+    -- Outputs:
+        - layer: RGBA image array (ny, nx, 4)
+        - extent: tuple (x0, x1, y0, y1) of the layer in map projection coordinates
+    """
+    key = get_basemap_key(opts, markers_cached, ax_size)
+    if key in basemap_cache:
+        return basemap_cache[key]
+
+    print('-- Rendering static basemap layer')
+    # Build the same figure & axes as map_plot, but with transparent backgrounds and only the static layers
+    if ax_size is None:
+        fig = plt.figure()
+        ax = plt.subplot(projection=opts['cart_proj'])
+    else:
+        fig = plt.figure(figsize=ax_size)
+        ax = fig.add_axes([0, 0, 1, 1], projection=opts['cart_proj'])
+    set_map_extent(ax, opts)
+    fig.patch.set_alpha(0.0)
+    ax.patch.set_visible(False)
+    ax.spines['geo'].set_visible(False)
+    with timing_funcs.stage('features'):
+        draw_map_features(ax, opts)
+        if markers_cached:
+            ax.scatter(opts['mark1_lon'], opts['mark1_lat'], marker=opts['mark1_style'], s=opts['mark1_size'],
+                       color=opts['mark1_color'], edgecolors=opts['mark1_edgecolor'], linewidths=opts['mark1_width'],
+                       transform=ccrs.PlateCarree(), zorder=opts['mark1_zorder'])
+        fig.canvas.draw()
+
+    # Crop the rendered figure to the (whole-pixel) axes box, and find that box in projection coordinates
+    rgba = np.asarray(fig.canvas.buffer_rgba())
+    n_rows = rgba.shape[0]
+    x0, y0, x1, y1 = np.round(ax.bbox.extents).astype(int)
+    layer = rgba[n_rows-y1:n_rows-y0, x0:x1, :].copy()
+    (ext_x0, ext_y0), (ext_x1, ext_y1) = ax.transData.inverted().transform([[x0, y0], [x1, y1]])
+    extent = (ext_x0, ext_x1, ext_y0, ext_y1)
+    plt.close(fig)
+
+    basemap_cache[key] = (layer, extent)
+    return layer, extent
+
+# Persistent MapRenderer objects, keyed by get_renderer_key (one set per process)
+map_renderers = {}
+
+# Options that stay fixed for the lifetime of a MapRenderer (everything else is redrawn on each frame)
+renderer_static_keys = [
+    'cart_xlim', 'cart_ylim', 'fontsize', 'figsize', 'cbar_loc', 'water_color', 'border_width',
+    'lat_labels', 'lon_labels', 'basemap_cache',
+    'mark1_lat', 'mark1_lon', 'mark1_size', 'mark1_style', 'mark1_color', 'mark1_edgecolor', 'mark1_width',
+    'mark1_val_fill', 'mark1_zorder',
+    'mark2_lat', 'mark2_lon', 'mark2_size', 'mark2_style', 'mark2_color', 'mark2_edgecolor', 'mark2_width',
+    'mark2_val_fill', 'mark2_zorder',
+    'text1_lat', 'text1_lon', 'text1_lab', 'text1_lab_wt', 'text2_lat', 'text2_lon', 'text2_lab', 'text2_lab_wt',
+    'lg_text', 'panel_cols',
+]
+
+# Colorbar axes offset from its map & width (fractions of the figure size of a plot without panels), by cbar_loc
+cbar_offsets = {'bottom': (0.09, 0.05), 'right': (0.05, 0.04)}
+
+# Space between neighboring map panels [inches]
+panel_pad = 0.15
+
+def get_panel_layout(opts, map_aspect):
+    """
+    Function to lay out the map panels of a plot in a grid. Each map is the size it has in a plot without panels,
+    and each cell of the grid adds only the room needed around its map for the lat/lon labels, titles, and colorbar
+    (estimated from the font sizes), so that the cells follow the map aspect ratio. The times (title_r) are the same
+    for all panels, so they are drawn once under the suptitle, in a band above the panels.
+    -- Inputs:
+        - opts: Dictionary containing plotting options (after defaults have been set)
+        - map_aspect: float, height / width of the map extent in map projection coordinates
+    -- Output:
+        - layout: Dictionary with the keys figsize ((width, height) [inches] of the figure), ax_size ((width, height)
+                  [inches] of each map), axes (list of [left, bottom, width, height] figure fractions of each map),
+                  suptitle_y and times_y (figure fractions of the top of the suptitle & times)
+    """
+    fig_w, fig_h = opts['figsize']
+    fontsize = opts['fontsize']
+    n_rows, n_cols = get_panel_grid(opts)
+    pt = 1.0 / 72.0
+    line = 1.25 * pt
+
+    # The map of a plot without panels fills the default subplot box of its figure, reduced to the map aspect ratio
+    box_w = fig_w * (mpl.rcParams['figure.subplot.right'] - mpl.rcParams['figure.subplot.left'])
+    box_h = fig_h * (mpl.rcParams['figure.subplot.top'] - mpl.rcParams['figure.subplot.bottom'])
+    map_w = min(box_w, box_h / map_aspect)
+    map_h = map_w * map_aspect
+
+    # Lat/lon labels on all sides (e.g., '100°W'), two lines of titles on top (e.g., the product & its min/max), and
+    # the colorbar with its labels
+    lat_lab_w = 5 * 0.6 * (fontsize - 2) * pt + 4 * pt
+    lon_lab_h = (fontsize - 2) * line + 4 * pt
+    title_h = 2 * fontsize * line + 6 * pt
+    cbar_lab = 2 * (fontsize + 2) * line + 4 * pt
+    left = lat_lab_w
+    top = lon_lab_h + title_h
+    right = lat_lab_w
+    bottom = lon_lab_h
+    if opts['cbar_loc'] == 'bottom':
+        bottom = max(bottom, (cbar_offsets['bottom'][0] - cbar_offsets['bottom'][1]) * fig_h) + \
+                 cbar_offsets['bottom'][1] * fig_h + cbar_lab
+    elif opts['cbar_loc'] == 'right':
+        right = max(right, cbar_offsets['right'][0] * fig_w) + cbar_offsets['right'][1] * fig_w + \
+                5 * 0.6 * (fontsize + 2) * pt + cbar_lab
+    cell_w = left + map_w + right + panel_pad
+    cell_h = top + map_h + bottom + panel_pad
+
+    # Band above the panels for the suptitle (one line) and the times (up to two lines)
+    suptitle_h = (fontsize + 2) * line
+    band_h = suptitle_h + 2 * fontsize * line
+    width = n_cols * cell_w
+    height = band_h + n_rows * cell_h
+    axes = []
+    for pp in range(len(opts['panels'])):
+        row, col = divmod(pp, n_cols)
+        x0 = col * cell_w + left
+        y0 = height - band_h - row * cell_h - top - map_h
+        axes.append([x0 / width, y0 / height, map_w / width, map_h / height])
+    return {'figsize': (width, height), 'ax_size': (map_w, map_h), 'axes': axes,
+            'suptitle_y': 1.0, 'times_y': 1.0 - suptitle_h / height}
+
+def set_map_opts_defaults(opts):
+    """
+    Procedure to set default values for optional map plotting options (see map_plot for the full list).
+    -- Input:
+        - opts: Dictionary containing plotting options (updated in place)
     """
-    # Set default values for optional dictionary entries
     opts.setdefault('cart_xlim', None)
     opts.setdefault('cart_ylim', None)
     opts.setdefault('extend', 'both')
@@ -176,9 +469,16 @@ def map_plot(opts):
     opts.setdefault('title_c', None)
     opts.setdefault('map_x_thin', 25)
     opts.setdefault('map_y_thin', 25)
+    opts.setdefault('barb_index', None)
     opts.setdefault('barb_width', 0.25)
     opts.setdefault('u', None)
     opts.setdefault('v', None)
+    opts.setdefault('proj_x', None)
+    opts.setdefault('proj_y', None)
+    opts.setdefault('render_mode', 'contourf')
+    opts.setdefault('image_writer', None)
+    opts.setdefault('panels', None)
+    opts.setdefault('panel_cols', 2)
     opts.setdefault('mark1_lat', None)
     opts.setdefault('mark1_lon', None)
     opts.setdefault('mark1_size', 100)
@@ -210,158 +510,371 @@ def map_plot(opts):
     opts.setdefault('lg_text', None)
     opts.setdefault('lg_loc', 'lower left')
     opts.setdefault('lg_fontsize', 14)
+    opts.setdefault('basemap_cache', False)
+    opts.setdefault('reuse_figure', False)
 
-    # Pull everything out of the opts dict into variables for cleaner code later on
-    fname = opts['fname']
-    fill_var = opts['fill_var']
-    suptitle = opts['suptitle']
-    cbar_lab = opts['cbar_lab']
-    cart_proj = opts['cart_proj']
-    cart_xlim = opts['cart_xlim']
-    cart_ylim = opts['cart_ylim']
-    lons = opts['lons']
-    lats = opts['lats']
-    cmap = opts['cmap']
-    bounds = opts['bounds']
-    norm = opts['norm']
-    extend = opts['extend']
-    fontsize = opts['fontsize']
-    figsize = opts['figsize']
-    cbar_loc = opts['cbar_loc']
-    borders = opts['borders']
-    states = opts['states']
-    oceans = opts['oceans']
-    lakes = opts['lakes']
-    rivers = opts['rivers']
-    land = opts['land']
-    water_color = opts['water_color']
-    border_width = opts['border_width']
-    lat_labels = opts['lat_labels']
-    lon_labels = opts['lon_labels']
-    suptitle_y = opts['suptitle_y']
-    title_l = opts['title_l']
-    title_r = opts['title_r']
-    title_c = opts['title_c']
-    map_x_thin = opts['map_x_thin']
-    map_y_thin = opts['map_y_thin']
-    barb_width = opts['barb_width']
-    u = opts['u']
-    v = opts['v']
-    mark1_lat = opts['mark1_lat']
-    mark1_lon = opts['mark1_lon']
-    mark1_size = opts['mark1_size']
-    mark1_style = opts['mark1_style']
-    mark1_color = opts['mark1_color']
-    mark1_edgecolor = opts['mark1_edgecolor']
-    mark1_width = opts['mark1_width']
-    mark1_val_fill = opts['mark1_val_fill']
-    mark1_var = opts['mark1_var']
-    mark1_zorder = opts['mark1_zorder']
-    mark2_lat = opts['mark2_lat']
-    mark2_lon = opts['mark2_lon']
-    mark2_size = opts['mark2_size']
-    mark2_style = opts['mark2_style']
-    mark2_color = opts['mark2_color']
-    mark2_edgecolor = opts['mark2_edgecolor']
-    mark2_width = opts['mark2_width']
-    mark2_val_fill = opts['mark2_val_fill']
-    mark2_var = opts['mark2_var']
-    mark2_zorder = opts['mark2_zorder']
-    text1_lat = opts['text1_lat']
-    text1_lon = opts['text1_lon']
-    text1_lab = opts['text1_lab']
-    text1_lab_wt = opts['text1_lab_wt']
-    text2_lat = opts['text2_lat']
-    text2_lon = opts['text2_lon']
-    text2_lab = opts['text2_lab']
-    text2_lab_wt = opts['text2_lab_wt']
-    lg_text = opts['lg_text']
-    lg_loc = opts['lg_loc']
-    lg_fontsize = opts['lg_fontsize']
-
-    # Set some Matplotlib resources
-    mpl.rcParams['figure.figsize'] = figsize
-    mpl.rcParams['grid.color'] = 'gray'
-    mpl.rcParams['grid.linestyle'] = ':'
-    mpl.rcParams['font.size'] = fontsize + 2
-    mpl.rcParams['figure.titlesize'] = fontsize + 2
-    mpl.rcParams['savefig.bbox'] = 'tight'
-    ll_size = fontsize - 2
-    data_crs = ccrs.PlateCarree()
-
-    print('-- Plotting ' + str(fname))
-
-    # Define the figure and axes
-    fig = plt.figure()
-    ax = plt.subplot(projection=cart_proj)
-
-    # If cart_xlim and cart_ylim tuples are not provided, then set plot limits from lat/lon data directly
-    if cart_xlim is not None and cart_ylim is not None:
-        ax.set_xlim(cart_xlim)
-        ax.set_ylim(cart_ylim)
-    else:
-        ax.set_extent([np.min(lons), np.max(lons), np.min(lats), np.max(lats)], crs=cart_proj)
+def to_hashable(val):
+    """
+    Function to convert a plotting option value (possibly a list or array) to something hashable.
+    -- Input:
+        - val: any plotting option value
+    -- Output:
+        - hashable version of val
+    """
+    if isinstance(val, (list, tuple, np.ndarray)):
+        return tuple(np.asarray(val).ravel().tolist())
+    return val
 
-    # If lons & lats are 1D, make them into 2D arrays
-    if lons.ndim == 1 and lats.ndim == 1:
-        ll2d = np.meshgrid(lons, lats)
-        lons = ll2d[0]
-        lats = ll2d[1]
+def get_renderer_key(opts):
+    """
+    Function to build the MapRenderer key from the map plotting options. Plots with the same key share the same
+    projection, extent, features, gridlines, colorbar placement, markers, and text labels.
+    -- Input:
+        - opts: Dictionary containing plotting options (after defaults have been set)
+    -- Output:
+        - key: tuple
+    """
+    key = get_basemap_key(opts, False)
+    n_panels = None if opts['panels'] is None else len(opts['panels'])
+    return key + (n_panels,) + tuple(to_hashable(opts[name]) for name in renderer_static_keys)
 
-    # Optional: Add various cartopy features
-    if borders != None:
-        ax.add_feature(borders, linewidth=border_width, linestyle='-', zorder=3)
-    if states != None:
-        ax.add_feature(states, linewidth=border_width/3.0, edgecolor='black', zorder=4)
-    if oceans != None:
-        # Drawing the oceans can be VERY slow with Cartopy 0.20+ for some domains, so may want to skip it
-        # Can set the facecolor for the axes to water_color instead (usually we want this 'none' except for terrain)
-        ax.add_feature(oceans, facecolor=water_color, zorder=2)
-        # ax.add_feature(oceans, facecolor='none', zorder=2)
-        # ax.set_facecolor(opts['water_color'])
-    if lakes != None:
-        # Unless facecolor='none', lakes w/ facecolor will appear above filled contour plot, which is undesirable
-        ax.add_feature(lakes, facecolor=water_color, linewidth=0.25, edgecolor='black', zorder=5)
-    ax.coastlines(zorder=6, linewidth=border_width)
+def get_panel_grid(opts):
+    """
+    Function to get the number of rows & columns of map panels of a plot (see the panels option of map_plot).
+    -- Input:
+        - opts: Dictionary containing plotting options (after defaults have been set)
+    -- Output:
+        - n_rows, n_cols: integers (1, 1 for a plot without panels)
+    """
+    if opts['panels'] is None:
+        return 1, 1
+    n_cols = min(opts['panel_cols'], len(opts['panels']))
+    return (len(opts['panels']) + n_cols - 1) // n_cols, n_cols
 
-    # Sometimes longitude labels show up on y-axis, and latitude labels on x-axis in older versions of Cartopy
-    # Print lat/lon labels only for a specified set (determined by trial & error) to avoid this problem for now
-    gl = ax.gridlines(draw_labels=True, x_inline=False, y_inline=False)
-    gl.rotate_labels = False
-    # If specific lat/lon labels are not specified, then just label the default gridlines
-    if lon_labels is not None:
-        gl.xlocator = mticker.FixedLocator(lon_labels)
-    if lat_labels is not None:
-        gl.ylocator = mticker.FixedLocator(lat_labels)
-    gl.top_labels = True
-    gl.bottom_labels = True
-    gl.left_labels = True
-    gl.right_labels = True
-    gl.xlabel_style = {'size': ll_size}
-    gl.ylabel_style = {'size': ll_size}
-
-    # Draw the actual filled contour plot
-    # NOTE: Sometimes a cartopy contourf plot may fail with a Shapely TopologicalError.
-    #       It appears to happen sometimes when projecting a dataset onto a different projection.
-    #       This error occurs more often if nans are present.
-    #       Replacing nans with scipy.interpolate.griddata solves some of these errors, but not all.
-    #       Interestingly, plt.contour still seems to work in these situations as a (suboptimal) workaround.
-    #       This bug occurs with Shapely 1.8.0, Cartopy 0.20.1.
-    #       This issue was resolved with Cartopy 0.20.2 (https://github.com/SciTools/cartopy/issues/1936).
-    # Using the transform_first argument results in a noticeable speed-up:
-    #    https://scitools.org.uk/cartopy/docs/latest/gallery/scalar_data/contour_transforms.html
-    #  - This also requires the X and Y variables to be 2-D arrays.
-    #  - This also resolves TopologyException: side location conflict errors that can occur when NaNs are present.
-
-    # If the variable has the same shape as lats, then plot the filled contour field
-    if fill_var.shape == lats.shape:
-        contourf = True
-        plt.contourf(wrf.to_np(lons), wrf.to_np(lats), wrf.to_np(fill_var), bounds,
-                     cmap=cmap, norm=norm, extend=extend, transform=data_crs, transform_first=(ax, True))
-    # Otherwise, we presumably need to plot an empty map and then plot markers
-    else:
-        contourf = False
-        if mark1_lon is None or mark1_lat is None:
+class MapRenderer:
+    """
+    Class that keeps one Matplotlib figure, Cartopy GeoAxes, and colorbar axes alive for a domain, and draws map
+    plots into them. The static parts of the map (features, gridlines, unfilled markers, text labels) are drawn
+    once when the renderer is created. Each call to map_plot only replaces the filled contours, data-filled
+    markers, wind barbs, colorbar, titles, and legend before saving the figure. A plot with panels has a GeoAxes and
+    colorbar axes for each panel, all with the same static map.
+    -- Usage:
+        - renderer = MapRenderer(opts); renderer.map_plot(opts); ...; renderer.close()
+        - opts is the same dictionary of plotting options accepted by map_funcs.map_plot
+    """
+
+    def __init__(self, opts):
+        set_map_opts_defaults(opts)
+        self.key = get_renderer_key(opts)
+        fontsize = opts['fontsize']
+
+        # Matplotlib resources are applied with rc_context for this renderer only, instead of globally
+        # (a plot with panels is resized to its panel layout, see get_panel_layout)
+        self.rc = {
+            'figure.figsize': opts['figsize'],
+            'grid.color': 'gray',
+            'grid.linestyle': ':',
+            'font.size': fontsize + 2,
+            'figure.titlesize': fontsize + 2,
+            'savefig.bbox': 'tight',
+        }
+        self.data_crs = ccrs.PlateCarree()
+        self.frame_artists = []
+
+        with mpl.rc_context(self.rc):
+            self.draw_static(opts)
+
+    def draw_static(self, opts):
+        """
+        Procedure to create the figure and axes and draw the parts of the map that do not change between frames.
+        -- Input:
+            - opts: Dictionary containing plotting options (after defaults have been set)
+        """
+        cart_proj = opts['cart_proj']
+        cbar_loc = opts['cbar_loc']
+
+        # Marker set 1 can be part of the cached basemap layer if it does not depend on the data or need a legend
+        self.markers_cached = (opts['basemap_cache'] and opts['mark1_lon'] is not None and
+                               opts['mark1_lat'] is not None and not opts['mark1_val_fill'] and
+                               opts['lg_text'] is None)
+
+        # Define the figure and axes (with panels, one map axes per panel, filled in row by row)
+        self.fig = plt.figure()
+        self.layout = None
+        self.ax_size = None
+        if opts['panels'] is None:
+            self.axes = [plt.subplot(projection=cart_proj)]
+        else:
+            self.axes = [self.fig.add_axes([0, 0, 1, 1], projection=cart_proj) for pp in range(len(opts['panels']))]
+            # The panel layout follows the aspect ratio of the map extent
+            set_map_extent(self.axes[0], opts)
+            x0, x1 = self.axes[0].get_xlim()
+            y0, y1 = self.axes[0].get_ylim()
+            self.layout = get_panel_layout(opts, abs(y1 - y0) / abs(x1 - x0))
+            self.ax_size = self.layout['ax_size']
+            self.fig.set_size_inches(self.layout['figsize'])
+            for ax, posn in zip(self.axes, self.layout['axes']):
+                ax.set_position(posn)
+            self.times = self.fig.text(0.5, self.layout['times_y'], '', ha='center', va='top',
+                                       fontsize=opts['fontsize'])
+        for ax in self.axes:
+            self.draw_static_map(ax, opts)
+
+        if cbar_loc == 'top' or cbar_loc == 'left':
+            print('WARNING: cbar_loc=' + cbar_loc + ' requested. Unsupported option. Colorbar will not be drawn.')
+            print('   Add directives in map_funcs.map_plot to handle that option and draw the colorbar.')
+        self.caxes = [self.add_colorbar_axes(ax, opts) for ax in self.axes]
+        self.cax_posns = [None if cax is None else cax.get_position() for cax in self.caxes]
+
+    def draw_static_map(self, ax, opts):
+        """
+        Procedure to draw the parts of a map that do not change between frames (extent, features, gridlines, unfilled
+        markers, and text labels).
+        -- Inputs:
+            - ax: Cartopy GeoAxes
+            - opts: Dictionary containing plotting options (after defaults have been set)
+        """
+        cart_proj = opts['cart_proj']
+        fontsize = opts['fontsize']
+        lat_labels = opts['lat_labels']
+        lon_labels = opts['lon_labels']
+        data_crs = self.data_crs
+        ll_size = fontsize - 2
+
+        # If cart_xlim and cart_ylim tuples are not provided, then set plot limits from lat/lon data directly
+        set_map_extent(ax, opts)
+
+        # Optional: Add various cartopy features
+        if opts['basemap_cache']:
+            # Composite the pre-rendered static layers (drawn once per domain) instead of redrawing the features
+            # (with panels, the layer is rendered at the size of the panel maps)
+            layer, extent = get_basemap_layer(opts, self.markers_cached, self.ax_size)
+            ax.imshow(layer, extent=extent, origin='upper', transform=cart_proj, interpolation='none', zorder=3)
+        else:
+            # The features are only rendered when the figure is saved, so most of their cost shows up in savefig
+            with timing_funcs.stage('features'):
+                draw_map_features(ax, opts)
+
+        # Sometimes longitude labels show up on y-axis, and latitude labels on x-axis in older versions of Cartopy
+        # Print lat/lon labels only for a specified set (determined by trial & error) to avoid this problem for now
+        gl = ax.gridlines(draw_labels=True, x_inline=False, y_inline=False)
+        gl.rotate_labels = False
+        # If specific lat/lon labels are not specified, then just label the default gridlines
+        if lon_labels is not None:
+            gl.xlocator = mticker.FixedLocator(lon_labels)
+        if lat_labels is not None:
+            gl.ylocator = mticker.FixedLocator(lat_labels)
+        gl.top_labels = True
+        gl.bottom_labels = True
+        gl.left_labels = True
+        gl.right_labels = True
+        gl.xlabel_style = {'size': ll_size}
+        gl.ylabel_style = {'size': ll_size}
+
+        # Optional: Add unfilled marker sets (filled marker sets depend on the data and are drawn with each frame)
+        lg_text = opts['lg_text']
+        for mm in [1, 2]:
+            mark = 'mark' + str(mm) + '_'
+            mark_lon = opts[mark + 'lon']
+            mark_lat = opts[mark + 'lat']
+            if mark_lon is None or mark_lat is None:
+                continue
+            if mark_lat.shape != mark_lon.shape:
+                print('ERROR: map_plot in map_funcs.py:')
+                print('       ' + mark + 'lat and ' + mark + 'lon do not have the same shape.')
+                print('       Exiting!')
+                sys.exit()
+            if opts[mark + 'val_fill'] or (mm == 1 and self.markers_cached):
+                continue
+            if lg_text is None:
+                lg_lab = None
+            else:
+                lg_lab = lg_text[mm-1]
+            ax.scatter(mark_lon, mark_lat, marker=opts[mark + 'style'], s=opts[mark + 'size'],
+                       color=opts[mark + 'color'], edgecolors=opts[mark + 'edgecolor'], label=lg_lab,
+                       linewidths=opts[mark + 'width'], transform=data_crs, zorder=opts[mark + 'zorder'])
+
+        # Optional: Add sets of text labels to the plot
+        for tt, zorder in [(1, 13), (2, 14)]:
+            text = 'text' + str(tt) + '_'
+            text_lab = opts[text + 'lab']
+            text_lat = opts[text + 'lat']
+            text_lon = opts[text + 'lon']
+            if text_lab is None or text_lat is None or text_lon is None:
+                continue
+            if len(text_lab) != len(text_lat) or len(text_lab) != len(text_lon):
+                print('ERROR: map_plot in map_funcs.py:')
+                print('       ' + text + 'lab, ' + text + 'lat, and ' + text + 'lon do not all have the same length.')
+                print('       Exiting!')
+                sys.exit()
+            n_text = len(text_lab)
+            # Clip labels to the map, so labels of stations outside a zoomed-in map are not drawn around it
+            for xx in range(n_text):
+                ax.text(text_lon[xx], text_lat[xx], text_lab[xx], horizontalalignment='center',
+                        transform=data_crs, size=fontsize, zorder=zorder, weight=opts[text + 'lab_wt'],
+                        clip_on=True, clip_box=ax.bbox)
+
+    def add_colorbar_axes(self, ax, opts):
+        """
+        Function to create the colorbar axes next to a map axes.
+        Credit: https://stackoverflow.com/questions/30030328/correct-placement-of-colorbar-relative-to-geo-axes-cartopy
+        -- Inputs:
+            - ax: Cartopy GeoAxes
+            - opts: Dictionary containing plotting options (after defaults have been set)
+        -- Output:
+            - cax: Matplotlib axes, or None if the colorbar location is not supported
+        """
+        # The offsets are fractions of the size of a plot without panels, so they are scaled to the actual figure
+        fig_w, fig_h = self.fig.get_size_inches()
+        scale_w = opts['figsize'][0] / fig_w
+        scale_h = opts['figsize'][1] / fig_h
+        posn = ax.get_position()
+        cbar_loc = opts['cbar_loc']
+        if cbar_loc == 'bottom':
+            self.cbar_orientation = 'horizontal'
+            offset, size = cbar_offsets['bottom']
+            return self.fig.add_axes([posn.x0, posn.y0-offset*scale_h, posn.width, size*scale_h])
+        elif cbar_loc == 'right':
+            self.cbar_orientation = 'vertical'
+            offset, size = cbar_offsets['right']
+            return self.fig.add_axes([posn.x0+posn.width+offset*scale_w, posn.y0, size*scale_w, posn.height])
+        return None
+
+    def clear_frame(self):
+        """
+        Procedure to remove the artists of the previous frame (contours, filled markers, barbs, legend, colorbar).
+        """
+        for artist in self.frame_artists:
+            artist.remove()
+        self.frame_artists = []
+        for cax, cax_posn in zip(self.caxes, self.cax_posns):
+            if cax is None:
+                continue
+            # A colorbar wraps its axes locator to make room for the extend triangles, so undo that as well
+            cax.clear()
+            cax.set_axes_locator(None)
+            cax.set_position(cax_posn)
+
+    def map_plot(self, opts):
+        """
+        Function to draw one frame with the same plotting options as map_funcs.map_plot and save it to a file.
+        -- Input:
+            - opts: Dictionary containing plotting options (static options must match those of this renderer)
+        -- Output:
+            - generates a plot saved to opts['fname']
+            - image: Future of the image being written by opts['image_writer'] (see map_funcs.map_plot), or None
+        """
+        set_map_opts_defaults(opts)
+        with mpl.rc_context(self.rc):
+            return self.draw_frame(opts)
+
+    def draw_frame(self, opts):
+        """
+        Function to replace the per-frame artists with those for a new set of plotting options and save the figure.
+        -- Input:
+            - opts: Dictionary containing plotting options (after defaults have been set)
+        -- Output:
+            - image: Future of the image being written by opts['image_writer'], or None if it was saved with savefig
+        """
+        fname = opts['fname']
+
+        print('-- Plotting ' + str(fname))
+        self.clear_frame()
+
+        # Each panel is drawn with the plotting options of the plot, updated with its own (fill_var, cmap, etc.)
+        # The times (title_r) of a plot with panels are drawn once under the suptitle instead of over each panel
+        if opts['panels'] is None:
+            self.draw_panel(self.axes[0], self.caxes[0], opts)
+        else:
+            for ax, cax, panel in zip(self.axes, self.caxes, opts['panels']):
+                panel_opts = dict(opts, title_r=None)
+                panel_opts.update(panel)
+                self.draw_panel(ax, cax, panel_opts)
+            self.times.set_text('' if opts['title_r'] is None else opts['title_r'])
+
+        # Add the overall plot title
+        if self.layout is None:
+            self.fig.suptitle(opts['suptitle'], y=opts['suptitle_y'])
+        else:
+            self.fig.suptitle(opts['suptitle'], y=self.layout['suptitle_y'])
+
+        # create output directory if it does not already exist
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+
+        # Save the figure (it stays open for the next frame); this is when all artists are actually rendered
+        if opts['image_writer'] is None:
+            with timing_funcs.stage('savefig'):
+                self.fig.savefig(fname)
+            return None
+        # Or only render it here, and leave the compression to the background threads of the image writer
+        with timing_funcs.stage('render'):
+            rgba = image_funcs.render_rgba(self.fig)
+        return opts['image_writer'].submit(rgba, fname)
+
+    def draw_panel(self, ax, cax, opts):
+        """
+        Procedure to draw the per-frame artists of one map (the data, data-filled markers, colorbar, titles, barbs,
+        and legend).
+        -- Inputs:
+            - ax: Cartopy GeoAxes
+            - cax: Matplotlib colorbar axes, or None
+            - opts: Dictionary containing plotting options (after defaults have been set)
+        """
+        fill_var = opts['fill_var']
+        lons = opts['lons']
+        lats = opts['lats']
+        cmap = opts['cmap']
+        bounds = opts['bounds']
+        norm = opts['norm']
+        extend = opts['extend']
+        fontsize = opts['fontsize']
+        map_x_thin = opts['map_x_thin']
+        map_y_thin = opts['map_y_thin']
+        u = opts['u']
+        v = opts['v']
+        lg_text = opts['lg_text']
+        data_crs = self.data_crs
+
+        # If lons & lats are 1D, make them into 2D arrays
+        if lons.ndim == 1 and lats.ndim == 1:
+            ll2d = np.meshgrid(lons, lats)
+            lons = ll2d[0]
+            lats = ll2d[1]
+
+        # Draw the actual filled contour plot
+        # NOTE: Sometimes a cartopy contourf plot may fail with a Shapely TopologicalError.
+        #       It appears to happen sometimes when projecting a dataset onto a different projection.
+        #       This error occurs more often if nans are present.
+        #       Replacing nans with scipy.interpolate.griddata solves some of these errors, but not all.
+        #       Interestingly, plt.contour still seems to work in these situations as a (suboptimal) workaround.
+        #       This bug occurs with Shapely 1.8.0, Cartopy 0.20.1.
+        #       This issue was resolved with Cartopy 0.20.2 (https://github.com/SciTools/cartopy/issues/1936).
+        # Using the transform_first argument results in a noticeable speed-up:
+        #    https://scitools.org.uk/cartopy/docs/latest/gallery/scalar_data/contour_transforms.html
+        #  - This also requires the X and Y variables to be 2-D arrays.
+        #  - This also resolves TopologyException: side location conflict errors that can occur when NaNs are present.
+
+        # The colorbar will inherit the norm/extend attributes from the contourf or scatter mappable
+        mappable = None
+        # If the variable has the same shape as lats, then plot the filled contour field
+        # If the grid has already been projected (proj_x & proj_y), contour directly in map coordinates
+        # In raster mode, color the grid cells instead of computing contour polygons (much faster on large grids)
+        if fill_var.shape == lats.shape and opts['render_mode'] == 'raster':
+            with timing_funcs.stage('raster'):
+                mappable = draw_raster(ax, fill_var, opts)
+            self.frame_artists.append(mappable)
+        elif fill_var.shape == lats.shape and opts['proj_x'] is not None and opts['proj_y'] is not None:
+            with timing_funcs.stage('contourf'):
+                mappable = ax.contourf(opts['proj_x'], opts['proj_y'], wrf.to_np(fill_var), bounds,
+                                       cmap=cmap, norm=norm, extend=extend, transform=opts['cart_proj'])
+            self.frame_artists.append(mappable)
+        elif fill_var.shape == lats.shape:
+            with timing_funcs.stage('contourf'):
+                mappable = ax.contourf(wrf.to_np(lons), wrf.to_np(lats), wrf.to_np(fill_var), bounds,
+                                       cmap=cmap, norm=norm, extend=extend, transform=data_crs, transform_first=True)
+            self.frame_artists.append(mappable)
+        # Otherwise, we presumably need to plot an empty map and then plot markers
+        elif opts['mark1_lon'] is None or opts['mark1_lat'] is None:
             print('ERROR: map_plot in map_funcs.py:')
             print('   var does not match the shape of lons or lats.')
             print('   If plotting a contour map, fix the mismatch in shape between fill_var and lons/lats.')
@@ -374,153 +887,201 @@ def map_plot(opts):
             print('   Exiting!')
             sys.exit()
 
-    # Optional: Add marker set 1 to the plot
-    if mark1_lon is not None and mark1_lat is not None:
-        if mark1_lat.shape != mark1_lon.shape:
-            print('ERROR: map_plot in map_funcs.py:')
-            print(       'mark1_lat and mark1_lon do not have the same shape.')
-            print('       Exiting!')
-            sys.exit()
-        if lg_text is None:
-            lg_lab1 = None
-        else:
-            lg_lab1 = lg_text[0]
-        if mark1_val_fill:
-            # Fill markers according to their data value, cmap, and norm
-            # NOTE: If plotting markers over a blank map, must use plt.scatter, not ax.scatter, to avoid an error about
-            #       the lack of a mappable when drawing the colorbar below.
-            if mark1_var.shape == mark1_lat.shape:
-                if contourf:
-                    ax.scatter(mark1_lon, mark1_lat, c=mark1_var, marker=mark1_style, s=mark1_size,
-                               edgecolors=mark1_edgecolor, label=lg_lab1, linewidths=mark1_width,
-                               cmap=cmap, norm=norm, transform=data_crs, zorder=mark1_zorder)
-                else:
-                    plt.scatter(mark1_lon, mark1_lat, c=mark1_var, marker=mark1_style, s=mark1_size,
-                                edgecolors=mark1_edgecolor, label=lg_lab1, linewidths=mark1_width,
-                                cmap=cmap, norm=norm, transform=data_crs, zorder=mark1_zorder)
-            else:
+        # Optional: Add marker sets filled according to their data value, cmap, and norm
+        for mm in [1, 2]:
+            mark = 'mark' + str(mm) + '_'
+            mark_lon = opts[mark + 'lon']
+            mark_lat = opts[mark + 'lat']
+            mark_var = opts[mark + 'var']
+            if mark_lon is None or mark_lat is None or not opts[mark + 'val_fill']:
+                continue
+            if mark_var is None or mark_var.shape != mark_lat.shape:
                 print('ERROR: map_plot in map_funcs.py:')
-                print('       mark1_var, mark1_lat, and mark1_lon are not all the same shape.')
+                print('       ' + mark + 'var, ' + mark + 'lat, and ' + mark + 'lon are not all the same shape.')
                 print('       Exiting!')
                 sys.exit()
-        # Marker set 1 not filled by any data values
-        else:
-            ax.scatter(mark1_lon, mark1_lat, marker=mark1_style, s=mark1_size, color=mark1_color,
-                       edgecolors=mark1_edgecolor, label=lg_lab1, linewidths=mark1_width,
-                       transform=data_crs, zorder=mark1_zorder)
+            if lg_text is None:
+                lg_lab = None
+            else:
+                lg_lab = lg_text[mm-1]
+            scatter = ax.scatter(mark_lon, mark_lat, c=mark_var, marker=opts[mark + 'style'], s=opts[mark + 'size'],
+                                 edgecolors=opts[mark + 'edgecolor'], label=lg_lab, linewidths=opts[mark + 'width'],
+                                 cmap=cmap, norm=norm, transform=data_crs, zorder=opts[mark + 'zorder'])
+            self.frame_artists.append(scatter)
+            if mappable is None:
+                mappable = scatter
 
-    # Optional: Add marker set 2 to the plot
-    if mark2_lon is not None and mark2_lat is not None:
-        if mark2_lat.shape != mark2_lon.shape:
-            print('ERROR: map_plot in map_funcs.py:')
-            print(       'mark2_lat and mark2_lon do not have the same shape.')
-            print('       Exiting!')
-            sys.exit()
-        if lg_text is None:
-            lg_lab2 = None
-        else:
-            lg_lab2 = lg_text[1]
-        # Marker set 2 filled by data values
-        if mark2_val_fill:
-            # Fill markers according to their data value, cmap, and norm
-            # NOTE: If plotting markers over a blank map, must use plt.scatter, not ax.scatter, to avoid an error about
-            #       the lack of a mappable when drawing the colorbar below.
-            if mark2_var.shape == mark2_lat.shape:
-                if contourf:
-                    ax.scatter(mark2_lon, mark2_lat, c=mark2_var, marker=mark2_style, s=mark2_size,
-                               edgecolors=mark2_edgecolor, label=lg_lab2, linewidths=mark2_width,
-                               cmap=cmap, norm=norm, transform=data_crs, zorder=mark2_zorder)
-                else:
-                    plt.scatter(mark2_lon, mark2_lat, c=mark2_var, marker=mark2_style, s=mark2_size,
-                                edgecolors=mark2_edgecolor, label=lg_lab2, linewidths=mark2_width,
-                                cmap=cmap, norm=norm, transform=data_crs, zorder=mark2_zorder)
+        # Draw the colorbar
+        if cax is not None and mappable is not None:
+            with timing_funcs.stage('colorbar'):
+                self.fig.colorbar(mappable, cax=cax, orientation=self.cbar_orientation, label=opts['cbar_lab'])
+
+        # Optional: Add titles to the subplot (blank out any titles left over from the previous frame)
+        for loc in ['left', 'right', 'center']:
+            title = opts['title_' + loc[0]]
+            ax.set_title('' if title is None else title, fontsize=fontsize, loc=loc)
+
+        # Optional: Draw wind barbs
+        if u is not None and v is not None:
+            if opts['barb_index'] is not None:
+                # One gather of the precomputed barb points (see get_barb_index) for each of the lat/lon & winds
+                barb_index = opts['barb_index']
+                x_thin = np.asarray(lons).ravel()[barb_index]
+                y_thin = np.asarray(lats).ravel()[barb_index]
+                u_thin = np.ravel(u)[barb_index]
+                v_thin = np.ravel(v)[barb_index]
             else:
-                print('ERROR: map_plot in map_funcs.py:')
-                print('       mark2_var, mark2_lat, and mark2_lon are not all the same shape.')
-                print('       Exiting!')
-                sys.exit()
-        # Marker set 2 not filled by data values
-        else:
-            ax.scatter(mark2_lon, mark2_lat, marker=mark2_style, s=mark2_size, color=mark2_color,
-                       edgecolors=mark2_edgecolor, label=lg_lab2, linewidths=mark2_width,
-                       transform=data_crs, zorder=mark1_zorder)
-
-    # Draw the colorbar
-    # Credit: https://stackoverflow.com/questions/30030328/correct-placement-of-colorbar-relative-to-geo-axes-cartopy
-    # Create colorbar axes (temporarily) anywhere
-    cax = fig.add_axes([0, 0, 0.1, 0.1])
-    # Find the location of the main plot axes
-    posn = ax.get_position()
-    # Adjust the positioning and orientation of the colorbar, and then draw it
-    # The colorbar will inherit the norm/extend attributes from the plt.contourf or plt.scatter call above
-    if cbar_loc == 'bottom':
-        cax.set_position([posn.x0, posn.y0-0.09, posn.width, 0.05])
-        plt.colorbar(cax=cax, orientation='horizontal', label=cbar_lab)
-    elif cbar_loc == 'right':
-        cax.set_position([posn.x0+posn.width+0.05, posn.y0, 0.04, posn.height])
-        plt.colorbar(cax=cax, orientation='vertical', label=cbar_lab)
-    elif cbar_loc == 'top' or cbar_loc == 'left':
-        print('WARNING: cbar_loc=' + cbar_loc + ' requested. Unsupported option. Colorbar will not be drawn.')
-        print('   Add directives in map_funcs.map_plot to handle that option and draw the colorbar.')
-
-    # Add the overall plot title
-    plt.suptitle(suptitle, y=suptitle_y)
-
-    # Optional: Add titles to the subplot
-    if title_l is not None:
-        ax.set_title(title_l, fontsize=fontsize, loc='left')
-    if title_r is not None:
-        ax.set_title(title_r, fontsize=fontsize, loc='right')
-    if title_c is not None:
-        ax.set_title(title_c, fontsize=fontsize, loc='center')
-
-    # Optional: Add set 1 of text labels to the plot
-    if text1_lab is not None and text1_lat is not None and text1_lon is not None:
-        if len(text1_lab) != len(text1_lat) or len(text1_lab) != len(text1_lon):
-            print('ERROR: map_plot in map_funcs.py:')
-            print('       text1_lab, text1_lat, and text1_lon do not all have the same length.')
-            print('       Exiting!')
-            sys.exit()
-        n_text = len(text1_lab)
-        for xx in range(n_text):
-            ax.text(text1_lon[xx], text1_lat[xx], text1_lab[xx], horizontalalignment='center',
-                    transform=data_crs, size=fontsize, zorder=13, weight=text1_lab_wt)
-
-    # Optional: Add set 2 of text labels to the plot
-    if text2_lab is not None and text2_lat is not None and text2_lon is not None:
-        if len(text2_lab) != len(text2_lat) or len(text2_lab) != len(text2_lon):
-            print('ERROR: map_plot in map_funcs.py:')
-            print('       text2_lab, text2_lat, and text2_lon do not all have the same length.')
-            print('       Exiting!')
-            sys.exit()
-        n_text = len(text2_lab)
-        for xx in range(n_text):
-            ax.text(text2_lon[xx], text2_lat[xx], text2_lab[xx], horizontalalignment='center',
-                    transform=data_crs, size=fontsize, zorder=14, weight=text2_lab_wt)
-
-    # Optional: Draw wind barbs
-    if u is not None and v is not None:
-        if isinstance(lons, np.ndarray):
-            x_thin = lons[::map_y_thin, ::map_x_thin]
-        else:
-            x_thin = lons[::map_y_thin, ::map_x_thin].values
-        if isinstance(lats, np.ndarray):
-            y_thin = lats[::map_y_thin, ::map_x_thin]
-        else:
-            y_thin = lats[::map_y_thin, ::map_x_thin].values
-        u_thin = u[::map_y_thin, ::map_x_thin]
-        v_thin = v[::map_y_thin, ::map_x_thin]
-        # Assume winds input to here are in m/s instead of kts, so reduce the barb_increments from 5/10/50 to 2.5/5/25
-        ax.barbs(x_thin, y_thin, u_thin, v_thin, length=5, transform=data_crs, linewidth=barb_width,
-                 barb_increments={'half': 2.5, 'full': 5, 'flag': 25})
-
-    # Optional: Add a legend (most useful if 2+ sets of markers)
-    if lg_text is not None:
-        ax.legend(loc=lg_loc, fontsize=lg_fontsize).set_zorder(15)
-
-    # create output directory if it does not already exist
-    os.makedirs(os.path.dirname(fname), exist_ok=True)
-
-    # Save and close the figure
-    plt.savefig(fname)
-    plt.close()
+                if isinstance(lons, np.ndarray):
+                    x_thin = lons[::map_y_thin, ::map_x_thin]
+                else:
+                    x_thin = lons[::map_y_thin, ::map_x_thin].values
+                if isinstance(lats, np.ndarray):
+                    y_thin = lats[::map_y_thin, ::map_x_thin]
+                else:
+                    y_thin = lats[::map_y_thin, ::map_x_thin].values
+                u_thin = u[::map_y_thin, ::map_x_thin]
+                v_thin = v[::map_y_thin, ::map_x_thin]
+            # Assume winds input to here are in m/s instead of kts, so reduce the barb_increments from 5/10/50 to 2.5/5/25
+            with timing_funcs.stage('barbs'):
+                barbs = ax.barbs(x_thin, y_thin, u_thin, v_thin, length=5, transform=data_crs,
+                                 linewidth=opts['barb_width'], barb_increments={'half': 2.5, 'full': 5, 'flag': 25})
+            self.frame_artists.append(barbs)
+
+        # Optional: Add a legend (most useful if 2+ sets of markers)
+        if lg_text is not None:
+            legend = ax.legend(loc=opts['lg_loc'], fontsize=opts['lg_fontsize'])
+            legend.set_zorder(15)
+            self.frame_artists.append(legend)
+
+    def close(self):
+        """
+        Procedure to close the figure of this renderer.
+        """
+        plt.close(self.fig)
+
+def get_map_renderer(opts):
+    """
+    Function to get the persistent MapRenderer for a set of map plotting options, creating it if needed.
+    -- Input:
+        - opts: Dictionary containing plotting options (after defaults have been set)
+    -- Output:
+        - renderer: MapRenderer object
+    """
+    key = get_renderer_key(opts)
+    if key not in map_renderers:
+        map_renderers[key] = MapRenderer(opts)
+    return map_renderers[key]
+
+def close_map_renderers():
+    """
+    Procedure to close all persistent MapRenderer figures in this process.
+    """
+    for renderer in map_renderers.values():
+        renderer.close()
+    map_renderers.clear()
+
+def map_plot(opts):
+    """
+    Function to make a map plot with filled contours using matplotlib and Cartopy.
+    Optionally overlays the map with wind barbs, markers, text labels, a polygon, or cross-section path.
+    -- Input:
+        - opts: Dictionary containing plotting options
+            Required keys:
+            - fname: string or pathlib object specifying the output file name
+            - fill_var: 2D variable array to be plotted with filled contours
+            - suptitle: string for overall plot title (usually one line)
+            - cbar_lab: string for colorbar label (e.g., 'Wind Speed [m/s]')
+            - cart_proj: Cartopy object, map projection
+            - lons: 1D or 2D array of longitude values
+            - lats: 1D or 2D array of latitude values
+            - cmap: Matplotlib colormap
+            - bounds: Matplotlib colormap bounds
+            - norm: matplotlib colormap norm
+            Optional keys:
+            - cart_xlim: Cartopy object, x-axis limits
+            - cart_ylim: Cartopy object, y-axis limits
+            - extend: string for colorbar caps ('max', 'min', 'both' [default])
+            - fontsize: integer, base fontsize (default: 14)
+            - figsize: 2D tuple, defining the figure size (default: (10, 8))
+            - cbar_loc: string, identifier for positioning of the colorbar ('bottom' [default], 'top', 'right', 'left')
+            - borders, states, oceans, lakes, rivers, land: Cartopy feature objects for the map
+            - border_width: numerical line thickness for national borders & coastlines (default: 1.5)
+            - water_color: string defining water color for the map (default: 'none' [transparent])
+            - lat_labels: array of latitude values to label explicitly on the map
+            - lon_labels: array of longitude values to label explicitly on the map
+            - suptitle_y: float, y-axis position of the suptitle (default: 0.95)
+            - title_l: string, plot subtitle (1 or 2 lines) that gets placed above the top-left corner of the plot axes
+            - title_r: string, plot subtitle (1 or 2 lines) that gets placed above the top-right corner of the plot axes
+            - title_c: string, plot subtitle (1 or 2 lines) that gets placed above the center of the plot axes
+            - map_x_thin: integer, thin wind barb location overlays in x-direction (every Nth grid point) (default: 25)
+            - map_y_thin: integer, thin wind barb location overlays in y-direction (every Nth grid point) (default: 25)
+            - barb_index: 1D array of the flat indices of the grid points to draw wind barbs at, instead of thinning
+                them with map_x_thin & map_y_thin (see get_barb_index) (default: None)
+            - barb_width: float, linewidth of wind barbs (default: 0.25)
+            - u: array-like, define the barb directions
+            - v: array-like, define the barb directions
+            - proj_x: 2D array of the lons/lats grid projected to cart_proj x coordinates (see get_projected_coords)
+            - proj_y: 2D array of the lons/lats grid projected to cart_proj y coordinates (see get_projected_coords)
+            - render_mode: string, 'contourf' to draw fill_var as filled contours (default), or 'raster' to color
+                each grid cell with the same cmap & norm (see draw_raster), which is much faster on large grids
+            - mark1_lon: array of longitude values for set 1 of markers
+            - mark1_lat: array of latitude values for set 1 of markers
+            - mark1_size: integer specifying marker size for set 1 of markers (default: 100)
+            - mark1_style: string specifying marker style for set 1 of markers (default: 'o')
+            - mark1_color: string specifying the marker color for set 1 of markers
+            - mark1_edgecolor: string specifying the marker edge color for set 1 of markers (default: 'black')
+            - mark1_width: float specifying linewidth for set 1 of markers
+            - mark1_val_fill: boolean flag to fill set 1 of markers from data value, cmap, and norm (default: False)
+            - mark1_var: variable containing data to fill in set 1 of markers (e.g., plot obs station data)
+            - mark1_zorder: integer indicator of the Matplotlib draw order for set 1 of markers (default: 10)
+            - mark2_lon: array of longitude values for set 2 of markers
+            - mark2_lat: array of latitude values for set 2 of markers
+            - mark2_size: integer specifying marker size for set 2 of markers (default: 100)
+            - mark2_style: string specifying marker style for set 2 of markers (default: 'o')
+            - mark2_color: string specifying the marker color for set 2 of markers
+            - mark2_edgecolor: string specifying the marker edge color for set 2 of markers (default: 'black')
+            - mark2_width: float specifying linewidth for set 2 of markers
+            - mark2_val_fill: boolean flag to fill set 2 of markers from data value, cmap, and norm (default: False)
+            - mark2_var: variable containing data to fill in set 2 of markers (e.g., plot obs station data)
+            - mark2_zorder: integer indicator of the Matplotlib draw order for set 2 of markers (default: 11)
+            - text1_lat: array of floats for latitudes for set 1 of text
+            - text1_lon: array of floats for longitudes for set 1 of text
+            - text1_lab: array of strings for labels for set 1 of text
+            - text1_lab_wt: numeric or string indicating font weight for set 1 of text (default: 'normal')
+            - text2_lat: array of floats for latitudes for set 2 of text
+            - text2_lon: array of floats for longitudes for set 2 of text
+            - text2_lab: array of strings for labels for set 2 of text
+            - text2_lab_wt: numeric or string indicating font weight for set 2 of text (default: 'normal')
+            - lg_text: array of legend labels
+            - lg_loc: string, defining legend placement
+            - lg_fontsize: integer fontsize for legend labels
+            - basemap_cache: boolean, reuse a pre-rendered image of the static map layers (features, coastlines,
+                and unfilled set 1 markers) for every plot with the same projection, extent, and features, instead
+                of drawing them each time (default: False)
+            - reuse_figure: boolean, draw the plot with a persistent MapRenderer that keeps the figure, map axes,
+                and colorbar axes alive between calls with the same static map options, instead of creating and
+                closing a new figure for every plot (default: False)
+            - panels: list of dictionaries, one per map panel of the plot, each with the options that differ between
+                panels (e.g., fill_var, cmap, bounds, norm, extend, cbar_lab, title_l, u, v); all panels share the
+                other options, including the projection, static map layers, and suptitle; each map is the size of the
+                map of a plot without panels, and title_r is drawn once under the suptitle (see get_panel_layout)
+                (default: None, a single map)
+            - panel_cols: integer, number of columns of panels, filled in row by row (default: 2)
+            - image_writer: image_funcs.ImageWriter, render the plot into a pixel buffer and let the writer encode it
+                to fname in a background thread, in its image format (default: None, save it with savefig); or an
+                anim_funcs.AnimationWriter, to add the plot as the next frame of its animation instead
+    -- Output:
+        - generates a plot saved to fname
+        - image: concurrent.futures.Future of the image being written by image_writer, whose result is a dictionary
+            with its size in bytes and encoding time (see image_funcs.encode_image), or None without image_writer
+    """
+    # Set default values for optional dictionary entries
+    set_map_opts_defaults(opts)
+
+    # Draw into the persistent renderer for this domain, or into a new figure that is closed afterwards
+    if opts['reuse_figure']:
+        return get_map_renderer(opts).map_plot(opts)
+    renderer = MapRenderer(opts)
+    image = renderer.map_plot(opts)
+    renderer.close()
+    return image
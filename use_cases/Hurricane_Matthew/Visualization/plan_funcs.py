@@ -0,0 +1,312 @@
+"""
+plan_funcs.py
+
+This file contains functions to read a plot plan (a YAML file listing the map products to make from WRF output,
+see plot_plan.yaml), and to compile it into the minimal set of raw variables and levels to read from each file.
+"""
+
+import yaml
+import numpy as np
+import matplotlib as mpl
+
+import map_funcs
+import wrf_funcs
+
+# Keys of a product in the plot plan, with their default values (required keys have no default)
+product_defaults = {
+    'stream': 'wrfout', 'level': None, 'scale': None, 'offset': None, 'mask_le': None, 'cbar_label': None,
+    'cmap': None, 'cmap_range': None, 'colors': None, 'extend': 'both', 'barbs': None, 'barbs_label': None,
+    'static': False, 'skip_first_time': False, 'render_mode': None, 'interval_h': None,
+}
+product_required = ['name', 'field', 'label', 'units', 'bounds']
+
+# Keys of a multi-panel plot in the plot plan, with their default values (required keys have no default)
+panel_defaults = {'cols': 2, 'separate': True}
+panel_required = ['name', 'products']
+
+def read_plot_plan(plan_fname):
+    """
+    Function to read and check a plot plan.
+    -- Input:
+        - plan_fname: string or pathlib object, YAML plot plan file name
+    -- Output:
+        - products: list of product dictionaries, in plotting order, with defaults filled in for optional keys,
+                    followed by the multi-panel plots (see read_panel_plan); the panels key of each product is None
+    """
+    with open(plan_fname, 'r') as f:
+        plan = yaml.safe_load(f)
+    if not isinstance(plan, dict) or not isinstance(plan.get('products'), list):
+        raise ValueError('Plot plan ' + str(plan_fname) + ' needs a list of products')
+
+    products = []
+    for entry in [level_entry for entry in plan['products'] for level_entry in expand_levels(entry)]:
+        product = dict(product_defaults)
+        product.update(entry)
+        name = str(product.get('name'))
+        unknown = [key for key in product if key not in product_defaults and key not in product_required]
+        missing = [key for key in product_required if product.get(key) is None]
+        if len(unknown) > 0:
+            raise ValueError('Unknown key(s) for product ' + name + ': ' + ', '.join(unknown))
+        if len(missing) > 0:
+            raise ValueError('Missing key(s) for product ' + name + ': ' + ', '.join(missing))
+        if name in [prod['name'] for prod in products]:
+            raise ValueError('Product ' + name + ' is listed more than once')
+        if product['stream'] not in wrf_funcs.level_coords:
+            raise ValueError('Unknown stream for product ' + name + ': ' + str(product['stream']))
+        if (product['stream'] == 'wrfout') != (product['level'] is None):
+            raise ValueError('Product ' + name + ' needs a level if and only if its stream is zlev or plev')
+        if (product['cmap'] is None) == (product['colors'] is None):
+            raise ValueError('Product ' + name + ' needs either cmap or colors')
+        if len(product['bounds']) != 3:
+            raise ValueError('Bounds for product ' + name + ' should be [min, max, interval]')
+        if product['render_mode'] not in [None, 'contourf', 'raster']:
+            raise ValueError('Render mode for product ' + name + ' should be contourf or raster')
+        if product['barbs'] not in [None, 'sfc', 'upr']:
+            raise ValueError('Barbs for product ' + name + ' should be sfc or upr')
+        if product['barbs'] == 'upr' and product['stream'] == 'wrfout':
+            raise ValueError('Upper-air barbs for product ' + name + ' need a zlev or plev stream')
+        if product['interval_h'] is not None:
+            if product['stream'] != 'wrfout' or product['field'] not in wrf_funcs.accum_fields:
+                raise ValueError('Product ' + name + ' needs an accumulated field (' +
+                                 ', '.join(wrf_funcs.accum_fields) + ') for interval_h')
+            if not product['interval_h'] > 0:
+                raise ValueError('Interval for product ' + name + ' should be more than 0 hours')
+        product['panels'] = None
+        products.append(product)
+
+    return read_panel_plan(plan_fname, plan.get('panels'), products)
+
+def expand_levels(entry):
+    """
+    Function to expand a product entry of the plot plan with a list of levels (e.g., the 80, 100, and 200-m wind
+    speed) into one entry per level, each with {level} in its name and labels replaced by the level (see
+    get_level_label). All levels of the same variable are read from a file in one pass (see wrf_funcs.read_fields).
+    -- Input:
+        - entry: dictionary, product entry of the plot plan
+    -- Output:
+        - entries: list of dictionaries, the entry itself if its level is not a list
+    """
+    if not isinstance(entry.get('level'), list):
+        return [entry]
+    name = str(entry.get('name'))
+    if '{level}' not in name:
+        raise ValueError('Product ' + name + ' has a list of levels, so its name needs {level}')
+    entries = []
+    for level in entry['level']:
+        level_label = get_level_label(entry.get('stream', product_defaults['stream']), level)
+        level_entry = dict(entry, level=level)
+        for key in ['name', 'label', 'cbar_label', 'barbs_label']:
+            if isinstance(level_entry.get(key), str):
+                level_entry[key] = level_entry[key].replace('{level}', level_label)
+        entries.append(level_entry)
+    return entries
+
+def get_level_label(stream, level):
+    """
+    Function to get the label of a level of the zlev/plev streams: the height [m] of a Z_ZL level (negative values
+    are heights above ground), or the pressure [hPa] of a P_PL level.
+    -- Inputs:
+        - stream: string, 'zlev' or 'plev'
+        - level: float, Z_ZL [m] or P_PL [Pa] value
+    -- Output:
+        - label: string, e.g., '100' for Z_ZL -100 or '500' for P_PL 50000
+    """
+    if stream == 'plev':
+        return f'{level / 100.0:g}'
+    return f'{abs(level):g}'
+
+def read_panel_plan(plan_fname, panel_entries, products):
+    """
+    Function to check the multi-panel plots of a plot plan, and turn each into a product whose panels are products
+    of the plan. A multi-panel plot draws its products as the panels of one figure, sharing one map, and reading
+    the fields of all its panels (e.g., the 10-m winds of their barbs) once.
+    -- Inputs:
+        - plan_fname: string or pathlib object, YAML plot plan file name (for error messages)
+        - panel_entries: list of dictionaries, the panels section of the plot plan (or None)
+        - products: list of product dictionaries of the plot plan (see read_plot_plan)
+    -- Output:
+        - products: list of product dictionaries, without the products only plotted as panels (separate: false),
+                    followed by a product for each multi-panel plot, with the keys of a product (static if all its
+                    panels are static, skip_first_time if any of its panels is skipped at the first time), and:
+            - panels: list of the product dictionaries of its panels
+            - cols: integer, number of columns of panels
+    """
+    if panel_entries is None:
+        return products
+    if not isinstance(panel_entries, list):
+        raise ValueError('Plot plan ' + str(plan_fname) + ' needs a list of panels')
+
+    products_by_name = {product['name']: product for product in products}
+    panel_only = []
+    panel_products = []
+    for entry in panel_entries:
+        entry = dict(panel_defaults, **entry)
+        name = str(entry.get('name'))
+        unknown = [key for key in entry if key not in panel_defaults and key not in panel_required]
+        missing = [key for key in panel_required if entry.get(key) is None]
+        if len(unknown) > 0:
+            raise ValueError('Unknown key(s) for panels ' + name + ': ' + ', '.join(unknown))
+        if len(missing) > 0:
+            raise ValueError('Missing key(s) for panels ' + name + ': ' + ', '.join(missing))
+        if name in products_by_name or name in [prod['name'] for prod in panel_products]:
+            raise ValueError('Panels ' + name + ' has the name of another product or panels')
+        unknown = [str(prod_name) for prod_name in entry['products'] if prod_name not in products_by_name]
+        if len(unknown) > 0:
+            raise ValueError('Unknown product(s) for panels ' + name + ': ' + ', '.join(unknown))
+        if len(entry['products']) < 2:
+            raise ValueError('Panels ' + name + ' needs at least 2 products')
+        if int(entry['cols']) < 1:
+            raise ValueError('Number of columns for panels ' + name + ' should be at least 1')
+
+        panels = [products_by_name[prod_name] for prod_name in entry['products']]
+        product = dict(product_defaults)
+        product.update({
+            'name': name, 'field': None, 'label': ', '.join(panel['label'] for panel in panels),
+            'units': None, 'bounds': None, 'panels': panels, 'cols': int(entry['cols']),
+            'static': all(panel['static'] for panel in panels),
+            'skip_first_time': any(panel['skip_first_time'] for panel in panels),
+        })
+        panel_products.append(product)
+        if not entry['separate']:
+            panel_only = panel_only + entry['products']
+
+    return [product for product in products if product['name'] not in panel_only] + panel_products
+
+def get_product_field_key(product):
+    """
+    Function to get the key of the field of a product among the fields read for a valid time. Interval accumulations
+    are keyed by the accumulated field and the interval (e.g., rain_3h), as they are computed from that field.
+    -- Input:
+        - product: product dictionary (see read_plot_plan)
+    -- Output:
+        - key: (stream, field, level) tuple
+    """
+    if product['interval_h'] is None:
+        return (product['stream'], product['field'], product['level'])
+    return (product['stream'], get_interval_field(product['field'], product['interval_h']), product['level'])
+
+def get_interval_field(field, interval_h):
+    """
+    Function to get the name of the interval accumulation of a field (e.g., rain_3h for 3-h rain).
+    -- Inputs:
+        - field: string, accumulated field (see wrf_funcs.accum_fields)
+        - interval_h: float, interval [h]
+    -- Output:
+        - name: string
+    """
+    return field + '_' + f'{interval_h:g}' + 'h'
+
+def get_product_fields(product, barbs):
+    """
+    Function to get the fields that are read to plot a product.
+    -- Inputs:
+        - product: product dictionary (see read_plot_plan)
+        - barbs: string, wind barbs overlaid on the plot ('sfc', 'upr', or None)
+    -- Output:
+        - fields: list of (stream, field, level) tuples
+    """
+    fields = [(product['stream'], product['field'], product['level'])]
+    if barbs == 'sfc':
+        fields = fields + [('wrfout', wind_var, None) for wind_var in wrf_funcs.wind_vars['wrfout']]
+    elif barbs == 'upr':
+        stream = product['stream']
+        fields = fields + [(stream, wind_var, product['level']) for wind_var in wrf_funcs.wind_vars[stream]]
+    return fields
+
+def get_read_plan(product_fields):
+    """
+    Function to compile the fields of several products into the set of fields to read from each stream, so that
+    fields shared between products (e.g., the 10-m winds for barbs) are only read once.
+    -- Input:
+        - product_fields: list with a list of (stream, field, level) tuples for each product (see get_product_fields)
+    -- Output:
+        - read_plan: dictionary of stream to list of (field, level) tuples, each listed once in order of first use
+    """
+    read_plan = {}
+    for fields in product_fields:
+        for stream, field, level in fields:
+            stream_fields = read_plan.setdefault(stream, [])
+            if (field, level) not in stream_fields:
+                stream_fields.append((field, level))
+    return read_plan
+
+def get_read_inputs(stream, stream_fields):
+    """
+    Function to get the raw variables (and levels) read from a stream for a list of fields, each listed once.
+    -- Inputs:
+        - stream: string, 'wrfout', 'zlev', or 'plev'
+        - stream_fields: list of (field, level) tuples
+    -- Output:
+        - inputs: list of (raw variable name, level) tuples
+    """
+    inputs = []
+    for field, level in stream_fields:
+        for raw_input in wrf_funcs.get_field_inputs(stream, field, level):
+            if raw_input not in inputs:
+                inputs.append(raw_input)
+    return inputs
+
+def estimate_read_bytes(ds_by_stream, product_fields):
+    """
+    Function to estimate the number of bytes read from each stream to plot a set of products at one valid time,
+    from the shapes of the variables in a sample file of each stream (without reading them).
+    -- Inputs:
+        - ds_by_stream: dictionary of stream to netCDF4 Dataset of a sample file (streams may be missing)
+        - product_fields: list with a list of (stream, field, level) tuples for each product (see get_product_fields)
+    -- Output:
+        - read_bytes: dictionary of stream to a dictionary with the keys:
+            - bytes_read: integer, number of bytes read following the read plan
+            - bytes_baseline: integer, number of bytes read if each product read all its inputs in full
+    """
+    read_bytes = {}
+    for stream, stream_fields in get_read_plan(product_fields).items():
+        if stream not in ds_by_stream:
+            continue
+        ds_wrf_nc = ds_by_stream[stream]
+        bytes_read = sum(wrf_funcs.get_input_bytes(ds_wrf_nc, raw_var, level)
+                         for raw_var, level in get_read_inputs(stream, stream_fields))
+        bytes_baseline = 0
+        for fields in product_fields:
+            for fld_stream, field, level in fields:
+                if fld_stream == stream:
+                    bytes_baseline += sum(wrf_funcs.get_input_bytes(ds_wrf_nc, raw_var)
+                                          for raw_var, _ in wrf_funcs.get_field_inputs(stream, field, level))
+        read_bytes[stream] = {'bytes_read': bytes_read, 'bytes_baseline': bytes_baseline}
+    return read_bytes
+
+def print_read_plan(read_plan):
+    """
+    Procedure to print the raw variables (and levels) that a read plan reads from each stream.
+    -- Input:
+        - read_plan: dictionary of stream to list of (field, level) tuples (see get_read_plan)
+    """
+    for stream, stream_fields in read_plan.items():
+        inputs = []
+        for raw_var, level in get_read_inputs(stream, stream_fields):
+            if level is None:
+                inputs.append(raw_var)
+            else:
+                inputs.append(raw_var + '[' + f'{level:g}' + ']')
+        print('   ' + stream + ': ' + ', '.join(inputs))
+
+def get_product_cmap(product):
+    """
+    Function to get the colormap, contour levels, and colormap norm to plot a product.
+    -- Input:
+        - product: product dictionary (see read_plot_plan)
+    -- Outputs:
+        - cmap: Matplotlib colormap
+        - bounds: array of contour levels
+        - norm: Matplotlib colormap norm
+    """
+    bounds = np.arange(*product['bounds'])
+    extend = product['extend']
+    if product['colors'] is not None:
+        colors = np.array(product['colors'], np.float32) / 255.0
+        cmap, norm = mpl.colors.from_levels_and_colors(bounds, colors, extend=extend)
+        return cmap, bounds, norm
+    cmap = mpl.colormaps[product['cmap']]
+    if product['cmap_range'] is not None:
+        cmap = map_funcs.truncate_cmap(cmap, minval=product['cmap_range'][0], maxval=product['cmap_range'][1])
+    norm = mpl.colors.BoundaryNorm(bounds, cmap.N, extend=extend)
+    return cmap, bounds, norm
@@ -8,180 +8,634 @@ Written on: 13 May 2024
 """
 
 import sys
+import os
+import time
+import json
+import pickle
+import hashlib
 import argparse
+import traceback
+import collections
+import concurrent.futures
 import pathlib
 import datetime as dt
 import numpy as np
 import pandas as pd
-import netCDF4
 import wrf
-import matplotlib as mpl
+import yaml
 
-# Import functions from a local file
+# Import functions from local files
+import anim_funcs
+import diag_funcs
+import image_funcs
 import map_funcs
-
-# def main(init_dt_first, init_dt_last, init_stride_h, plot_beg_lead_time, plot_end_lead_time, plot_stride, domain, exp_name):
-def main(script_config_opts):
-    # ==============
-    # USER SETTINGS:
-    # ==============
-
-    # Default plot type selection
-    plot_type = 'png'
-    # plot_maps = True        # Plot 2D maps
-    plot_subdomain = False  # Plot specified subdomain to zoom in on a defined area of interest
-    plot_stations = True     # Plot station markers & labels on the map (e.g., cities of interest)
-
-    # Which variables should be plotted?
-    plot_TERRAIN = True     # terrain height [m]
-    plot_T2 = True          # 2-m temperature [C]
-    plot_RH2 = True         # 2-m relative humidity [%]
-    plot_SLP = True         # sea level pressure [hPa] (NOTE: this requires several other variables in the wrfout file)
-    plot_WS10 = True        # 10-m wind speed [m s-1]
-    plot_REFL = True        # simulated radar reflectivity [dBZ]
-    plot_RAIN = True        # total accumulated rainfall during the simulation [mm]
-    plot_WS100 = True       # 100-m wind speed [m s-1]
-    plot_GHT500 = True      # 500-hPa geopotential height [m]
-
-    # Plot any overlays, like wind barbs?
-    plot_wind_barbs_sfc = True  # overlay 10-m wind barbs for selected plots
-    plot_wind_barbs_upr = True  # overlay upper-air wind barbs for selected plots
-
-    # Default water color (generally use only in terrain plots)
-    water_color = 'lightblue'
-
-    # Set some other plot options
-    suptitle_y = 1.00
-    plot_fontsize = 13
-    barb_thin = 10
-    barb_width = 0.5
-
-    # Set some text labels for demonstration
-    if plot_stations:
-        text1_lab = ['Miami', 'Jacksonville', 'Charleston']
-        mark1_lat = np.asarray([25.7617, 30.3322, 32.7833])
-        mark1_lon = np.asarray([-80.1918, -81.6557, -79.9320])
-        text1_lat = np.asarray(mark1_lat) + np.asarray([-0.20, -0.20, -0.40])
-        text1_lon = np.asarray(mark1_lon) + np.asarray([1.50, 3.00, 2.70])
-        mark1_size = 36
-        mark1_color = 'black'
-
-    # Domain plotting ranges in (i,j) space (whole domain by default)
-    i_beg, i_end = 0, -1
-    j_beg, j_end = 0, -1
-    # TODO: Implement subdomain plotting
+import plan_funcs
+import station_funcs
+import tile_funcs
+import timing_funcs
+import wrf_funcs
+
+# ==============
+# USER SETTINGS:
+# ==============
+
+# Default plot type selection
+plot_type = 'png'        # Image format: 'png', 'webp', or 'jpeg' (file extension .png, .webp, or .jpg)
+png_compress_level = 6   # PNG zlib compression level, from 0 (fastest, largest files) to 9 (slowest, smallest)
+image_lossless = True    # WebP: lossless (True) or lossy (False)
+image_quality = 90       # Lossy WebP & JPEG quality (1-100); for lossless WebP, the compression effort
+encode_threads = 2       # Threads per process compressing images while the next plots are drawn (0: no threads)
+# plot_maps = True        # Plot 2D maps
+plot_subdomain = False  # Also plot the named zoom boxes (zoom_boxes below) to zoom in on areas of interest
+plot_stations = True     # Plot station markers & labels on the map (e.g., cities of interest)
+manifest_name = 'plot_manifest.json'  # per-cycle record of the inputs & options used for each plot (for reruns)
+follow_poll_s = 10       # --follow mode: seconds between checks for new wrfout files
+follow_settle_s = 30     # --follow mode: seconds a file's size must stay unchanged before it is considered complete
+cache_grid = True        # Keep the projected grid coordinates & map limits of each domain/zoom box in a cache file
+cache_basemap = True     # Draw the static map layers (features, coastlines, stations) once per domain and reuse them
+reuse_figure = True      # Keep one figure & map axes alive per domain in each process, only redrawing the data
+nc_max_open = 6          # Most WRF output files open at once in each process (at least 3; least recently used closed)
+nc_chunk_cache_mb = None # HDF5 chunk cache size per variable [MB] for the WRF output files (None: netCDF default)
+memory_budget_mb = None  # Memory [MB] per process to compute SLP & reflectivity in tiles of rows (None: in full)
+render_mode = 'contourf' # Draw fields as filled contours ('contourf') or color each grid cell ('raster')
+anim_type = 'gif'        # --animate: animation format, 'gif', 'webp', or 'mp4' (needs the ffmpeg program)
+anim_products = ['REFL', 'SLP']  # --animate: products to animate over all valid times (None: all non-static products)
+anim_fps = 4             # --animate: animation frames per second
+timing_fmt = 'jsonl'     # Record the time & memory use of each stage of each plot: 'jsonl', 'csv', or None (off)
+make_tiles = False       # Also cut each full-domain map into XYZ web map tiles (tiles/<domain>/<product>/<valid time>/)
+tile_zooms = (3, 7)      # Range of web map zoom levels of the tiles (each level doubles the resolution)
+timing_name = 'plot_timings'  # per-cycle file of stage records (with the timing_fmt extension), appended by each run
+station_file = None      # --stations: CSV file (columns name, lat, lon) of the stations (None: the stations on the map)
+station_products = ['T2', 'RH2', 'SLP', 'WS10', 'RAIN']  # --stations: products of the plot plan to extract
+station_interp = 'bilinear'  # --stations: value at each station from the 'nearest' grid point, or 'bilinear'
+station_format = 'csv'   # --stations: time series file format, 'csv' or 'parquet' (needs pyarrow or fastparquet)
+station_meteograms = 20  # --stations: number of stations (first in the list) to plot meteograms of (None: all)
+
+# Which variables should be plotted, and how? Each product (variable, input stream & level, colormap, contour levels,
+# overlays) is defined in the plot plan file (see plot_plan.yaml), which can be changed with -p/--plot_plan
+plot_plan_fname = pathlib.Path(__file__).parent.joinpath('plot_plan.yaml')
+
+# Plot any overlays, like wind barbs?
+plot_wind_barbs_sfc = True  # overlay 10-m wind barbs on products with barbs: sfc in the plot plan
+plot_wind_barbs_upr = True  # overlay upper-air wind barbs on products with barbs: upr in the plot plan
+
+# Default water color (generally use only in terrain plots)
+water_color = 'lightblue'
+
+# Set some other plot options
+# suptitle = 'Hurricane Matthew ' + em_dash + ' Domain ' + dom_num
+suptitle = 'Hurricane Matthew Test Case'
+suptitle_y = 1.00
+plot_fontsize = 13
+barb_thin = 10
+barb_spacing_km = 270.0  # distance between wind barbs on the map [km] (None: every barb_thin-th grid point)
+barb_width = 0.5
+
+# Set some text labels for demonstration
+if plot_stations:
+    text1_lab = ['Miami', 'Jacksonville', 'Charleston']
+    mark1_lat = np.asarray([25.7617, 30.3322, 32.7833])
+    mark1_lon = np.asarray([-80.1918, -81.6557, -79.9320])
+    text1_lat = np.asarray(mark1_lat) + np.asarray([-0.20, -0.20, -0.40])
+    text1_lon = np.asarray(mark1_lon) + np.asarray([1.50, 3.00, 2.70])
+    mark1_size = 36
+    mark1_color = 'black'
+
+# Domain plotting ranges in (i,j) space for the full-domain plots (whole domain by default)
+i_beg, i_end = 0, -1
+j_beg, j_end = 0, -1
+
+# Named zoom boxes [lat_min, lat_max, lon_min, lon_max], each plotted in addition to the full domain if plot_subdomain.
+# All fields, lat/lon, and wind barbs are cropped to the box (plus zoom_halo grid points on each side) before
+# plotting, so a zoom plot only costs as much as the area it covers.
+zoom_boxes = {
+    'Florida': [24.0, 31.5, -88.0, -79.5],
+    'Carolinas': [31.5, 37.0, -84.5, -75.0],
+}
+zoom_halo = 2       # extra grid points kept around each zoom box, so contours & barbs fill the map to its edges
+zoom_barb_thin = 4  # plot every Nth wind barb on zoom plots (zoom boxes cover fewer grid points than the domain)
+zoom_barb_spacing_km = 108.0  # distance between wind barbs on zoom plots [km] (None: every zoom_barb_thin-th point)
+
+lat_labels = [16, 18, 20, 22, 24, 26, 28, 30, 32, 34, 36, 38, 40]
+lon_labels = [-62, -64, -66, -68, -70, -72, -74, -76, -78, -80, -82, -84, -86, -88]
+
+# =======================================
+# CONSTANTS, FORMAT STATEMENTS, AND MORE:
+# =======================================
+
+G = 9.81  # graviational acceleration [m s-2]
+PI = 3.1415926
+DEG2RAD = PI / 180.0
+RAD2DEG = 180.0 / PI
+Rd = 297.048  # specific gas constant for dry air [J kg-1 K-1]
+Rv = 461.495  # specific gas constant for water vapor [J kg-1 K-1]
+C_to_K = 273.15  # additive conversion between degrees Celsius and Kelvin
+
+missing_val = -9999.0
+
+mpl_Wm2 = 'W $\mathregular{m^{-2}}$'
+mpl_ms1 = 'm $\mathregular{s^{-1}}$'
+mpl_s1 = '$\mathregular{s^{-1}}$'
+mpl_Jkg = 'J $\mathregular{kg^{-1}}$'
+mpl_um = u'\u03bcm'
+mpl_gkg1 = 'g $\mathregular{kg^{-1}}$'
+mpl_kgkg1 = 'kg $\mathregular{kg^{-1}}$'
+mpl_gm2s1 = 'g $\mathregular{m^{-2}}$ $\mathregular{s^{-1}}$'
+mpl_kgm2s1 = 'kg $\mathregular{m^{-2}} $\mathregular{s^{-1}}$'
+mpl_kgm2 = 'kg $\mathregular{m^{-2}}$'
+mpl_10m3 = '$\mathregular{10^{-3}}$'
+mpl_10m4 = '$\mathregular{10^{-4}}$'
+mpl_10m5 = '$\mathregular{10^{-5}}$'
+mpl_10m6 = '$\mathregular{10^{-6}}$'
+
+deg_uni = '\u00B0'
+en_dash = u'\u2013'
+em_dash = u'\u2014'
+
+fmt_yyyymmdd = '%Y%m%d'
+fmt_yyyymmddhh = '%Y%m%d%H'
+fmt_yyyymmdd_hh = '%Y%m%d_%H'
+fmt_yyyymmdd_hhmm = '%Y%m%d_%H%M'
+fmt_dt = '%Y%m%dT%H%M%S'
+fmt_yyyy = '%Y'
+fmt_mm = '%m'
+fmt_dd = '%d'
+fmt_hh = '%H'
+fmt_nn = '%M'
+
+fmt_wrf_dt_no_s = '%Y-%m-%d_%H:%M'
+fmt_wrf_date = '%Y-%m-%d'
+fmt_wrf_time = '%H:%M:%S'
+fmt_wrf_dt = fmt_wrf_date + '_' + fmt_wrf_time
+fmt_time_file = fmt_yyyymmdd_hhmm
+fmt_time_plot = '%d %b %Y/%H%M UTC'
+
+# Static map plotting options (projection, limits, lat/lon, stations), built once per domain in each process
+static_map_opts = {}
+
+# Task keys of the file names of each stream of WRF output files
+stream_fnames = {'wrfout': 'wrf_fname', 'zlev': 'wrf_fname_zlev', 'plev': 'wrf_fname_plev'}
+
+# Open WRF output files shared by all plot tasks in this process (see get_dataset_pool)
+dataset_pool = None
+
+# Background threads compressing & writing the images of this process (see get_image_writer)
+image_writer = None
+
+# Grid cell of each pixel of the web map tiles of each domain, built once per domain in each process
+tile_indexes = {}
+
+# Fields read from the WRF output file of each stream (wrfout, zlev, plev) currently being plotted, for the products
+# they were read for, with the min/max over the full-domain plots of the fields computed in tiles (see get_file_fields)
+field_caches = {}
+
+# Grid points & weights of the stations of each domain, built once per domain in each process
+station_indexes = {}
+
+# Accumulated fields (e.g., rain) of the latest valid times read by this process, for interval accumulations
+accum_buffer = None
+
+# Output arrays of the diagnostics (e.g., slp) of this process, reused from one wrfout file to the next
+diag_buffers = None
+
+def get_barbs(product):
+    """
+    Function to determine which wind barbs (if any) get overlaid on the plot of a product.
+    -- Inputs:
+        - product: product dictionary from the plot plan (see plan_funcs.read_plot_plan)
+    -- Outputs:
+        - barbs: string, 'sfc' for 10-m barbs, 'upr' for upper-air barbs, or None
+    """
+    if plot_wind_barbs_sfc and product['barbs'] == 'sfc':
+        return 'sfc'
+    if plot_wind_barbs_upr and product['barbs'] == 'upr':
+        return 'upr'
+    return None
+
+
+def get_render_mode(product):
+    """
+    Function to determine how the field of a product is drawn: its render_mode in the plot plan, if set, or else the
+    render_mode in the USER SETTINGS section.
+    -- Inputs:
+        - product: product dictionary from the plot plan (see plan_funcs.read_plot_plan)
+    -- Outputs:
+        - 'contourf' or 'raster'
+    """
+    if product['render_mode'] is not None:
+        return product['render_mode']
+    return render_mode
+
+
+def get_product_fields(product):
+    """
+    Function to get the fields that are read to plot a product, including any wind barbs (for a multi-panel plot,
+    those of all its panels).
+    -- Inputs:
+        - product: product dictionary from the plot plan (see plan_funcs.read_plot_plan)
+    -- Outputs:
+        - fields: list of (stream, field, level) tuples
+    """
+    if product['panels'] is not None:
+        return [field for panel in product['panels'] for field in get_product_fields(panel)]
+    return plan_funcs.get_product_fields(product, get_barbs(product))
+
+
+def get_interval_products(product):
+    """
+    Function to get the interval accumulations (products with interval_h, e.g., 3-h rain) plotted by a product
+    (for a multi-panel plot, those among its panels).
+    -- Input:
+        - product: product dictionary from the plot plan (see plan_funcs.read_plot_plan)
+    -- Output:
+        - products: list of product dictionaries
+    """
+    if product['panels'] is not None:
+        return [panel for panel in product['panels'] if panel['interval_h'] is not None]
+    if product['interval_h'] is not None:
+        return [product]
+    return []
+
+
+def get_interval_fname(task, interval_h):
+    """
+    Function to get the name of the wrfout file at the start of the interval of an interval accumulation.
+    -- Inputs:
+        - task: dictionary describing the plot (see build_tasks)
+        - interval_h: float, interval [h]
+    -- Output:
+        - fname: pathlib object
+    """
+    valid_dt_beg = task['valid_dt'] - pd.Timedelta(hours=interval_h)
+    return task['wrf_fname'].parent.joinpath('wrfout_' + task['wrf_dom'] + '_' + valid_dt_beg.strftime(fmt_wrf_dt))
+
+def get_zooms():
+    """
+    Function to get the list of areas to plot: the full domain (None), followed by the names of any zoom boxes.
+    -- Outputs:
+        - zooms: list of None and strings (keys of zoom_boxes)
+    """
+    zooms = [None]
     if plot_subdomain:
-        # Adjust these if you want a different subdomain
-        i_beg, i_end = 10, 81
-        j_beg, j_end = 10, 90
-
-    lat_labels = [16, 18, 20, 22, 24, 26, 28, 30, 32, 34, 36, 38, 40]
-    lon_labels = [-62, -64, -66, -68, -70, -72, -74, -76, -78, -80, -82, -84, -86, -88]
-
-    # Set map contour plot limits
-    min_terrain = 0.0
-    max_terrain = 1500.1
-    int_terrain = 100.0
-
-    min_slp = 980.0
-    max_slp = 1020.1
-    int_slp = 2.0
-
-    min_t2 = 0.0
-    max_t2 = 40.1
-    int_t2 = 2.0
-
-    min_rh2 = 0.0
-    max_rh2 = 100.1
-    int_rh2 = 5.0
-
-    min_ws10 = 0.0
-    max_ws10 = 35.0
-    int_ws10 = 2.5
-
-    min_rain = 0.0
-    max_rain = 100.1
-    int_rain = 5.0
-
-    # =======================================
-    # CONSTANTS, FORMAT STATEMENTS, AND MORE:
-    # =======================================
-
-    G = 9.81  # graviational acceleration [m s-2]
-    PI = 3.1415926
-    DEG2RAD = PI / 180.0
-    RAD2DEG = 180.0 / PI
-    Rd = 297.048  # specific gas constant for dry air [J kg-1 K-1]
-    Rv = 461.495  # specific gas constant for water vapor [J kg-1 K-1]
-    C_to_K = 273.15  # additive conversion between degrees Celsius and Kelvin
-
-    missing_val = -9999.0
-
-    mpl_Wm2 = 'W $\mathregular{m^{-2}}$'
-    mpl_ms1 = 'm $\mathregular{s^{-1}}$'
-    mpl_s1 = '$\mathregular{s^{-1}}$'
-    mpl_Jkg = 'J $\mathregular{kg^{-1}}$'
-    mpl_um = u'\u03bcm'
-    mpl_gkg1 = 'g $\mathregular{kg^{-1}}$'
-    mpl_kgkg1 = 'kg $\mathregular{kg^{-1}}$'
-    mpl_gm2s1 = 'g $\mathregular{m^{-2}}$ $\mathregular{s^{-1}}$'
-    mpl_kgm2s1 = 'kg $\mathregular{m^{-2}} $\mathregular{s^{-1}}$'
-    mpl_kgm2 = 'kg $\mathregular{m^{-2}}$'
-    mpl_10m3 = '$\mathregular{10^{-3}}$'
-    mpl_10m4 = '$\mathregular{10^{-4}}$'
-    mpl_10m5 = '$\mathregular{10^{-5}}$'
-    mpl_10m6 = '$\mathregular{10^{-6}}$'
-
-    deg_uni = '\u00B0'
-    en_dash = u'\u2013'
-    em_dash = u'\u2014'
-
-    fmt_yyyymmdd = '%Y%m%d'
-    fmt_yyyymmddhh = '%Y%m%d%H'
-    fmt_yyyymmdd_hh = '%Y%m%d_%H'
-    fmt_yyyymmdd_hhmm = '%Y%m%d_%H%M'
-    fmt_dt = '%Y%m%dT%H%M%S'
-    fmt_yyyy = '%Y'
-    fmt_mm = '%m'
-    fmt_dd = '%d'
-    fmt_hh = '%H'
-    fmt_nn = '%M'
-
-    fmt_wrf_dt_no_s = '%Y-%m-%d_%H:%M'
-    fmt_wrf_date = '%Y-%m-%d'
-    fmt_wrf_time = '%H:%M:%S'
-    fmt_wrf_dt = fmt_wrf_date + '_' + fmt_wrf_time
-    fmt_time_file = fmt_yyyymmdd_hhmm
-    fmt_time_plot = '%d %b %Y/%H%M UTC'
-
-    # Define a custom colormap for radar reflectivity plots
-    # Modified to add gray for 0–5 dBZ and lightpurple for 75+ dBZ
-    cmap_radar = np.array([
-        [200, 200, 200], [4, 233, 231], [1, 159, 244], [3, 0, 244],
-        [2, 253, 2], [1, 197, 1], [0, 142, 0],
-        [253, 248, 2], [229, 188, 0], [253, 149, 0],
-        [253, 0, 0], [212, 0, 0], [188, 0, 0],
-        [248, 0, 253], [152, 84, 198], [228, 199, 243]], np.float32) / 255.0
-    bounds_radar = np.arange(0., 75.01, 5.0)
-    # Color names are approximate and only intended for assistance deciphering the RGB table above
-    colors_radar = np.array([
-        'gray', 'cyan', 'lightblue', 'darkblue',
-        'lightgreen', 'green', 'darkgreen',
-        'yellow', 'lightorange', 'orange',
-        'red', 'darkred', 'brickred',
-        'fuschia', 'violet', 'lavender'])
-
-    read_zlev = False
-    read_plev = False
-    if plot_WS100:
-        read_zlev = True
-    if plot_GHT500:
-        read_plev = True
-
-    # =============
-    # MAIN PROGRAM:
-    # =============
+        zooms = zooms + list(zoom_boxes)
+    return zooms
+
+
+def get_map_fname(out_dir, wrf_dom, product, valid_dt, zoom=None):
+    """
+    Function to build the output file name for a map plot. File names only depend on the task definition,
+    so they are the same no matter how many workers are used or in which order tasks finish.
+    -- Inputs:
+        - out_dir: pathlib object, output directory for the plots of this cycle
+        - wrf_dom: string, WRF domain (e.g., 'd01')
+        - product: product dictionary from the plot plan (see plan_funcs.read_plot_plan)
+        - valid_dt: pandas Timestamp, valid date/time (ignored for static fields like TERRAIN)
+        - zoom: string, name of the zoom box (default: None, for the full domain)
+    -- Outputs:
+        - fname: pathlib object, output file name
+    """
+    map_prefix = 'map_wrf_' + wrf_dom + '_'
+    if zoom is not None:
+        map_prefix = map_prefix + zoom + '_'
+    var = product['name']
+    if product['static']:
+        return out_dir.joinpath(map_prefix + var + '.' + image_funcs.image_formats[plot_type])
+    var_file = var
+    if get_barbs(product) is not None:
+        var_file = var_file + '+barbs'
+    map_suffix = '_' + valid_dt.strftime(fmt_time_file) + '.' + image_funcs.image_formats[plot_type]
+    return out_dir.joinpath(map_prefix + var_file + map_suffix)
+
+
+def get_anim_fname(out_dir, wrf_dom, product, zoom=None):
+    """
+    Function to build the output file name for an animation of a product over all valid times of a cycle.
+    -- Inputs:
+        - out_dir: pathlib object, output directory for the plots of this cycle
+        - wrf_dom: string, WRF domain (e.g., 'd01')
+        - product: product dictionary from the plot plan (see plan_funcs.read_plot_plan)
+        - zoom: string, name of the zoom box (default: None, for the full domain)
+    -- Outputs:
+        - fname: pathlib object, output file name
+    """
+    anim_prefix = 'anim_wrf_' + wrf_dom + '_'
+    if zoom is not None:
+        anim_prefix = anim_prefix + zoom + '_'
+    var_file = product['name']
+    if get_barbs(product) is not None:
+        var_file = var_file + '+barbs'
+    return out_dir.joinpath(anim_prefix + var_file + '.' + anim_funcs.anim_formats[anim_type])
+
+
+def get_plot_opts_hash(product, zoom=None):
+    """
+    Function to get a hash of the user settings that affect how a product is plotted (its plot plan entry, overlays,
+    subdomain, stations, titles, fonts, etc.). If any of these settings change, the plot gets rebuilt on a rerun.
+    -- Inputs:
+        - product: product dictionary from the plot plan (see plan_funcs.read_plot_plan)
+        - zoom: string, name of the zoom box (default: None, for the full domain)
+    -- Outputs:
+        - opts_hash: string, hexadecimal SHA-1 hash
+    """
+    plot_settings = {
+        'product': product, 'plot_type': plot_type, 'image_opts': get_image_opts(),
+        'subdomain': [i_beg, i_end, j_beg, j_end], 'barbs': get_barbs(product), 'barb_thin': barb_thin,
+        'barb_spacing_km': barb_spacing_km,
+        'render_mode': get_render_mode(product), 'tiles': None,
+        'barb_width': barb_width, 'suptitle': suptitle, 'suptitle_y': suptitle_y, 'fontsize': plot_fontsize,
+        'lat_labels': lat_labels, 'lon_labels': lon_labels, 'water_color': water_color, 'stations': None,
+    }
+    if product['panels'] is not None:
+        plot_settings['barbs'] = [get_barbs(panel) for panel in product['panels']]
+        plot_settings['render_mode'] = [get_render_mode(panel) for panel in product['panels']]
+    elif make_tiles and zoom is None:
+        plot_settings['tiles'] = list(tile_zooms)
+    if zoom is not None:
+        plot_settings['subdomain'] = [zoom, zoom_boxes[zoom], zoom_halo]
+        plot_settings['barb_thin'] = zoom_barb_thin
+        plot_settings['barb_spacing_km'] = zoom_barb_spacing_km
+    if plot_stations:
+        plot_settings['stations'] = [text1_lab, mark1_lat, mark1_lon, text1_lat, text1_lon, mark1_size, mark1_color]
+
+    def to_json(val):
+        if isinstance(val, np.ndarray):
+            return val.tolist()
+        return str(val)
+
+    plot_settings_str = json.dumps(plot_settings, sort_keys=True, default=to_json)
+    return hashlib.sha1(plot_settings_str.encode('utf-8')).hexdigest()
+
+
+def get_task_inputs(task):
+    """
+    Function to get the input files that a plot task reads.
+    -- Inputs:
+        - task: dictionary describing the plot (see build_tasks)
+    -- Outputs:
+        - inputs: list of pathlib objects
+    """
+    inputs = [task['wrf_fname']]
+    for stream, _, _ in get_product_fields(task['product']):
+        if task[stream_fnames[stream]] not in inputs:
+            inputs.append(task[stream_fnames[stream]])
+    # Interval accumulations also need the accumulation at the start of the interval
+    for product in get_interval_products(task['product']):
+        if get_interval_fname(task, product['interval_h']) not in inputs:
+            inputs.append(get_interval_fname(task, product['interval_h']))
+    return inputs
+
+
+def get_manifest_entry(task):
+    """
+    Function to build the plot manifest entry for a task: the path, modification time, and size of each input
+    file, and the hash of the plot options. A plot is up to date if its manifest entry has not changed.
+    -- Inputs:
+        - task: dictionary describing the plot (see build_tasks)
+    -- Outputs:
+        - entry: dictionary with the keys inputs (list of dictionaries with path, mtime, size) and opts_hash
+    """
+    inputs = []
+    for in_fname in get_task_inputs(task):
+        if in_fname.is_file():
+            in_stat = in_fname.stat()
+            inputs.append({'path': str(in_fname), 'mtime': in_stat.st_mtime, 'size': in_stat.st_size})
+        else:
+            inputs.append({'path': str(in_fname), 'mtime': None, 'size': None})
+    return {'inputs': inputs, 'opts_hash': get_plot_opts_hash(task['product'], task['zoom'])}
+
+
+def read_manifest(out_dir):
+    """
+    Function to read the plot manifest of a cycle.
+    -- Inputs:
+        - out_dir: pathlib object, output directory for the plots of the cycle
+    -- Outputs:
+        - manifest: dictionary of plot file name to manifest entry (empty if there is no manifest yet)
+    """
+    manifest_fname = out_dir.joinpath(manifest_name)
+    if not manifest_fname.is_file():
+        return {}
+    try:
+        with open(manifest_fname, 'r') as f:
+            return json.load(f)
+    except ValueError:
+        print('WARNING: Could not read ' + str(manifest_fname) + '. All plots for this cycle will be rebuilt.')
+        return {}
+
+
+def write_manifest(out_dir, manifest):
+    """
+    Procedure to write the plot manifest of a cycle. It is written to a temporary file first, so an interrupted
+    run cannot leave a truncated manifest behind.
+    -- Inputs:
+        - out_dir: pathlib object, output directory for the plots of the cycle
+        - manifest: dictionary of plot file name to manifest entry
+    """
+    manifest_fname = out_dir.joinpath(manifest_name)
+    manifest_fname_tmp = out_dir.joinpath(manifest_name + '.tmp')
+    os.makedirs(out_dir, exist_ok=True)
+    with open(manifest_fname_tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(manifest_fname_tmp, manifest_fname)
+
+
+def get_stale_tasks(tasks):
+    """
+    Function to find the plot tasks that need to be (re)built: those whose plot file does not exist, or whose input
+    files or plot options have changed since the plot was made according to the manifest of its cycle.
+    Each task is also given its current manifest entry, to be recorded once the plot has been made.
+    -- Inputs:
+        - tasks: list of task dictionaries (see build_tasks)
+    -- Outputs:
+        - stale_tasks: list of task dictionaries that need to be run
+    """
+    manifests = {}
+    stale_tasks = []
+    for task in tasks:
+        out_dir = task['fname'].parent
+        if out_dir not in manifests:
+            manifests[out_dir] = read_manifest(out_dir)
+        task['manifest_entry'] = get_manifest_entry(task)
+        if task['fname'].is_file() and manifests[out_dir].get(task['fname'].name) == task['manifest_entry']:
+            continue
+        stale_tasks.append(task)
+    return stale_tasks
+
+
+def update_manifests(tasks, results):
+    """
+    Procedure to record the plots that were made successfully in the manifest of their cycle.
+    -- Inputs:
+        - tasks: list of task dictionaries that were run (see build_tasks and get_stale_tasks)
+        - results: list of result dictionaries from plot_task, in the same order as tasks
+    """
+    manifests = {}
+    for task, result in zip(tasks, results):
+        if result['status'] != 'ok':
+            continue
+        out_dir = task['fname'].parent
+        if out_dir not in manifests:
+            manifests[out_dir] = read_manifest(out_dir)
+        manifests[out_dir][task['fname'].name] = task['manifest_entry']
+    for out_dir, manifest in manifests.items():
+        write_manifest(out_dir, manifest)
+
+
+def write_timings(tasks, results, script_config_opts):
+    """
+    Procedure to append the stage records of plot tasks (see timing_funcs) to the timing file of their cycle,
+    labeled with the start time of this run.
+    -- Inputs:
+        - tasks: list of task dictionaries that were run (see build_tasks and get_stale_tasks)
+        - results: list of result dictionaries from plot_task, in the same order as tasks
+        - script_config_opts: dictionary of configuration options from parse_args
+    """
+    if timing_fmt is None:
+        return
+    out_records = {}
+    for task, result in zip(tasks, results):
+        for record in result['timings']:
+            out_records.setdefault(task['fname'].parent, []).append(dict(run=script_config_opts['run_id'], **record))
+    for out_dir, records in out_records.items():
+        # The plot directory does not exist yet if every plot of the cycle failed before being saved
+        os.makedirs(out_dir, exist_ok=True)
+        timing_funcs.write_records(records, out_dir.joinpath(timing_name + '.' + timing_fmt), fmt=timing_fmt)
+
+
+def get_next_fnames(tasks):
+    """
+    Function to map each input file of a list of plot tasks to the input file of the same stream (wrfout, zlev, plev)
+    at the next valid time of the same cycle. WRF writes each stream in time order, so once the next file exists the
+    previous one is complete.
+    -- Inputs:
+        - tasks: list of task dictionaries (see build_tasks)
+    -- Outputs:
+        - next_fnames: dictionary of pathlib object to pathlib object (the last file of each stream has no entry)
+    """
+    cycle_fnames = {}
+    for task in tasks:
+        for stream_key in stream_fnames.values():
+            fnames = cycle_fnames.setdefault((task['cycle_dt'], stream_key), [])
+            if task[stream_key] not in fnames:
+                fnames.append(task[stream_key])
+    next_fnames = {}
+    for fnames in cycle_fnames.values():
+        for ff in range(len(fnames) - 1):
+            next_fnames[fnames[ff]] = fnames[ff+1]
+    return next_fnames
+
+
+def is_file_complete(fname, next_fnames, file_obs):
+    """
+    Function to check whether a wrfout file that WRF may still be writing is complete. A file is complete once the
+    file for the next valid time of the same stream exists, or once its size and modification time have not changed
+    for follow_settle_s seconds.
+    -- Inputs:
+        - fname: pathlib object, input file name
+        - next_fnames: dictionary from get_next_fnames
+        - file_obs: dictionary of file name to (size, mtime, time first seen with that size & mtime), updated in place
+    -- Outputs:
+        - complete: boolean
+    """
+    if not fname.is_file():
+        return False
+    if fname in next_fnames and next_fnames[fname].is_file():
+        return True
+    f_stat = fname.stat()
+    now = time.time()
+    size_mtime = (f_stat.st_size, f_stat.st_mtime)
+    if fname not in file_obs or file_obs[fname][0:2] != size_mtime:
+        file_obs[fname] = size_mtime + (now,)
+    return now - file_obs[fname][2] >= follow_settle_s
+
+
+def follow(pending, script_config_opts):
+    """
+    Function to make plots while WRF is running: the input files of each plot task are polled every follow_poll_s
+    seconds, and the plot is made as soon as all of them are complete (see is_file_complete).
+    It returns once all plots are made, or when no new input file has been complete for follow_timeout minutes.
+    -- Inputs:
+        - pending: list of task dictionaries to run (see build_tasks and get_stale_tasks)
+        - script_config_opts: dictionary of configuration options from parse_args
+    -- Outputs:
+        - tasks: list of task dictionaries that were run, in the order they were run
+        - results: list of result dictionaries from plot_task, in the same order as tasks
+    """
+    next_fnames = get_next_fnames(pending)
+    file_obs = {}
+    timeout_s = script_config_opts['follow_timeout'] * 60
+    n_workers = script_config_opts['workers']
+    executor = None
+    if n_workers > 1:
+        executor = get_process_pool(n_workers)
+    futures = {}
+
+    print('Following ' + str(len(pending)) + ' plot tasks as WRF output appears in ' +
+          str(script_config_opts['wrf_dir_parent']))
+    tasks = []
+    results = []
+    t_last_ready = time.time()
+    try:
+        while len(pending) > 0 or len(futures) > 0:
+            # Check every input file on each poll, so the settle time of each file starts when it first appears
+            in_fnames = set(in_fname for task in pending for in_fname in get_task_inputs(task))
+            complete = set(in_fname for in_fname in in_fnames if is_file_complete(in_fname, next_fnames, file_obs))
+            ready = [task for task in pending if all(in_fname in complete for in_fname in get_task_inputs(task))]
+            if len(ready) > 0:
+                t_last_ready = time.time()
+                pending = [task for task in pending if task not in ready]
+                for task in ready:
+                    if executor is None:
+                        tasks.append(task)
+                        results.append(plot_task(task))
+                        update_manifests(tasks[-1:], results[-1:])
+                        write_timings(tasks[-1:], results[-1:], script_config_opts)
+                    else:
+                        futures[executor.submit(plot_task, task)] = task
+                continue
 
+            # Record the plots made by the workers as they finish
+            if len(futures) > 0:
+                done, _ = concurrent.futures.wait(futures, timeout=follow_poll_s)
+                for future in done:
+                    task = futures.pop(future)
+                    tasks.append(task)
+                    results.append(future.result())
+                    update_manifests(tasks[-1:], results[-1:])
+                    write_timings(tasks[-1:], results[-1:], script_config_opts)
+            elif time.time() - t_last_ready > timeout_s:
+                print('WARNING: No new complete WRF output for ' + str(script_config_opts['follow_timeout']) +
+                      ' minutes. Stopping with ' + str(len(pending)) + ' plot task(s) not done.')
+                break
+            else:
+                time.sleep(follow_poll_s)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return tasks, results
+
+
+def build_tasks(script_config_opts):
+    """
+    Function to turn the loops over forecast cycles, valid times, and variables into a flat list of plot tasks.
+    Each task makes exactly one plot, so tasks can be run in any order by any number of workers.
+    -- Input:
+        - script_config_opts: dictionary of configuration options from parse_args
+    -- Output:
+        - tasks: list of dictionaries, one per plot, with the keys:
+            - cycle_dt, valid_dt: pandas Timestamps for the forecast cycle and valid time
+            - var: string, product name
+            - product: product dictionary from the plot plan (see plan_funcs.read_plot_plan)
+            - wrf_dom: string, WRF domain (e.g., 'd01')
+            - zoom: string, name of the zoom box to plot, or None for the full domain
+            - wrf_fname, wrf_fname_zlev, wrf_fname_plev: pathlib objects, input wrfout file names
+            - fname: pathlib object, output plot file name
+            - file_products: list of product dictionaries, all products plotted from the same valid time
+            - grid_cache_dir: pathlib object, directory for the grid cache files (see get_map_grid)
+            - accum_window_h: float, longest interval of the interval accumulations of the plan (see
+                              add_interval_fields), or None
+    """
     cycle_dt_str_first = script_config_opts['cycle_dt_first']
     cycle_dt_str_last = script_config_opts['cycle_dt_last']
     cycle_stride_h = script_config_opts['cycle_stride_h']
@@ -193,12 +647,15 @@ def main(script_config_opts):
     dom_num = script_config_opts['domain']
     wrf_dom = 'd0' + dom_num
 
+    products = script_config_opts['products']
+    interval_hs = [prod['interval_h'] for product in products for prod in get_interval_products(product)]
+    accum_window_h = max(interval_hs) if len(interval_hs) > 0 else None
+
+    tasks = []
     # Loop over forecast cycles/initializations
     for cc in range(n_cycles):
         cycle_dt = cycle_dt_all[cc]
         cycle_dt_str = cycle_dt.strftime(fmt_yyyymmdd_hh)
-        cycle_dt_plot = cycle_dt.strftime(fmt_time_plot)
-        start_time_plot = 'Start: ' + cycle_dt_plot
         wrf_dir = script_config_opts['wrf_dir_parent'].joinpath(cycle_dt_str)
         out_dir = script_config_opts['out_dir_parent'].joinpath(cycle_dt_str, 'plots')
 
@@ -217,368 +674,1243 @@ def main(script_config_opts):
         for vv in range(n_valid):
             valid_dt = valid_dt_all[vv]
             valid_dt_wrf = valid_dt.strftime(fmt_wrf_dt)
-            valid_dt_plot = valid_dt.strftime(fmt_time_plot)
-            valid_dt_file = valid_dt.strftime(fmt_time_file)
-            valid_time_plot = 'Valid: '+valid_dt_plot
-
-            # suptitle = 'Hurricane Matthew ' + em_dash + ' Domain ' + dom_num
-            suptitle = 'Hurricane Matthew Test Case'
-            map_prefix = 'map_wrf_' + wrf_dom + '_'
-            map_suffix = '_' + valid_dt_file + '.' + plot_type
-            title_r = start_time_plot + '\n' + valid_time_plot
-            title_r_no_valid = start_time_plot
-            title_r_blank = ''
-
-            wrf_fname = wrf_dir.joinpath('wrfout_' + wrf_dom + '_' + valid_dt_wrf)
-            wrf_fname_zlev = wrf_dir.joinpath('wrfout_zlev_' + wrf_dom + '_' + valid_dt_wrf)
-            wrf_fname_plev = wrf_dir.joinpath('wrfout_plev_' + wrf_dom + '_' + valid_dt_wrf)
-
-            try:
-                wrf_fname.is_file()
-            except FileNotFoundError:
-                print('WARNING: File '+str(wrf_fname) + 'does not exist. Continuing to the next valid time.')
-                continue
-            print('Reading ' + str(wrf_fname))
-            # Use NetCDF4-python to open a Dataset, as wrf-python doesn't yet take an xarray Dataset
-            # wrf.getvar will return an xarray Dataset by default, though
-            ds_wrf_nc = netCDF4.Dataset(wrf_fname, mode='r')
-
-            # Static fields only need to be read in once
-            if cc == 0 and vv == 0:
-                # Latitude, Longitude
-                da_lat = wrf.getvar(ds_wrf_nc, 'lat', squeeze=False)
-                da_lon = wrf.getvar(ds_wrf_nc, 'lon', squeeze=False)
-                wrf_lat = da_lat.values[0, :, :]
-                wrf_lon = da_lon.values[0, :, :]
-                n_wrf_lat = wrf_lat.shape[0]
-                n_wrf_lon = wrf_lon.shape[1]
-                n_wrf_lev = int(getattr(ds_wrf_nc, 'BOTTOM-TOP_GRID_DIMENSION'))
-                wrf_lats, wrf_lons = wrf.latlon_coords(da_lat)
-
-                print('Getting cartopy mapping objects')
-                cart_proj = wrf.get_cartopy(wrfin=ds_wrf_nc)
-                cart_bounds = wrf.geo_bounds(var=da_lat[0, j_beg:j_end, i_beg:i_end])
-                cart_xlim = wrf.cartopy_xlim(wrfin=ds_wrf_nc, geobounds=cart_bounds)
-                cart_ylim = wrf.cartopy_ylim(wrfin=ds_wrf_nc, geobounds=cart_bounds)
-                borders, states, oceans, lakes, rivers, land = map_funcs.get_cartopy_features()
-
-                # Start populating dictionary for map plotting options. Update later with other options.
-                map_opts = {
-                    'cart_proj': cart_proj, 'cart_xlim': cart_xlim, 'cart_ylim': cart_ylim,
-                    'borders': borders, 'states': states, 'oceans': oceans, 'lakes': lakes,
-                    'lons': wrf_lons, 'lats': wrf_lats, 'suptitle': suptitle, 'suptitle_y': suptitle_y,
-                    'lat_labels': lat_labels, 'lon_labels': lon_labels, 'fontsize': plot_fontsize,
-                    'map_x_thin': barb_thin, 'map_y_thin': barb_thin, 'barb_width': barb_width,
-                }
-
-                if plot_stations:
-                    map_opts['mark1_lat'] = mark1_lat
-                    map_opts['mark1_lon'] = mark1_lon
-                    map_opts['text1_lab'] = text1_lab
-                    map_opts['text1_lat'] = text1_lat
-                    map_opts['text1_lon'] = text1_lon
-                    map_opts['mark1_size'] = mark1_size
-                    map_opts['mark1_color'] = mark1_color
-
-                # Terrain
-                if plot_TERRAIN:
-                    print('   Reading terrain')
-                    da_terrain = wrf.getvar(ds_wrf_nc, 'ter', squeeze=False)
-                    wrf_terrain = da_terrain.values[0, :, :]
-
-                    var_file = 'TERRAIN'
-                    var_name = 'Terrain Height'
-                    var_unit = 'm'
-                    wrf_var = wrf_terrain
-                    min_val = np.nanmin(wrf_var[j_beg:j_end, i_beg:i_end])
-                    max_val = np.nanmax(wrf_var[j_beg:j_end, i_beg:i_end])
-                    extend = 'both'
-                    cmap = map_funcs.truncate_cmap(mpl.cm.terrain, minval=0.20, maxval=0.95)
-                    bounds = np.arange(min_terrain, max_terrain, int_terrain)
-                    norm = mpl.colors.BoundaryNorm(bounds, cmap.N, extend=extend)
-                    title_l = var_name + f'\nMin: {min_val:.1f} ' + var_unit + f', Max: {max_val:.1f} ' + var_unit
-                    map_opts['fill_var'] = wrf_var
-                    map_opts['water_color'] = water_color
-                    map_opts['extend'] = extend
-                    map_opts['cmap'] = cmap
-                    map_opts['bounds'] = bounds
-                    map_opts['norm'] = norm
-                    map_opts['cbar_lab'] = 'Model ' + var_name + ' [' + var_unit + ']'
-                    map_opts['fname'] = out_dir.joinpath(map_prefix + var_file + '.' + plot_type)
-                    map_opts['title_l'] = title_l
-                    map_opts['title_r'] = title_r_blank
-                    map_funcs.map_plot(map_opts)
-
-            # Make the water color transparent for all subsequent plots
-            map_opts['water_color'] = 'none'
-            map_opts['title_r'] = title_r
-
-            if plot_wind_barbs_sfc or plot_WS10:
-                print('   Reading 10-m wind components (rotated to earth-relative)')
-                da_uv10 = wrf.getvar(ds_wrf_nc, 'uvmet10', squeeze=False)
-                wrf_u10 = da_uv10.values[0, 0, :, :]
-                wrf_v10 = da_uv10.values[1, 0, :, :]
-                wrf_ws10 = np.sqrt(wrf_u10**2 + wrf_v10**2)
-
-                if plot_WS10:
-                    var_file = 'WS10'
-                    var_name = '10-m Wind Speed'
-                    var_unit = mpl_ms1
-                    wrf_var = wrf_ws10
-                    min_val = np.nanmin(wrf_var[j_beg:j_end, i_beg:i_end])
-                    max_val = np.nanmax(wrf_var[j_beg:j_end, i_beg:i_end])
-                    extend = 'max'
-                    cmap = mpl.cm.BuGn
-                    bounds = np.arange(min_ws10, max_ws10, int_ws10)
-                    norm = mpl.colors.BoundaryNorm(bounds, cmap.N, extend=extend)
-                    map_opts['cbar_lab'] = var_name + ' [' + var_unit + ']'
-                    if plot_wind_barbs_sfc:
-                        var_file = var_file + '+barbs'
-                        # var_name = var_name + '; Barbs'
-                        map_opts['u'] = wrf_u10
-                        map_opts['v'] = wrf_v10
-                    else:
-                        map_opts['u'] = None
-                        map_opts['v'] = None
-                    title_l = var_name + f'\nMin: {min_val:.1f} ' + var_unit + f', Max: {max_val:.1f} ' + var_unit
-                    map_opts['fill_var'] = wrf_var
-                    map_opts['extend'] = extend
-                    map_opts['cmap'] = cmap
-                    map_opts['bounds'] = bounds
-                    map_opts['norm'] = norm
-                    map_opts['fname'] = out_dir.joinpath(map_prefix + var_file + map_suffix)
-                    map_opts['title_l'] = title_l
-                    map_funcs.map_plot(map_opts)
-
-            # Sea level pressuure
-            if plot_SLP:
-                print('   Reading sea level pressure')
-                da_slp = wrf.getvar(ds_wrf_nc, 'slp', squeeze=False)
-                wrf_slp = da_slp.values[0, :, :]
-
-                var_file = 'SLP'
-                var_name = 'Sea-Level Pressure'
-                var_unit = 'hPa'
-                wrf_var = wrf_slp
-                min_val = np.nanmin(wrf_var[j_beg:j_end, i_beg:i_end])
-                max_val = np.nanmax(wrf_var[j_beg:j_end, i_beg:i_end])
-                extend = 'both'
-                cmap = mpl.cm.viridis
-                bounds = np.arange(min_slp, max_slp, int_slp)
-                norm = mpl.colors.BoundaryNorm(bounds, cmap.N, extend=extend)
-                map_opts['cbar_lab'] = var_name + ' [' + var_unit + ']'
-                if plot_wind_barbs_sfc:
-                    var_file = var_file + '+barbs'
-                    # var_name = var_name + '; 10-m Barbs'
-                    map_opts['u'] = wrf_u10
-                    map_opts['v'] = wrf_v10
-                else:
-                    map_opts['u'] = None
-                    map_opts['v'] = None
-                title_l = var_name + f'\nMin: {min_val:.1f} ' + var_unit + f', Max: {max_val:.1f} ' + var_unit
-                map_opts['fill_var'] = wrf_var
-                map_opts['extend'] = extend
-                map_opts['cmap'] = cmap
-                map_opts['bounds'] = bounds
-                map_opts['norm'] = norm
-                map_opts['fname'] = out_dir.joinpath(map_prefix + var_file + map_suffix)
-                map_opts['title_l'] = title_l
-                map_funcs.map_plot(map_opts)
-
-            # 2-m air temperature
-            if plot_T2:
-                print('   Reading 2-m air temperature')
-                da_t2 = wrf.getvar(ds_wrf_nc, 'T2', squeeze=False)
-                if da_t2.attrs['units'] == 'K':
-                    da_t2 = da_t2 - C_to_K
-                    da_t2.attrs['units'] = 'degC'
-                wrf_t2 = da_t2.values[0, :, :]
-
-                var_file = 'T2'
-                var_name = '2-m Air Temperature'
-                var_unit = deg_uni + 'C'
-                wrf_var = wrf_t2
-                min_val = np.nanmin(wrf_var[j_beg:j_end, i_beg:i_end])
-                max_val = np.nanmax(wrf_var[j_beg:j_end, i_beg:i_end])
-                extend = 'both'
-                cmap = mpl.cm.rainbow
-                bounds = np.arange(min_t2, max_t2, int_t2)
-                norm = mpl.colors.BoundaryNorm(bounds, cmap.N, extend=extend)
-                map_opts['cbar_lab'] = var_name + ' [' + var_unit + ']'
-                if plot_wind_barbs_sfc:
-                    var_file = var_file + '+barbs'
-                    # var_name = var_name + '; 10-m Barbs'
-                    map_opts['u'] = wrf_u10
-                    map_opts['v'] = wrf_v10
-                else:
-                    map_opts['u'] = None
-                    map_opts['v'] = None
-                title_l = var_name + f'\nMin: {min_val:.1f} ' + var_unit + f', Max: {max_val:.1f} ' + var_unit
-                map_opts['fill_var'] = wrf_var
-                map_opts['extend'] = extend
-                map_opts['cmap'] = cmap
-                map_opts['bounds'] = bounds
-                map_opts['norm'] = norm
-                map_opts['fname'] = out_dir.joinpath(map_prefix + var_file + map_suffix)
-                map_opts['title_l'] = title_l
-                map_funcs.map_plot(map_opts)
-
-            # 2-m relative humidity
-            if plot_RH2:
-                print('   Reading 2-m relative humidity')
-                da_rh2 = wrf.getvar(ds_wrf_nc, 'rh2', squeeze=False)
-                wrf_rh2 = da_rh2.values[0, :, :]
-
-                var_file = 'RH2'
-                var_name = '2-m Relative Humidity'
-                var_unit = '%'
-                wrf_var = wrf_rh2
-                min_val = np.nanmin(wrf_var[j_beg:j_end, i_beg:i_end])
-                max_val = np.nanmax(wrf_var[j_beg:j_end, i_beg:i_end])
-                extend = 'max'
-                cmap = mpl.cm.YlGnBu
-                bounds = np.arange(min_rh2, max_rh2, int_rh2)
-                norm = mpl.colors.BoundaryNorm(bounds, cmap.N, extend=extend)
-                map_opts['cbar_lab'] = var_name + ' [' + var_unit + ']'
-                if plot_wind_barbs_sfc:
-                    var_file = var_file + '+barbs'
-                    # var_name = var_name + '; 10-m Barbs'
-                    map_opts['u'] = wrf_u10
-                    map_opts['v'] = wrf_v10
-                else:
-                    map_opts['u'] = None
-                    map_opts['v'] = None
-                title_l = var_name + f'\nMin: {min_val:.1f}' + var_unit + f', Max: {max_val:.1f}' + var_unit
-                map_opts['fill_var'] = wrf_var
-                map_opts['extend'] = extend
-                map_opts['cmap'] = cmap
-                map_opts['bounds'] = bounds
-                map_opts['norm'] = norm
-                map_opts['fname'] = out_dir.joinpath(map_prefix + var_file + map_suffix)
-                map_opts['title_l'] = title_l
-                map_funcs.map_plot(map_opts)
-
-            # Accumulated rainfall
-            if plot_RAIN and vv > 0:
-                print('   Reading accumulated rainfall')
-                da_rainc = wrf.getvar(ds_wrf_nc, 'RAINC', squeeze=False)
-                da_rainnc = wrf.getvar(ds_wrf_nc, 'RAINNC', squeeze=False)
-                wrf_rain = da_rainc.values[0, :, :] + da_rainnc.values[0, :, :]
-                # Mask RAIN=0.0 for plotting
-                wrf_rain_plot = np.ma.masked_equal(np.where(wrf_rain == 0.0, missing_val, wrf_rain), missing_val)
-
-                var_file = 'RAIN'
-                var_name = 'Accumulated Precipitation'
-                var_unit = 'mm'
-                wrf_var1 = wrf_rain
-                wrf_var2 = wrf_rain_plot
-                min_val = np.nanmin(wrf_var1[j_beg:j_end, i_beg:i_end])
-                max_val = np.nanmax(wrf_var1[j_beg:j_end, i_beg:i_end])
-                extend = 'max'
-                cmap = mpl.cm.GnBu
-                bounds = np.arange(min_rain, max_rain, int_rain)
-                norm = mpl.colors.BoundaryNorm(bounds, cmap.N, extend=extend)
-                map_opts['cbar_lab'] = var_name + ' [' + var_unit + ']'
-                title_l = var_name + f'\nMin: {min_val:.1f} ' + var_unit + f', Max: {max_val:.1f} ' + var_unit
-                map_opts['fill_var'] = wrf_var2
-                map_opts['extend'] = extend
-                map_opts['cmap'] = cmap
-                map_opts['bounds'] = bounds
-                map_opts['norm'] = norm
-                map_opts['fname'] = out_dir.joinpath(map_prefix + var_file + map_suffix)
-                map_opts['title_l'] = title_l
-                # print(wrf_var1.shape)
-                # print(wrf_var2.shape)
-                map_funcs.map_plot(map_opts)
-
-            # Radar reflectivity
-            if plot_REFL and vv > 0:
-                print('   Reading radar reflectivity')
-                da_refl = wrf.getvar(ds_wrf_nc, 'dbz', squeeze=False)
-                wrf_refl = da_refl.values[0, 0, :, :]
-                # Mask REFL <= 0.0 for plotting
-                wrf_refl_plot = np.ma.masked_equal(np.where(wrf_refl <= 0.0, missing_val, wrf_refl), missing_val)
-
-                var_file = 'REFL'
-                var_name = 'Radar Reflectivity'
-                var_unit = 'dBZ'
-                wrf_var1 = wrf_refl
-                wrf_var2 = wrf_refl_plot
-                min_val = np.nanmin(wrf_var1[j_beg:j_end, i_beg:i_end])
-                max_val = np.nanmax(wrf_var1[j_beg:j_end, i_beg:i_end])
-                extend = 'max'
-                refl_rgb = cmap_radar
-                bounds = bounds_radar
-                cmap, norm = mpl.colors.from_levels_and_colors(bounds, refl_rgb, extend=extend)
-                map_opts['cbar_lab'] = var_name + ' [' + var_unit + ']'
-                if plot_wind_barbs_sfc:
-                    var_file = var_file + '+barbs'
-                    var_name = var_name + '; 10-m Barbs'
-                    map_opts['u'] = wrf_u10
-                    map_opts['v'] = wrf_v10
-                else:
-                    map_opts['u'] = None
-                    map_opts['v'] = None
-                title_l = var_name + f'\nMin: {min_val:.1f} ' + var_unit + f', Max: {max_val:.1f} ' + var_unit
-                map_opts['fill_var'] = wrf_var2
-                map_opts['extend'] = extend
-                map_opts['cmap'] = cmap
-                map_opts['bounds'] = bounds
-                map_opts['norm'] = norm
-                map_opts['fname'] = out_dir.joinpath(map_prefix + var_file + map_suffix)
-                map_opts['title_l'] = title_l
-                # print(wrf_var1.shape)
-                # print(wrf_var2.shape)
-                map_funcs.map_plot(map_opts)
-
-            if read_zlev:
-                try:
-                    wrf_fname_zlev.is_file()
-                except FileNotFoundError:
-                    print('WARNING: File ' + str(wrf_fname_zlev) + 'does not exist. Continuing to the next valid time.')
+
+            # Static fields only need to be plotted once
+            # Some fields (e.g., accumulated rainfall and reflectivity) are not meaningful at the first valid time
+            # Interval accumulations (e.g., 3-h rain) start once their whole interval is within the forecast
+            task_products = []
+            for product in products:
+                if product['static'] and (cc > 0 or vv > 0):
                     continue
-                print('Reading ' + str(wrf_fname_zlev))
-                # Use NetCDF4-python to open a Dataset, as wrf-python doesn't yet take an xarray Dataset
-                # wrf.getvar will return an xarray Dataset by default, though
-                ds_wrf_zlev_nc = netCDF4.Dataset(wrf_fname_zlev, mode='r')
-                wrf_z_zlev = wrf.getvar(ds_wrf_zlev_nc, 'Z_ZL', squeeze=False)
-
-                # 100-m wind speed
-                if plot_WS100:
-                    ind_z = np.where(wrf_z_zlev == -100)[0][0]
-                    wrf_ws100 = wrf.getvar(ds_wrf_zlev_nc, 'S_ZL', squeeze=False)[0, ind_z, :, :]
-
-                    var_file = 'WS100'
-                    var_name = '100-m Wind Speed'
-                    var_unit = mpl_ms1
-                    wrf_var = wrf_ws100
-                    min_val = np.nanmin(wrf_var[j_beg:j_end, i_beg:i_end])
-                    max_val = np.nanmax(wrf_var[j_beg:j_end, i_beg:i_end])
-                    extend = 'max'
-                    cmap = mpl.cm.BuGn
-                    bounds = np.arange(min_ws10, max_ws10, int_ws10)
-                    norm = mpl.colors.BoundaryNorm(bounds, cmap.N, extend=extend)
-                    map_opts['cbar_lab'] = var_name + ' [' + var_unit + ']'
-                    if plot_wind_barbs_upr:
-                        var_file = var_file + '+barbs'
-                        var_name = var_name + '; Barbs'
-                        wrf_u100 = wrf.getvar(ds_wrf_zlev_nc, 'U_ZL', squeeze=False).values[0, ind_z, :, :]
-                        wrf_v100 = wrf.getvar(ds_wrf_zlev_nc, 'V_ZL', squeeze=False).values[0, ind_z, :, :]
-                        map_opts['u'] = wrf_u100
-                        map_opts['v'] = wrf_v100
-                    else:
-                        map_opts['u'] = None
-                        map_opts['v'] = None
-                    title_l = var_name + f'\nMin: {min_val:.1f} ' + var_unit + f', Max: {max_val:.1f} ' + var_unit
-                    map_opts['fill_var'] = wrf_var
-                    map_opts['extend'] = extend
-                    map_opts['cmap'] = cmap
-                    map_opts['bounds'] = bounds
-                    map_opts['norm'] = norm
-                    map_opts['fname'] = out_dir.joinpath(map_prefix + var_file + map_suffix)
-                    map_opts['title_l'] = title_l
-                    map_funcs.map_plot(map_opts)
+                if product['skip_first_time'] and vv == 0:
+                    continue
+                if any(valid_dt - pd.Timedelta(hours=prod['interval_h']) < cycle_dt
+                       for prod in get_interval_products(product)):
+                    continue
+                task_products.append(product)
+
+            for zoom in get_zooms():
+                for product in task_products:
+                    tasks.append({
+                        'cycle_dt': cycle_dt,
+                        'valid_dt': valid_dt,
+                        'var': product['name'],
+                        'product': product,
+                        'wrf_dom': wrf_dom,
+                        'zoom': zoom,
+                        'wrf_fname': wrf_dir.joinpath('wrfout_' + wrf_dom + '_' + valid_dt_wrf),
+                        'wrf_fname_zlev': wrf_dir.joinpath('wrfout_zlev_' + wrf_dom + '_' + valid_dt_wrf),
+                        'wrf_fname_plev': wrf_dir.joinpath('wrfout_plev_' + wrf_dom + '_' + valid_dt_wrf),
+                        'fname': get_map_fname(out_dir, wrf_dom, product, valid_dt, zoom),
+                        'file_products': task_products,
+                        'grid_cache_dir': script_config_opts['out_dir_parent'].joinpath('grid_cache'),
+                        'accum_window_h': accum_window_h,
+                    })
+
+    return tasks
+
+
+def build_anim_tasks(tasks):
+    """
+    Function to group the plot tasks of the animated products (anim_products) into animation tasks, one per cycle,
+    domain, zoom box, and product, each with the plot tasks of its frames in order of valid time.
+    -- Input:
+        - tasks: list of task dictionaries (see build_tasks)
+    -- Output:
+        - anim_tasks: list of dictionaries with the keys of the plot task of the first frame, except fname (the
+                      animation file name, see get_anim_fname), and with the key frames (list of plot tasks)
+    """
+    anim_tasks = {}
+    for task in tasks:
+        product = task['product']
+        if product['static'] or (anim_products is not None and product['name'] not in anim_products):
+            continue
+        anim_key = (task['cycle_dt'], task['wrf_dom'], task['zoom'], product['name'])
+        if anim_key not in anim_tasks:
+            anim_tasks[anim_key] = dict(task, frames=[])
+            anim_tasks[anim_key]['fname'] = get_anim_fname(task['fname'].parent, task['wrf_dom'], product,
+                                                           task['zoom'])
+        # Animations are made one product at a time, so each frame only reads the fields of its own product
+        anim_tasks[anim_key]['frames'].append(dict(task, file_products=[product]))
+    for anim_task in anim_tasks.values():
+        anim_task['frames'].sort(key=lambda task: task['valid_dt'])
+        anim_task['valid_dt'] = anim_task['frames'][0]['valid_dt']
+    return list(anim_tasks.values())
+
+
+def build_station_tasks(tasks, products):
+    """
+    Function to group the plot tasks of the full domain into station tasks, one per cycle and domain, each with one
+    plot task per valid time (in order of valid time) to read the files of.
+    -- Inputs:
+        - tasks: list of task dictionaries (see build_tasks)
+        - products: list of product dictionaries of the plot plan (see plan_funcs.read_plot_plan)
+    -- Output:
+        - station_tasks: list of dictionaries with the keys of the plot task of the first valid time, except var
+                         ('stations') and fname (the time series file name, see get_station_fname), and with the
+                         keys valid_tasks (list of plot tasks) and products (product dictionaries of the station
+                         products, in the order of station_products)
+    """
+    products_by_name = {product['name']: product for product in products}
+    stn_products = [products_by_name[name] for name in station_products]
+    station_tasks = {}
+    for task in tasks:
+        if task['zoom'] is not None:
+            continue
+        stn_key = (task['cycle_dt'], task['wrf_dom'])
+        if stn_key not in station_tasks:
+            station_tasks[stn_key] = dict(task, var='stations', valid_tasks={}, products=stn_products)
+            station_tasks[stn_key]['fname'] = get_station_fname(task['fname'].parent, task['wrf_dom'])
+        station_tasks[stn_key]['valid_tasks'].setdefault(task['valid_dt'], task)
+    for stn_task in station_tasks.values():
+        stn_task['valid_tasks'] = [stn_task['valid_tasks'][valid_dt] for valid_dt in sorted(stn_task['valid_tasks'])]
+        stn_task['valid_dt'] = stn_task['valid_tasks'][0]['valid_dt']
+    return list(station_tasks.values())
+
+
+def get_zoom_slices(wrf_lats, wrf_lons, zoom):
+    """
+    Function to get the (j,i) index ranges of a zoom box on the WRF grid.
+    -- Inputs:
+        - wrf_lats, wrf_lons: 2D arrays of grid point latitude & longitude
+        - zoom: string, name of the zoom box (key of zoom_boxes), or None for the full domain
+    -- Outputs:
+        - crop: tuple of (j,i) slices to crop full-domain fields to the zoom box plus its halo
+        - inner: tuple of (j,i) slices of the zoom box itself, relative to the cropped fields
+                 (used for the plot extent and the min/max in the titles)
+    """
+    if zoom is None:
+        return (slice(None), slice(None)), (slice(j_beg, j_end), slice(i_beg, i_end))
+
+    lat_min, lat_max, lon_min, lon_max = zoom_boxes[zoom]
+    in_box = (wrf_lats >= lat_min) & (wrf_lats <= lat_max) & (wrf_lons >= lon_min) & (wrf_lons <= lon_max)
+    if not np.any(in_box):
+        raise ValueError('Zoom box ' + zoom + ' ' + str(zoom_boxes[zoom]) + ' is outside the WRF domain')
+    jj, ii = np.nonzero(in_box)
+    n_j, n_i = wrf_lats.shape
+    j_min, j_max = jj.min(), jj.max() + 1
+    i_min, i_max = ii.min(), ii.max() + 1
+    j_halo_beg, j_halo_end = max(0, j_min - zoom_halo), min(n_j, j_max + zoom_halo)
+    i_halo_beg, i_halo_end = max(0, i_min - zoom_halo), min(n_i, i_max + zoom_halo)
+
+    crop = (slice(j_halo_beg, j_halo_end), slice(i_halo_beg, i_halo_end))
+    inner = (slice(j_min - j_halo_beg, j_max - j_halo_beg), slice(i_min - i_halo_beg, i_max - i_halo_beg))
+    return crop, inner
+
+
+def get_map_grid(ds_wrf_nc, wrf_dom, zoom, grid_cache_dir):
+    """
+    Function to get the grid information needed to plot a domain or zoom box: the cartopy projection, the map
+    limits, the (cropped) lat/lon arrays, and the lat/lon grid projected to the map coordinates. This is computed
+    once and stored in a cache file in grid_cache_dir, which is reused as long as the grid and zoom settings match.
+    -- Inputs:
+        - ds_wrf_nc: netCDF4 Dataset for any wrfout file of this domain
+        - wrf_dom: string, WRF domain (e.g., 'd01')
+        - zoom: string, name of the zoom box, or None for the full domain
+        - grid_cache_dir: pathlib object, directory for the grid cache files
+    -- Outputs:
+        - grid: dictionary with the keys cart_proj, cart_xlim, cart_ylim, lats, lons, proj_x, proj_y,
+                crop & inner (see get_zoom_slices)
+    """
+    if zoom is None:
+        grid_key = wrf_funcs.get_grid_key(ds_wrf_nc) + (None, i_beg, i_end, j_beg, j_end)
+        grid_fname = grid_cache_dir.joinpath('grid_' + wrf_dom + '.pkl')
+    else:
+        grid_key = wrf_funcs.get_grid_key(ds_wrf_nc) + (zoom, tuple(zoom_boxes[zoom]), zoom_halo)
+        grid_fname = grid_cache_dir.joinpath('grid_' + wrf_dom + '_' + zoom + '.pkl')
+
+    if cache_grid and grid_fname.is_file():
+        try:
+            with open(grid_fname, 'rb') as f:
+                grid_cache = pickle.load(f)
+            if grid_cache['key'] == grid_key:
+                print('Reading cartopy mapping objects from ' + str(grid_fname))
+                return grid_cache['grid']
+        except Exception:
+            print('WARNING: Could not read ' + str(grid_fname) + '. Recomputing it.')
+
+    # Latitude, Longitude
+    da_lat = wrf.getvar(ds_wrf_nc, 'lat', squeeze=False)
+    wrf_lats, wrf_lons = wrf.latlon_coords(da_lat)
+    crop, inner = get_zoom_slices(wrf_lats.values, wrf_lons.values, zoom)
+    wrf_lats = wrf_lats.values[crop]
+    wrf_lons = wrf_lons.values[crop]
+
+    print('Getting cartopy mapping objects')
+    cart_proj = wrf.get_cartopy(wrfin=ds_wrf_nc)
+    cart_bounds = wrf.geo_bounds(var=da_lat[0][crop][inner])
+    cart_xlim = wrf.cartopy_xlim(wrfin=ds_wrf_nc, geobounds=cart_bounds)
+    cart_ylim = wrf.cartopy_ylim(wrfin=ds_wrf_nc, geobounds=cart_bounds)
+    proj_x, proj_y = map_funcs.get_projected_coords(cart_proj, wrf_lons, wrf_lats)
+    grid = {
+        'cart_proj': cart_proj, 'cart_xlim': cart_xlim, 'cart_ylim': cart_ylim, 'lats': wrf_lats, 'lons': wrf_lons,
+        'proj_x': proj_x, 'proj_y': proj_y, 'crop': crop, 'inner': inner,
+    }
+
+    if cache_grid:
+        # Write to a temporary file first, as other worker processes may be reading or writing the same file
+        grid_fname_tmp = grid_cache_dir.joinpath(grid_fname.name + '.' + str(os.getpid()) + '.tmp')
+        os.makedirs(grid_cache_dir, exist_ok=True)
+        with open(grid_fname_tmp, 'wb') as f:
+            pickle.dump({'key': grid_key, 'grid': grid}, f)
+        os.replace(grid_fname_tmp, grid_fname)
+
+    return grid
+
+
+def get_static_map_opts(ds_wrf_nc, wrf_dom, zoom=None, grid_cache_dir=None):
+    """
+    Function to get the map plotting options that do not change between plots of the same domain & zoom box
+    (projection, plot limits, lat/lon, features, stations). These are only read in once per domain & zoom box in
+    each process.
+    -- Inputs:
+        - ds_wrf_nc: netCDF4 Dataset for any wrfout file of this domain
+        - wrf_dom: string, WRF domain (e.g., 'd01')
+        - zoom: string, name of the zoom box (default: None, for the full domain)
+        - grid_cache_dir: pathlib object, directory for the grid cache files (see get_map_grid)
+    -- Outputs:
+        - map_opts: dictionary of map plotting options (copy before updating it with per-plot options)
+        - crop: tuple of (j,i) slices to crop full-domain fields to the plotted area (see get_zoom_slices)
+        - inner: tuple of (j,i) slices of the cropped fields to compute the min/max in the titles over
+    """
+    if (wrf_dom, zoom) in static_map_opts:
+        return static_map_opts[(wrf_dom, zoom)]
+
+    grid = get_map_grid(ds_wrf_nc, wrf_dom, zoom, grid_cache_dir)
+    crop = grid['crop']
+    inner = grid['inner']
+    borders, states, oceans, lakes, rivers, land = map_funcs.get_cartopy_features()
+
+    # Start populating dictionary for map plotting options. Update later with other options.
+    map_opts = {
+        'cart_proj': grid['cart_proj'], 'cart_xlim': grid['cart_xlim'], 'cart_ylim': grid['cart_ylim'],
+        'borders': borders, 'states': states, 'oceans': oceans, 'lakes': lakes,
+        'lons': grid['lons'], 'lats': grid['lats'], 'proj_x': grid['proj_x'], 'proj_y': grid['proj_y'],
+        'suptitle': suptitle, 'suptitle_y': suptitle_y,
+        'lat_labels': lat_labels, 'lon_labels': lon_labels, 'fontsize': plot_fontsize,
+        'map_x_thin': barb_thin, 'map_y_thin': barb_thin, 'barb_width': barb_width,
+        'basemap_cache': cache_basemap,
+        'reuse_figure': reuse_figure,
+    }
+    spacing_km = barb_spacing_km
+    if zoom is not None:
+        map_opts['suptitle'] = suptitle + ' (' + zoom + ')'
+        map_opts['map_x_thin'] = zoom_barb_thin
+        map_opts['map_y_thin'] = zoom_barb_thin
+        spacing_km = zoom_barb_spacing_km
+
+    # Wind barbs are drawn at grid points spaced evenly on the map, chosen once here for all plots of this area
+    if spacing_km is not None:
+        map_opts['barb_index'] = map_funcs.get_barb_index(grid['proj_x'], grid['proj_y'], spacing_km * 1000.0,
+                                                          grid['cart_xlim'], grid['cart_ylim'])
+
+    if plot_stations:
+        map_opts['mark1_lat'] = mark1_lat
+        map_opts['mark1_lon'] = mark1_lon
+        map_opts['text1_lab'] = text1_lab
+        map_opts['text1_lat'] = text1_lat
+        map_opts['text1_lon'] = text1_lon
+        map_opts['mark1_size'] = mark1_size
+        map_opts['mark1_color'] = mark1_color
+
+    static_map_opts[(wrf_dom, zoom)] = (map_opts, crop, inner)
+    return map_opts, crop, inner
+
+
+def get_map_tile_index(ds_wrf_nc, wrf_dom, map_opts, grid_cache_dir):
+    """
+    Function to get the grid cell of each pixel of the web map tiles of a domain (see tile_funcs.get_tile_index).
+    This is computed once and stored in a cache file in grid_cache_dir, which is reused as long as the grid and tile
+    settings match, and only built once per domain in each process.
+    -- Inputs:
+        - ds_wrf_nc: netCDF4 Dataset for any wrfout file of this domain
+        - wrf_dom: string, WRF domain (e.g., 'd01')
+        - map_opts: dictionary of full-domain map plotting options (see get_static_map_opts)
+        - grid_cache_dir: pathlib object, directory for the grid cache files
+    -- Outputs:
+        - tile_index: dictionary from tile_funcs.get_tile_index
+    """
+    if wrf_dom in tile_indexes:
+        return tile_indexes[wrf_dom]
+
+    tile_key = wrf_funcs.get_grid_key(ds_wrf_nc) + (None, i_beg, i_end, j_beg, j_end, tuple(tile_zooms))
+    tile_fname = grid_cache_dir.joinpath('tiles_' + wrf_dom + '.pkl')
+    tile_index = None
+    if cache_grid and tile_fname.is_file():
+        try:
+            with open(tile_fname, 'rb') as f:
+                tile_cache = pickle.load(f)
+            if tile_cache['key'] == tile_key:
+                print('Reading web map tile index from ' + str(tile_fname))
+                tile_index = tile_cache['tile_index']
+        except Exception:
+            print('WARNING: Could not read ' + str(tile_fname) + '. Recomputing it.')
+
+    if tile_index is None:
+        print('Getting web map tile index for zoom levels ' + str(tile_zooms[0]) + '-' + str(tile_zooms[1]))
+        tile_index = tile_funcs.get_tile_index(map_opts['proj_x'], map_opts['proj_y'], map_opts['lons'],
+                                               map_opts['lats'], map_opts['cart_proj'], tile_zooms[0], tile_zooms[1])
+        if cache_grid:
+            # Write to a temporary file first, as other worker processes may be reading or writing the same file
+            tile_fname_tmp = grid_cache_dir.joinpath(tile_fname.name + '.' + str(os.getpid()) + '.tmp')
+            os.makedirs(grid_cache_dir, exist_ok=True)
+            with open(tile_fname_tmp, 'wb') as f:
+                pickle.dump({'key': tile_key, 'tile_index': tile_index}, f)
+            os.replace(tile_fname_tmp, tile_fname)
+
+    tile_indexes[wrf_dom] = tile_index
+    return tile_index
+
+
+def get_tile_dir(task):
+    """
+    Function to build the output directory for the web map tiles of a plot, next to the map plots of its cycle.
+    -- Inputs:
+        - task: dictionary describing the plot (see build_tasks)
+    -- Outputs:
+        - tile_dir: pathlib object, directory of the {z}/{x}/{y}.png tiles and their tiles.json manifest
+    """
+    tile_dir = task['fname'].parent.joinpath('tiles', task['wrf_dom'], task['product']['name'])
+    if task['product']['static']:
+        return tile_dir.joinpath('static')
+    return tile_dir.joinpath(task['valid_dt'].strftime(fmt_time_file))
+
+
+def write_map_tiles(ds_wrf_nc, task, map_opts):
+    """
+    Function to write the web map tiles of a full-domain plot, colored as the map is, with their manifest.
+    -- Inputs:
+        - ds_wrf_nc: netCDF4 Dataset for the wrfout file of the plot
+        - task: dictionary describing the plot (see build_tasks)
+        - map_opts: dictionary of map plotting options of the plot
+    -- Outputs:
+        - tile_stats: dictionary from tile_funcs.write_tiles
+    """
+    static_opts, _, _ = get_static_map_opts(ds_wrf_nc, task['wrf_dom'], None, task['grid_cache_dir'])
+    tile_index = get_map_tile_index(ds_wrf_nc, task['wrf_dom'], static_opts, task['grid_cache_dir'])
+    tile_dir = get_tile_dir(task)
+    tile_stats = tile_funcs.write_tiles(map_opts['fill_var'], tile_index, map_opts['cmap'], map_opts['norm'],
+                                        map_opts['bounds'], map_opts['extend'], tile_dir, get_image_writer(),
+                                        {'format': 'png', 'compress_level': png_compress_level})
+    meta = {
+        'name': task['product']['name'] + ' ' + task['wrf_dom'], 'description': map_opts['cbar_lab'],
+        'attribution': suptitle, 'cycle': task['cycle_dt'].strftime(fmt_dt), 'valid': None,
+        'legend': tile_funcs.get_legend(map_opts['cmap'], map_opts['norm'], map_opts['bounds'], map_opts['extend']),
+    }
+    if not task['product']['static']:
+        meta['valid'] = task['valid_dt'].strftime(fmt_dt)
+    tile_funcs.write_tile_manifest(tile_dir, tile_index, tile_stats, meta)
+    print('-- Wrote {:d} web map tiles to {:s} ({:d} empty tiles skipped)'.format(
+        tile_stats['n_tiles'], str(tile_dir), tile_stats['n_empty']))
+    return tile_stats
+
+
+def get_station_fname(out_dir, wrf_dom):
+    """
+    Function to build the output file name for the station time series of a cycle.
+    -- Inputs:
+        - out_dir: pathlib object, output directory for the plots of this cycle
+        - wrf_dom: string, WRF domain (e.g., 'd01')
+    -- Outputs:
+        - fname: pathlib object, output file name (the meteograms are written in its meteograms subdirectory)
+    """
+    return out_dir.joinpath('stations_wrf_' + wrf_dom + '.' + station_funcs.station_formats[station_format])
+
+
+def get_stations():
+    """
+    Function to get the stations to extract time series at: those of station_file, or else the stations on the map.
+    -- Outputs:
+        - stations: dictionary with the keys name, lat, and lon (see station_funcs.read_stations)
+    """
+    if station_file is not None:
+        return station_funcs.read_stations(station_file)
+    return {'name': np.asarray(text1_lab), 'lat': np.asarray(mark1_lat, float), 'lon': np.asarray(mark1_lon, float)}
+
+
+def get_station_index(ds_wrf_nc, wrf_dom, grid_cache_dir):
+    """
+    Function to get the grid points & weights of the stations on the full-domain grid (see
+    station_funcs.get_station_index), only built once per domain in each process.
+    -- Inputs:
+        - ds_wrf_nc: netCDF4 Dataset for any wrfout file of this domain
+        - wrf_dom: string, WRF domain (e.g., 'd01')
+        - grid_cache_dir: pathlib object, directory for the grid cache files (see get_map_grid)
+    -- Outputs:
+        - stations: dictionary with the keys name, lat, and lon (see get_stations)
+        - station_index: dictionary from station_funcs.get_station_index
+    """
+    if wrf_dom not in station_indexes:
+        map_opts, _, _ = get_static_map_opts(ds_wrf_nc, wrf_dom, None, grid_cache_dir)
+        stations = get_stations()
+        station_index = station_funcs.get_station_index(map_opts['proj_x'], map_opts['proj_y'], map_opts['cart_proj'],
+                                                        stations['lat'], stations['lon'], station_interp)
+        for name in stations['name'][~station_index['inside']]:
+            print('WARNING: Station ' + name + ' is outside domain ' + wrf_dom + '. Its values will be missing.')
+        station_indexes[wrf_dom] = (stations, station_index)
+    return station_indexes[wrf_dom]
+
+
+def get_dataset_pool():
+    """
+    Function to get the pool of open WRF output files of this process, creating it if needed. All plot tasks run in
+    the process share it, so products plotted from the same file use one open Dataset.
+    -- Output:
+        - dataset_pool: wrf_funcs.DatasetPool object
+    """
+    global dataset_pool
+    if dataset_pool is None:
+        # A plot reads from up to one file of each stream at once, so those must be able to stay open together
+        max_open = max(nc_max_open, len(stream_fnames))
+        dataset_pool = wrf_funcs.DatasetPool(max_open=max_open, chunk_cache_mb=nc_chunk_cache_mb)
+    return dataset_pool
+
+
+def get_accum_buffer(max_window):
+    """
+    Function to get the buffer of accumulated fields of this process, creating it if needed.
+    -- Input:
+        - max_window: timedelta, longest interval that will be asked for (the buffer keeps at least that much)
+    -- Output:
+        - accum_buffer: wrf_funcs.AccumBuffer object
+    """
+    global accum_buffer
+    if accum_buffer is None:
+        accum_buffer = wrf_funcs.AccumBuffer(max_window)
+    accum_buffer.max_window = max(accum_buffer.max_window, max_window)
+    return accum_buffer
+
+
+def get_diag_buffers():
+    """
+    Function to get the output arrays of the diagnostics of this process, creating them if needed. They hold the
+    diagnostics of the latest wrfout file read for plotting, so they can only be used for reads whose fields are
+    not kept beyond the next file (see get_file_fields).
+    -- Output:
+        - diag_buffers: diag_funcs.DiagBuffers object
+    """
+    global diag_buffers
+    if diag_buffers is None:
+        diag_buffers = diag_funcs.DiagBuffers()
+    return diag_buffers
+
+
+def get_process_stats():
+    """
+    Function to get the counts of the open files, memory use, and interval accumulations of this process so far.
+    -- Output:
+        - stats: dictionary with the pid, the keys of wrf_funcs.DatasetPool.get_stats, accum (see
+                 wrf_funcs.AccumBuffer.get_stats, or None if no interval accumulations were computed), and diag (see
+                 diag_funcs.DiagBuffers.get_stats, or None if no diagnostics were computed)
+    """
+    return dict(pid=os.getpid(), accum=None if accum_buffer is None else accum_buffer.get_stats(),
+                diag=None if diag_buffers is None else diag_buffers.get_stats(), **get_dataset_pool().get_stats())
+
+
+def add_interval_fields(task, products, field_vals):
+    """
+    Procedure to compute the interval accumulations of a list of products (e.g., 3-h rain) as the difference
+    between the accumulated field (e.g., rain) read for the valid time and that at the start of the interval.
+    The accumulated field of each valid time goes into the buffer of this process, so the one at the start of the
+    interval is usually there already; if not (e.g., it was plotted by another process, or not plotted at that
+    stride), only that field is read from the file at the start of the interval. Intervals that start before the
+    forecast, or whose start file does not exist, are all missing values.
+    -- Inputs:
+        - task: dictionary describing the plot (see build_tasks)
+        - products: list of product dictionaries, only those with interval_h are computed
+        - field_vals: dictionary of (field, level) to 2D numpy array, the wrfout fields read for the valid time,
+                      updated with the interval accumulations (see plan_funcs.get_product_field_key)
+    """
+    interval_products = [product for product in products if product['interval_h'] is not None]
+    if len(interval_products) == 0:
+        return
+    # The buffer keeps the longest interval of the plan, not just of these products, for those of later valid times
+    buffer = get_accum_buffer(pd.Timedelta(hours=task['accum_window_h']))
+    for product in interval_products:
+        field_key = (product['field'], product['level'])
+        forecast = (task['cycle_dt'], task['wrf_dom'])
+        buffer.put(forecast, product['field'], task['valid_dt'], field_vals[field_key])
+        _, interval_field, _ = plan_funcs.get_product_field_key(product)
+        valid_dt_beg = task['valid_dt'] - pd.Timedelta(hours=product['interval_h'])
+        vals_beg = None
+        if valid_dt_beg >= task['cycle_dt']:
+            vals_beg = buffer.get(forecast, product['field'], valid_dt_beg)
+            beg_fname = get_interval_fname(task, product['interval_h'])
+            if vals_beg is None and beg_fname.is_file():
+                print('   Reading ' + product['field'] + ' from ' + str(beg_fname))
+                ds_beg_nc = get_dataset_pool().get(beg_fname)
+                vals_beg = wrf_funcs.read_fields(ds_beg_nc, 'wrfout', [field_key])[field_key]
+                buffer.put(forecast, product['field'], valid_dt_beg, vals_beg)
+            elif vals_beg is None:
+                print('WARNING: File ' + str(beg_fname) + ' does not exist. ' + product['name'] + ' is missing at ' +
+                      task['valid_dt'].strftime(fmt_wrf_dt))
+        if vals_beg is None:
+            field_vals[(interval_field, product['level'])] = np.full_like(field_vals[field_key], np.nan)
+        else:
+            # Accumulations never decrease, except by rounding
+            field_vals[(interval_field, product['level'])] = np.maximum(field_vals[field_key] - vals_beg, 0.0)
+
+
+def close_dataset_pool():
+    """
+    Procedure to close all WRF output files open in this process.
+    """
+    if dataset_pool is not None:
+        dataset_pool.close_all()
+
+
+def get_process_pool(n_workers):
+    """
+    Function to start a pool of worker processes. The WRF output files open in this process (e.g., by the read
+    estimate of print_plot_plan) are closed first, as the forked workers would otherwise inherit their HDF5 handles,
+    and HDF5 is not fork-safe.
+    -- Input:
+        - n_workers: integer, number of worker processes
+    -- Output:
+        - executor: concurrent.futures.ProcessPoolExecutor object
+    """
+    close_dataset_pool()
+    return concurrent.futures.ProcessPoolExecutor(max_workers=n_workers)
+
+
+def get_image_opts():
+    """
+    Function to get the image encoding options from the USER SETTINGS section.
+    -- Output:
+        - image_opts: dictionary of image encoding options (see image_funcs.get_image_opts)
+    """
+    return image_funcs.get_image_opts({'format': plot_type, 'compress_level': png_compress_level,
+                                       'lossless': image_lossless, 'quality': image_quality})
+
+
+def get_image_writer():
+    """
+    Function to get the image writer of this process, creating it (and its encoding threads) if needed.
+    -- Output:
+        - image_writer: image_funcs.ImageWriter object
+    """
+    global image_writer
+    if image_writer is None:
+        image_writer = image_funcs.ImageWriter(get_image_opts(), n_threads=encode_threads)
+    return image_writer
+
+
+def close_image_writer():
+    """
+    Procedure to wait for all images of this process to be written, and stop its encoding threads.
+    """
+    global image_writer
+    if image_writer is not None:
+        image_writer.close()
+        image_writer = None
+
+
+def get_file_fields(ds_wrf_nc, task, stream):
+    """
+    Function to get the fields of a stream (wrfout, zlev, or plev) needed by all products plotted from the same
+    valid time. They are read following the read plan of those products (see plan_funcs.get_read_plan) the first
+    time any task for that file needs them, and are reused by the following tasks for the same file and products in
+    this process (the frames of an animation only read the fields of their own product, see build_anim_tasks).
+    Only the most recent file of each stream is kept. With memory_budget_mb, the fields computed from 3D inputs (see
+    wrf_funcs.tiled_fields) are computed in tiles of grid rows, and their min/max over the full domain are computed
+    tile by tile (see get_field_minmax).
+    -- Inputs:
+        - ds_wrf_nc: netCDF4 Dataset for the file of the stream
+        - task: dictionary describing the plot (see build_tasks)
+        - stream: string, 'wrfout', 'zlev', or 'plev'
+    -- Outputs:
+        - field_vals: dictionary of (field, level) to 2D numpy array (see wrf_funcs.read_fields)
+        - stats: dictionary of bytes read following the read plan & if each product read its own inputs
+                 (see plan_funcs.estimate_read_bytes), or None if the fields had already been read by an earlier task
+    """
+    fname = task[stream_fnames[stream]]
+    cache_key = (fname, tuple(product['name'] for product in task['file_products']))
+    if stream in field_caches and field_caches[stream][0] == cache_key:
+        return field_caches[stream][1], None
+
+    product_fields = [get_product_fields(product) for product in task['file_products']]
+    read_plan = plan_funcs.get_read_plan(product_fields)
+    print('   Reading fields: ' + ', '.join(field if level is None else field + '[' + f'{level:g}' + ']'
+                                           for field, level in read_plan[stream]))
+    # The fields of the previous file of the stream are no longer needed, so their diagnostic arrays are reused
+    field_caches.pop(stream, None)
+    # Min/max of the tiled fields over the same box as in the titles of full-domain plots
+    field_minmax = {}
+    _, full_inner = get_zoom_slices(None, None, None)
+    field_vals = wrf_funcs.read_fields(ds_wrf_nc, stream, read_plan[stream], buffers=get_diag_buffers(),
+                                       memory_budget=get_memory_budget(), minmax_box=full_inner,
+                                       field_minmax=field_minmax)
+    if stream == 'wrfout':
+        # Plots of interval accumulations whose start file does not exist are skipped (see get_task_inputs)
+        add_interval_fields(task, [interval_product for product in task['file_products']
+                                   for interval_product in get_interval_products(product)
+                                   if get_interval_fname(task, interval_product['interval_h']).is_file()], field_vals)
+    stats = plan_funcs.estimate_read_bytes({stream: ds_wrf_nc}, product_fields)[stream]
+    print('   Read {:.1f} MB of raw fields ({:.1f} MB if each plot read its own inputs)'.format(
+        stats['bytes_read'] / 1e6, stats['bytes_baseline'] / 1e6))
+
+    field_caches[stream] = (cache_key, field_vals, field_minmax)
+    return field_vals, stats
+
+
+def get_field_minmax(stream):
+    """
+    Function to get the min/max over the full-domain plots of the fields of the current file of a stream that were
+    computed in tiles of grid rows, so that the plot titles do not need another pass over those fields.
+    -- Input:
+        - stream: string, 'wrfout', 'zlev', or 'plev'
+    -- Output:
+        - field_minmax: dictionary of (field, level) to (min, max) tuple (empty without memory_budget_mb)
+    """
+    if stream not in field_caches:
+        return {}
+    return field_caches[stream][2]
+
+
+def get_memory_budget():
+    """
+    Function to get the memory budget to compute the fields from 3D inputs in tiles of grid rows.
+    -- Output:
+        - memory_budget: integer [bytes], or None to read their 3D inputs in full
+    """
+    if memory_budget_mb is None:
+        return None
+    return int(memory_budget_mb * 1e6)
+
+
+def plot_tasks(tasks):
+    """
+    Function to run a list of plot tasks in this process, one after another. The image of each plot is compressed &
+    written by the background threads of the image writer while the next plots are drawn, with at most
+    encode_threads images waiting to be written. This is the unit of work that gets sent to each worker process.
+    -- Input:
+        - tasks: list of task dictionaries (see build_tasks)
+    -- Output:
+        - results: list of result dictionaries (see plot_task), in the same order as tasks
+    """
+    results = []
+    writing = collections.deque()
+    for task in tasks:
+        results.append(plot_task(task, wait_image=False))
+        writing.append((task, results[-1]))
+        while len(writing) > encode_threads:
+            finish_image(*writing.popleft())
+    while len(writing) > 0:
+        finish_image(*writing.popleft())
+    return results
+
+
+def plot_task(task, wait_image=True):
+    """
+    Function to run a single plot task, catching any errors so that one bad file or variable does not stop the
+    rest of the batch.
+    -- Inputs:
+        - task: dictionary describing the plot (see build_tasks)
+        - wait_image: boolean, wait for the image to be written before returning (default: True); if False, the
+                      result has the key image_future instead, and must be passed to finish_image
+    -- Output:
+        - result: dictionary with the keys var, valid_dt, fname, status ('ok', 'missing', or 'failed'), error,
+                  read_stats (list of bytes of raw fields read for each file, if this task read them),
+                  timings (list of stage records, see timing_funcs), pool_stats (counts of the open files,
+                  memory use, and interval accumulations of the process after the task, see get_process_stats),
+                  image (format, size in bytes, and encoding time of the image, see image_funcs.encode_image),
+                  and tiles (counts & size of the web map tiles written, see write_map_tiles, if make_tiles is on)
+    """
+    result = {'var': task['var'], 'valid_dt': task['valid_dt'], 'fname': task['fname'], 'status': 'ok',
+              'error': None, 'read_stats': [], 'timings': [], 'pool_stats': None, 'image': None,
+              'image_future': None, 'tiles': None}
+    # Label the stage records of this task, so a slow stage can be traced to its product, zoom box, and valid time
+    timing_funcs.pop_records()
+    timing_funcs.set_labels(**get_task_labels(task))
+    try:
+        with timing_funcs.stage('task'):
+            if not plot_wrf_var(task, result):
+                result['status'] = 'missing'
+    except Exception:
+        result['status'] = 'failed'
+        result['error'] = traceback.format_exc()
+        print('ERROR: Failed to plot ' + str(task['fname']) + '\n' + result['error'])
+    result['timings'] = timing_funcs.pop_records()
+    result['pool_stats'] = get_process_stats()
+    if wait_image:
+        finish_image(task, result)
+    return result
+
+
+def animate_task(anim_task):
+    """
+    Function to make one animation, catching any errors so that one bad file or variable does not stop the rest of
+    the batch. Each frame is drawn like a plot, but instead of being saved to an image file, it is streamed into the
+    animation by an anim_funcs.AnimationWriter. Frames whose input files do not exist are left out.
+    -- Input:
+        - anim_task: dictionary describing the animation (see build_anim_tasks)
+    -- Output:
+        - result: dictionary with the same keys as those of plot_task, with image the summary of the animation file
+                  (see anim_funcs.AnimationWriter.close)
+    """
+    result = {'var': anim_task['var'], 'valid_dt': anim_task['valid_dt'], 'fname': anim_task['fname'],
+              'status': 'ok', 'error': None, 'read_stats': [], 'timings': [], 'pool_stats': None, 'image': None,
+              'image_future': None, 'tiles': None}
+    timing_funcs.pop_records()
+    timing_funcs.set_labels(**get_task_labels(anim_task))
+    frames = [task for task in anim_task['frames'] if all(in_fname.is_file() for in_fname in get_task_inputs(task))]
+    if len(frames) < len(anim_task['frames']):
+        print('WARNING: Leaving ' + str(len(anim_task['frames']) - len(frames)) + ' frame(s) with missing input files '
+              'out of ' + str(anim_task['fname']))
+    if len(frames) == 0:
+        result['status'] = 'missing'
+        return result
+    anim_opts = {'format': anim_type, 'fps': anim_fps, 'lossless': image_lossless, 'quality': image_quality}
+    writer = None
+    try:
+        with timing_funcs.stage('task'):
+            with anim_funcs.AnimationWriter(anim_task['fname'], anim_opts, len(frames)) as writer:
+                for task in frames:
+                    # Label the stages of each frame with its valid time
+                    timing_funcs.set_labels(**get_task_labels(task))
+                    if not plot_wrf_var(task, result, image_writer=writer):
+                        raise FileNotFoundError('Input files of ' + task['valid_dt'].strftime(fmt_wrf_dt) +
+                                                ' are no longer there')
+                    result['image_future'] = None
+                timing_funcs.set_labels(**get_task_labels(anim_task))
+    except Exception:
+        result['status'] = 'failed'
+        result['error'] = traceback.format_exc()
+        print('ERROR: Failed to animate ' + str(anim_task['fname']) + '\n' + result['error'])
+    timing_funcs.set_labels(**get_task_labels(anim_task))
+    result['timings'] = timing_funcs.pop_records()
+    result['pool_stats'] = get_process_stats()
+    if writer is not None and writer.stats is not None:
+        anim_stats = writer.stats
+        result['image'] = {key: anim_stats[key] for key in ['format', 'width', 'height', 'bytes', 'encode_s']}
+        result['timings'].append(timing_funcs.new_record('encode', anim_stats['encode_s'], anim_stats['encode_cpu_s'],
+                                                         get_task_labels(anim_task)))
+        print('-- Wrote {:s} ({:d} frames, {:.1f} kB, encoded in {:.3f} s)'.format(
+            str(anim_task['fname']), anim_stats['n_frames'], anim_stats['bytes'] / 1e3, anim_stats['encode_s']))
+    return result
+
+
+def station_task(stn_task):
+    """
+    Function to extract the station time series of one cycle and plot their meteograms, catching any errors so that
+    one bad file does not stop the rest of the batch. All station products of a valid time are read following one
+    read plan, stacked, and their values at all stations taken with one gather. Valid times whose input files do not
+    exist are left out.
+    -- Input:
+        - stn_task: dictionary describing the station time series (see build_station_tasks)
+    -- Output:
+        - result: dictionary with the same keys as those of plot_task (image is None)
+    """
+    result = {'var': stn_task['var'], 'valid_dt': stn_task['valid_dt'], 'fname': stn_task['fname'],
+              'status': 'ok', 'error': None, 'read_stats': [], 'timings': [], 'pool_stats': None, 'image': None,
+              'image_future': None, 'tiles': None}
+    timing_funcs.pop_records()
+    timing_funcs.set_labels(**get_task_labels(stn_task))
+    products = stn_task['products']
+    product_fields = [plan_funcs.get_product_fields(product, None) for product in products]
+    read_plan = plan_funcs.get_read_plan(product_fields)
+    valid_tasks = [task for task in stn_task['valid_tasks']
+                   if all(task[stream_fnames[stream]].is_file() for stream in ['wrfout'] + list(read_plan))]
+    if len(valid_tasks) < len(stn_task['valid_tasks']):
+        print('WARNING: Leaving ' + str(len(stn_task['valid_tasks']) - len(valid_tasks)) + ' valid time(s) with '
+              'missing input files out of ' + str(stn_task['fname']))
+    if len(valid_tasks) == 0:
+        result['status'] = 'missing'
+        return result
+    try:
+        with timing_funcs.stage('task'):
+            values = []
+            for task in valid_tasks:
+                timing_funcs.set_labels(**get_task_labels(dict(task, var=stn_task['var'])))
+                print('Reading ' + str(task['wrf_fname']))
+                ds_wrf_nc = get_dataset_pool().get(task['wrf_fname'])
+                stations, station_index = get_station_index(ds_wrf_nc, task['wrf_dom'], task['grid_cache_dir'])
+                _, crop, _ = get_static_map_opts(ds_wrf_nc, task['wrf_dom'], None, task['grid_cache_dir'])
+                field_vals = {}
+                for stream, stream_fields in read_plan.items():
+                    ds_stream_nc = get_dataset_pool().get(task[stream_fnames[stream]])
+                    stream_vals = wrf_funcs.read_fields(ds_stream_nc, stream, stream_fields,
+                                                        buffers=get_diag_buffers(), memory_budget=get_memory_budget())
+                    if stream == 'wrfout':
+                        add_interval_fields(task, products, stream_vals)
+                    for (field, level), vals in stream_vals.items():
+                        field_vals[(stream, field, level)] = vals
+                    result['read_stats'].append(
+                        plan_funcs.estimate_read_bytes({stream: ds_stream_nc}, product_fields)[stream])
+                with timing_funcs.stage('stations'):
+                    fields = np.stack([get_product_values(product, field_vals, crop) for product in products])
+                    values.append(station_funcs.extract_stations(fields, station_index))
+            timing_funcs.set_labels(**get_task_labels(stn_task))
+
+            # Time series of all stations (valid time, product, station) in one tidy table, and the meteograms
+            values = np.array(values)
+            valid_dts = [task['valid_dt'] for task in valid_tasks]
+            units = [station_funcs.get_plain_units(product['units']) for product in products]
+            with timing_funcs.stage('write'):
+                df = station_funcs.get_station_table(stations, station_index, stn_task['cycle_dt'], valid_dts,
+                                                     [product['name'] for product in products], units, values)
+                station_funcs.write_station_table(df, stn_task['fname'], station_format)
+            print('-- Wrote {:d} station values ({:d} station(s), {:d} valid time(s), {:d} product(s)) to {:s}'.format(
+                len(df), values.shape[2], values.shape[0], values.shape[1], str(stn_task['fname'])))
+            n_plots = values.shape[2] if station_meteograms is None else min(station_meteograms, values.shape[2])
+            if n_plots > 0:
+                meteogram_name = 'meteogram_wrf_' + stn_task['wrf_dom'] + '_{station}.' + image_funcs.image_formats['png']
+                fname_fmt = str(stn_task['fname'].parent.joinpath('meteograms', meteogram_name))
+                with timing_funcs.stage('meteograms'):
+                    station_funcs.plot_meteograms(fname_fmt, {key: vals[:n_plots] for key, vals in stations.items()},
+                                                  valid_dts, [product['label'] for product in products],
+                                                  [product['units'] for product in products], values[:, :, :n_plots],
+                                                  title=suptitle + ' ' + em_dash + ' Start: ' +
+                                                  stn_task['cycle_dt'].strftime(fmt_time_plot),
+                                                  fontsize=plot_fontsize)
+                print('-- Plotted the meteograms of {:d} station(s) in {:s}'.format(
+                    n_plots, os.path.dirname(fname_fmt)))
+    except Exception:
+        result['status'] = 'failed'
+        result['error'] = traceback.format_exc()
+        print('ERROR: Failed to extract ' + str(stn_task['fname']) + '\n' + result['error'])
+    timing_funcs.set_labels(**get_task_labels(stn_task))
+    result['timings'] = timing_funcs.pop_records()
+    result['pool_stats'] = get_process_stats()
+    return result
+
+
+def get_task_labels(task):
+    """
+    Function to get the labels of the stage records of a plot task (see timing_funcs.set_labels).
+    -- Input:
+        - task: dictionary describing the plot (see build_tasks)
+    -- Output:
+        - labels: dictionary with the keys cycle, product, zoom, valid_time, and pid
+    """
+    return {'cycle': task['cycle_dt'].strftime(fmt_yyyymmdd_hh), 'product': task['var'],
+            'zoom': '' if task['zoom'] is None else task['zoom'],
+            'valid_time': task['valid_dt'].strftime(fmt_wrf_dt_no_s), 'pid': os.getpid()}
+
+
+def finish_image(task, result):
+    """
+    Procedure to wait for the image of a plot task to be written by the image writer, and record its size and
+    encoding time in the task result (as an encode stage record, which is not part of the task stage).
+    A plot whose image could not be written is marked as failed.
+    -- Inputs:
+        - task: dictionary describing the plot (see build_tasks)
+        - result: dictionary of task results (see plot_task), updated with image, timings, status, and error
+    """
+    image_future = result.pop('image_future')
+    if image_future is None:
+        return
+    try:
+        image_stats = image_future.result()
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = ''.join(traceback.format_exception(type(e), e, e.__traceback__))
+        print('ERROR: Failed to write ' + str(task['fname']) + '\n' + result['error'])
+        return
+    result['image'] = {key: image_stats[key] for key in ['format', 'width', 'height', 'bytes', 'encode_s']}
+    result['timings'].append(timing_funcs.new_record('encode', image_stats['encode_s'], image_stats['encode_cpu_s'],
+                                                     get_task_labels(task)))
+    print('-- Wrote {:s} ({:.1f} kB, encoded in {:.3f} s)'.format(str(task['fname']), image_stats['bytes'] / 1e3,
+                                                                 image_stats['encode_s']))
+
+
+def get_product_values(product, field_vals, crop):
+    """
+    Function to get the values of the field of a product, in the units of the plot plan.
+    -- Inputs:
+        - product: product dictionary from the plot plan (see plan_funcs.read_plot_plan)
+        - field_vals: dictionary of (stream, field, level) tuple to 2D array, the fields read from the file
+        - crop: tuple of slices of the plotted area (see get_static_map_opts)
+    -- Outputs:
+        - values: 2D array, with the scale & offset of the product applied
+    """
+    values = field_vals[plan_funcs.get_product_field_key(product)][crop]
+    if product['scale'] is not None:
+        values = values * product['scale']
+    if product['offset'] is not None:
+        values = values + product['offset']
+    return values
+
+
+def get_product_map_opts(product, field_vals, crop, inner, field_minmax=None):
+    """
+    Function to get the map plotting options that differ between products: the field to plot, its colormap,
+    colorbar, and title, and any wind barbs.
+    -- Inputs:
+        - product: product dictionary from the plot plan (see plan_funcs.read_plot_plan)
+        - field_vals: dictionary of (stream, field, level) tuple to 2D array, the fields read for the plot
+        - crop: tuple of slices of the plotted area (see get_static_map_opts)
+        - inner: tuple of slices of the zoom box in the plotted area, for the min/max in the title
+        - field_minmax: dictionary of (stream, field, level) tuple to the (min, max) of the field over inner, for the
+                        fields where they were already computed while reading them (default: None)
+    -- Outputs:
+        - product_opts: dictionary with the keys fill_var, render_mode, extend, cmap, bounds, norm, cbar_lab, title_l,
+                        u, and v (see map_funcs.map_plot)
+    """
+    product_opts = {'u': None, 'v': None}
+    print('   Plotting ' + product['label'])
+    wrf_var1 = get_product_values(product, field_vals, crop)
+    wrf_var2 = wrf_var1
+    if product['mask_le'] is not None:
+        # Mask values at or below mask_le (e.g., no rain) for plotting
+        wrf_var2 = np.ma.masked_equal(np.where(wrf_var1 <= product['mask_le'], missing_val, wrf_var1), missing_val)
+
+    barbs = get_barbs(product)
+    if barbs is not None:
+        barb_fields = get_product_fields(product)[1:]
+        product_opts['u'] = field_vals[barb_fields[0]][crop]
+        product_opts['v'] = field_vals[barb_fields[1]][crop]
+
+    var_name = product['label']
+    var_unit = product['units']
+    # No space between the value and a percent sign
+    unit_sep = '' if var_unit == '%' else ' '
+    field_key = plan_funcs.get_product_field_key(product)
+    if field_minmax is not None and field_key in field_minmax:
+        # The scale & offset of the product are applied to the min/max computed while reading the field (in float32,
+        # as the field itself)
+        min_val, max_val = [np.float32(val) for val in field_minmax[field_key]]
+        if product['scale'] is not None:
+            scale = np.float32(product['scale'])
+            min_val, max_val = sorted([min_val * scale, max_val * scale])
+        if product['offset'] is not None:
+            offset = np.float32(product['offset'])
+            min_val, max_val = min_val + offset, max_val + offset
+    else:
+        min_val = np.nanmin(wrf_var1[inner])
+        max_val = np.nanmax(wrf_var1[inner])
+    cmap, bounds, norm = plan_funcs.get_product_cmap(product)
+    if product['cbar_label'] is None:
+        product_opts['cbar_lab'] = var_name + ' [' + var_unit + ']'
+    else:
+        product_opts['cbar_lab'] = product['cbar_label']
+    if barbs is not None and product['barbs_label'] is not None:
+        var_name = var_name + '; ' + product['barbs_label']
+    title_l = var_name + f'\nMin: {min_val:.1f}' + unit_sep + var_unit + f', Max: {max_val:.1f}' + unit_sep + var_unit
+    product_opts['fill_var'] = wrf_var2
+    product_opts['render_mode'] = get_render_mode(product)
+    product_opts['extend'] = product['extend']
+    product_opts['cmap'] = cmap
+    product_opts['bounds'] = bounds
+    product_opts['norm'] = norm
+    product_opts['title_l'] = title_l
+    return product_opts
+
+
+def plot_wrf_var(task, result, image_writer=None):
+    """
+    Procedure to read in one product for one valid time from WRF output and plot it with map_funcs.map_plot.
+    -- Inputs:
+        - task: dictionary describing the plot (see build_tasks)
+        - result: dictionary of task results (see plot_task), updated with read_stats, image_future, and tiles
+        - image_writer: object to hand the rendered plot to, e.g., an anim_funcs.AnimationWriter to make it a frame
+                        of an animation (default: None, write it to task['fname'] with the image writer of this
+                        process, and make its web map tiles if make_tiles is on)
+    -- Output:
+        - True if the plot was made, False if a required input file does not exist
+    """
+    product = task['product']
+    wrf_fname = task['wrf_fname']
+
+    cycle_dt_plot = task['cycle_dt'].strftime(fmt_time_plot)
+    start_time_plot = 'Start: ' + cycle_dt_plot
+    valid_dt_plot = task['valid_dt'].strftime(fmt_time_plot)
+    valid_time_plot = 'Valid: '+valid_dt_plot
+    title_r = start_time_plot + '\n' + valid_time_plot
+    title_r_blank = ''
+
+    for in_fname in get_task_inputs(task):
+        if not in_fname.is_file():
+            print('WARNING: File ' + str(in_fname) + ' does not exist. Skipping ' + str(task['fname']))
+            return False
+    print('Reading ' + str(wrf_fname))
+    # Use NetCDF4-python Datasets, as wrf-python doesn't yet take an xarray Dataset (opened once for all products)
+    ds_wrf_nc = get_dataset_pool().get(wrf_fname)
+
+    # Every field is cropped to the plotted area (crop), and the min/max in the titles are over the zoom box (inner)
+    with timing_funcs.stage('grid'):
+        map_opts, crop, inner = get_static_map_opts(ds_wrf_nc, task['wrf_dom'], task['zoom'], task['grid_cache_dir'])
+    map_opts = dict(map_opts)
+    map_opts['fname'] = task['fname']
+
+    # Fields shared by all products plotted from the same file are read once per file (see plot_plan.yaml)
+    field_vals = {}
+    field_minmax = {}
+    for stream in ['wrfout', 'zlev', 'plev']:
+        if stream not in [fld_stream for fld_stream, _, _ in get_product_fields(product)]:
+            continue
+        if stream == 'wrfout':
+            ds_stream_nc = ds_wrf_nc
+        else:
+            print('Reading ' + str(task[stream_fnames[stream]]))
+            ds_stream_nc = get_dataset_pool().get(task[stream_fnames[stream]])
+        stream_vals, stats = get_file_fields(ds_stream_nc, task, stream)
+        if stats is not None:
+            result['read_stats'].append(stats)
+        for (field, level), vals in stream_vals.items():
+            field_vals[(stream, field, level)] = vals
+        if task['zoom'] is None:
+            for (field, level), minmax in get_field_minmax(stream).items():
+                field_minmax[(stream, field, level)] = minmax
+
+    # A multi-panel plot draws each of its products in a panel of one map, from the fields read once for the file
+    if product['panels'] is None:
+        map_opts.update(get_product_map_opts(product, field_vals, crop, inner, field_minmax))
+    else:
+        map_opts['panels'] = [get_product_map_opts(panel, field_vals, crop, inner, field_minmax)
+                              for panel in product['panels']]
+        map_opts['panel_cols'] = product['cols']
+    # Static fields (e.g., terrain) show the water color and have no valid time
+    if product['static']:
+        map_opts['water_color'] = water_color
+        map_opts['title_r'] = title_r_blank
+    else:
+        map_opts['water_color'] = 'none'
+        map_opts['title_r'] = title_r
+    if image_writer is None:
+        map_opts['image_writer'] = get_image_writer()
+    else:
+        map_opts['image_writer'] = image_writer
+    result['image_future'] = map_funcs.map_plot(map_opts)
+
+    if make_tiles and task['zoom'] is None and image_writer is None and product['panels'] is None:
+        with timing_funcs.stage('tiles'):
+            result['tiles'] = write_map_tiles(ds_wrf_nc, task, map_opts)
 
+    return True
+
+
+# def main(init_dt_first, init_dt_last, init_stride_h, plot_beg_lead_time, plot_end_lead_time, plot_stride, domain, exp_name):
+def main(script_config_opts):
+    # =============
+    # MAIN PROGRAM:
+    # =============
+
+    # Each (cycle, valid time, variable) combination is a separate task with a deterministic output file name
+    tasks = build_tasks(script_config_opts)
+
+    if script_config_opts['animate']:
+        return animate(tasks, script_config_opts)
+    if script_config_opts['stations']:
+        return extract_station_series(tasks, script_config_opts)
+
+    # Skip plots whose input files and plot options have not changed since they were made
+    stale_tasks = get_stale_tasks(tasks)
+    if not script_config_opts['force']:
+        n_skip = len(tasks) - len(stale_tasks)
+        if n_skip > 0:
+            print('Skipping ' + str(n_skip) + ' up-to-date plot(s) (use --force to rebuild them)')
+        tasks = stale_tasks
+
+    print_plot_plan(tasks, script_config_opts)
+
+    if script_config_opts['dry_run']:
+        print('Dry run: ' + str(len(tasks)) + ' plot(s) would be (re)built:')
+        for task in tasks:
+            print('   ' + str(task['fname']))
+        return []
+
+    n_tasks = len(tasks)
+    n_workers = script_config_opts['workers']
+
+    if script_config_opts['follow']:
+        # Plot each wrfout file as soon as WRF has finished writing it (the manifests are updated as plots are made)
+        tasks, results = follow(tasks, script_config_opts)
+        close_image_writer()
+        close_dataset_pool()
+        report_results(results, script_config_opts)
+        return results
+    elif n_workers > 1:
+        print('Running ' + str(n_tasks) + ' plot tasks on ' + str(n_workers) + ' worker processes')
+        # Hand out tasks for the same valid time together where possible, so each worker tends to stay on one file
+        chunksize = max(1, min(len(script_config_opts['products']), n_tasks // n_workers))
+        chunks = [tasks[i_task:i_task + chunksize] for i_task in range(0, n_tasks, chunksize)]
+        with get_process_pool(n_workers) as executor:
+            results = [result for chunk_results in executor.map(plot_tasks, chunks) for result in chunk_results]
+    else:
+        results = plot_tasks(tasks)
+    close_image_writer()
+    close_dataset_pool()
+    update_manifests(tasks, results)
+    write_timings(tasks, results, script_config_opts)
+    report_results(results, script_config_opts)
+
+    return results
+
+
+def animate(tasks, script_config_opts):
+    """
+    Function to make the animations of the animated products (anim_products) instead of their individual plots.
+    Animations are always rebuilt from all valid times, whether or not the plots of their frames are up to date.
+    -- Inputs:
+        - tasks: list of plot task dictionaries (see build_tasks)
+        - script_config_opts: dictionary of configuration options from parse_args
+    -- Output:
+        - results: list of result dictionaries from animate_task
+    """
+    anim_tasks = build_anim_tasks(tasks)
+    if script_config_opts['dry_run']:
+        print('Dry run: ' + str(len(anim_tasks)) + ' animation(s) would be made:')
+        for anim_task in anim_tasks:
+            print('   ' + str(anim_task['fname']) + ' (' + str(len(anim_task['frames'])) + ' frames)')
+        return []
+
+    n_workers = script_config_opts['workers']
+    print('Making ' + str(len(anim_tasks)) + ' ' + anim_type + ' animation(s) of ' +
+          ', '.join(sorted(set(anim_task['var'] for anim_task in anim_tasks))))
+    if n_workers > 1:
+        with get_process_pool(n_workers) as executor:
+            results = list(executor.map(animate_task, anim_tasks))
+    else:
+        results = [animate_task(anim_task) for anim_task in anim_tasks]
+    close_dataset_pool()
+    write_timings(anim_tasks, results, script_config_opts)
+    report_results(results, script_config_opts)
+    return results
+
+
+def extract_station_series(tasks, script_config_opts):
+    """
+    Function to extract the time series of the station products (station_products) at the stations, and plot their
+    meteograms, instead of making the individual plots. They are always rebuilt from all valid times.
+    -- Inputs:
+        - tasks: list of plot task dictionaries (see build_tasks)
+        - script_config_opts: dictionary of configuration options from parse_args
+    -- Output:
+        - results: list of result dictionaries from station_task
+    """
+    station_tasks = build_station_tasks(tasks, script_config_opts['products'])
+    if script_config_opts['dry_run']:
+        print('Dry run: ' + str(len(station_tasks)) + ' station time series file(s) would be made:')
+        for stn_task in station_tasks:
+            print('   ' + str(stn_task['fname']) + ' (' + str(len(stn_task['valid_tasks'])) + ' valid times)')
+        return []
+
+    n_workers = script_config_opts['workers']
+    print('Extracting ' + ', '.join(station_products) + ' at ' + str(len(get_stations()['name'])) + ' station(s)')
+    if n_workers > 1:
+        with get_process_pool(n_workers) as executor:
+            results = list(executor.map(station_task, station_tasks))
+    else:
+        results = [station_task(stn_task) for stn_task in station_tasks]
+    close_dataset_pool()
+    write_timings(station_tasks, results, script_config_opts)
+    report_results(results, script_config_opts)
+    return results
+
+
+def print_plot_plan(tasks, script_config_opts):
+    """
+    Procedure to print the raw variables (and levels) that the plot plan reads from each stream, and an estimate of
+    the read volume for a list of plot tasks, from the shapes of the variables in the first files found.
+    -- Inputs:
+        - tasks: list of task dictionaries (see build_tasks)
+        - script_config_opts: dictionary of configuration options from parse_args
+    """
+    products = script_config_opts['products']
+    print('Plot plan: ' + ', '.join(product['name'] for product in products))
+    plan_funcs.print_read_plan(plan_funcs.get_read_plan([get_product_fields(product) for product in products]))
+
+    ds_by_stream = {}
+    for task in tasks:
+        for stream, stream_key in stream_fnames.items():
+            if stream not in ds_by_stream and task[stream_key].is_file():
+                try:
+                    ds_by_stream[stream] = get_dataset_pool().get(task[stream_key])
+                except OSError as e:
+                    # Leave a corrupt file to be reported by the tasks that read it
+                    print('WARNING: Could not open ' + str(task[stream_key]) + ' to estimate the read volume: ' + str(e))
+    if len(ds_by_stream) == 0:
+        return
+
+    # All plots (incl. zoom boxes) from the same valid time share one read of each file
+    bytes_read = 0
+    bytes_baseline = 0
+    valid_fnames = []
+    for task in tasks:
+        if task['wrf_fname'] in valid_fnames:
+            continue
+        valid_fnames.append(task['wrf_fname'])
+        product_fields = [get_product_fields(product) for product in task['file_products']]
+        for stats in plan_funcs.estimate_read_bytes(ds_by_stream, product_fields).values():
+            bytes_read += stats['bytes_read']
+            bytes_baseline += stats['bytes_baseline']
+    print('   Estimated read volume: {:.1f} MB for {:d} valid time(s) ({:.1f} MB if each plot read its own inputs)'.format(
+        bytes_read / 1e6, len(valid_fnames), bytes_baseline / 1e6))
+
+
+def report_results(results, script_config_opts):
+    """
+    Procedure to print a summary of a batch of plot tasks. Any tasks that did not produce a plot are reported here,
+    without having stopped the rest of the batch.
+    -- Inputs:
+        - results: list of result dictionaries from plot_task
+        - script_config_opts: dictionary of configuration options from parse_args
+    """
+    n_tasks = len(results)
+    failed = [result for result in results if result['status'] == 'failed']
+    missing = [result for result in results if result['status'] == 'missing']
+    print('\nCompleted ' + str(n_tasks - len(failed) - len(missing)) + ' of ' + str(n_tasks) + ' plot tasks')
+    read_stats = [stats for result in results for stats in result['read_stats']]
+    if len(read_stats) > 0:
+        bytes_read = sum(stats['bytes_read'] for stats in read_stats)
+        bytes_baseline = sum(stats['bytes_baseline'] for stats in read_stats)
+        print('Read {:.1f} MB of raw fields ({:.1f} MB if each plot read its own inputs)'.format(
+            bytes_read / 1e6, bytes_baseline / 1e6))
+    # The file counters of each process are cumulative, so its last result has its totals
+    pool_stats = {}
+    for result in results:
+        if result['pool_stats'] is not None:
+            pool_stats.setdefault(result['pool_stats']['pid'], []).append(result['pool_stats'])
+    if len(pool_stats) > 0:
+        n_opened = sum(stats[-1]['n_opened'] for stats in pool_stats.values())
+        n_reused = sum(stats[-1]['n_reused'] for stats in pool_stats.values())
+        max_open = max(stats[-1]['max_open'] for stats in pool_stats.values())
+        print('WRF output files: {:d} opened, {:d} reads shared an open file, at most {:d} open at once per process'.format(
+            n_opened, n_reused, max_open))
+        diag_stats = [stats[-1]['diag'] for stats in pool_stats.values() if stats[-1]['diag'] is not None]
+        if len(diag_stats) > 0:
+            print('Diagnostics: {:d} output arrays allocated, {:d} reused from earlier files ({:.1f} MB per process)'
+                  .format(sum(stats['n_allocated'] for stats in diag_stats),
+                          sum(stats['n_reused'] for stats in diag_stats),
+                          max(stats['n_bytes'] for stats in diag_stats) / 1e6))
+        accum_stats = [stats[-1]['accum'] for stats in pool_stats.values() if stats[-1]['accum'] is not None]
+        if len(accum_stats) > 0:
+            print('Interval accumulations: {:d} from the buffer of earlier valid times, {:d} read from earlier files'
+                  .format(sum(stats['n_hits'] for stats in accum_stats),
+                          sum(stats['n_misses'] for stats in accum_stats)))
+        for pid, stats in pool_stats.items():
+            if stats[0]['rss_mb'] is not None:
+                print('   Memory (RSS) of process {:d}: {:.1f} MB after its first task, {:.1f} MB after its last'.format(
+                    pid, stats[0]['rss_mb'], stats[-1]['rss_mb']))
+    images = [result['image'] for result in results if result['image'] is not None]
+    if len(images) > 0:
+        n_bytes = sum(image['bytes'] for image in images)
+        encode_s = sum(image['encode_s'] for image in images)
+        img_formats = '/'.join(sorted(set(image['format'] for image in images)))
+        print('Images: {:d} {:s} file(s), {:.1f} MB ({:.1f} kB each on average), encoded in {:.2f} s ({:.3f} s each)'
+              .format(len(images), img_formats, n_bytes / 1e6, n_bytes / 1e3 / len(images), encode_s,
+                      encode_s / len(images)))
+    tiles = [result['tiles'] for result in results if result['tiles'] is not None]
+    if len(tiles) > 0:
+        n_tiles = sum(tile_stats['n_tiles'] for tile_stats in tiles)
+        print('Web map tiles: {:d} tiles of {:d} plot(s), {:.1f} MB, {:d} empty tiles skipped'.format(
+            n_tiles, len(tiles), sum(tile_stats['bytes'] for tile_stats in tiles) / 1e6,
+            sum(tile_stats['n_empty'] for tile_stats in tiles)))
+    if script_config_opts['timing_summary']:
+        records = [record for result in results for record in result['timings']]
+        if len(records) > 0:
+            print('\nTime & memory use by stage (the task stage includes all the other stages of a plot):')
+            timing_funcs.print_summary(records, ('stage',))
+            print('\nTime & memory use by product:')
+            timing_funcs.print_summary([record for record in records if record['stage'] == 'task'], ('product',))
+    if len(missing) > 0:
+        print('WARNING: ' + str(len(missing)) + ' plot task(s) skipped due to missing input files')
+    if len(failed) > 0:
+        print('WARNING: ' + str(len(failed)) + ' plot task(s) failed:')
+        for result in failed:
+            print('   ' + result['var'] + ' ' + result['valid_dt'].strftime(fmt_wrf_dt) + ': ' +
+                  result['error'].strip().split('\n')[-1])
 
 
 def parse_args():
@@ -601,6 +1933,30 @@ def parse_args():
     parser.add_argument('-s', '--str_lead_time', default=180, type=int,
                         help='stride to create plots every N minutes (default: 180)')
     parser.add_argument('-d', '--domain', default='1', help='WRF domain number to be plotted (default: 1)')
+    parser.add_argument('-p', '--plot_plan', default=None,
+                        help='YAML plot plan file, listing the products to plot (default: plot_plan.yaml next to '
+                             'this script)')
+    parser.add_argument('-n', '--workers', default=1, type=int,
+                        help='number of worker processes to make plots in parallel (default: 1)')
+    parser.add_argument('--force', action='store_true',
+                        help='rebuild all plots, even those whose inputs and plot options have not changed since '
+                             'they were made according to the plot manifest of each cycle')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='list the plots that would be (re)built, without making them')
+    parser.add_argument('--follow', action='store_true',
+                        help='watch for wrfout files as WRF writes them, and make their plots as soon as each file '
+                             'is complete')
+    parser.add_argument('--follow_timeout', default=60, type=float,
+                        help='in --follow mode, stop after waiting this many minutes for new WRF output (default: 60)')
+    parser.add_argument('--animate', action='store_true',
+                        help='instead of the individual plots, make one animation (anim_type) of each product in '
+                             'anim_products over all valid times of each cycle')
+    parser.add_argument('--stations', action='store_true',
+                        help='instead of the individual plots, extract time series of station_products at the '
+                             'stations of each cycle, and plot their meteograms')
+    parser.add_argument('--timing_summary', action='store_true',
+                        help='print a table of the time & memory use of each plotting stage and product at the end '
+                             'of the run')
     # parser.add_argument('-x', '--exp_name', default=None,
     #                     help='WRF experiment name(s), if applicable. If requesting plots for multiple experiments, '
     #                          'separate them by commas (e.g., exp01,exp02).')
@@ -615,6 +1971,15 @@ def parse_args():
     end_lead_time = args.end_lead_time
     str_lead_time = args.str_lead_time
     domain = args.domain
+    plot_plan = args.plot_plan
+    workers = args.workers
+    force = args.force
+    dry_run = args.dry_run
+    follow = args.follow
+    follow_timeout = args.follow_timeout
+    timing_summary = args.timing_summary
+    animate = args.animate
+    stations = args.stations
     # exp_names_inp = args.exp_name
 
     # if exp_names_inp is None:
@@ -668,6 +2033,45 @@ def parse_args():
         parser.print_help()
         sys.exit()
 
+    if plot_plan is None:
+        plot_plan = plot_plan_fname
+    try:
+        products = plan_funcs.read_plot_plan(plot_plan)
+    except (OSError, ValueError, yaml.YAMLError) as e:
+        print('ERROR! Could not read plot plan ' + str(plot_plan) + ': ' + str(e) + '. Exiting!')
+        sys.exit()
+
+    if animate:
+        try:
+            anim_funcs.get_anim_opts({'format': anim_type, 'fps': anim_fps})
+        except ValueError as e:
+            print('ERROR! Cannot make animations: ' + str(e) + '. Exiting!')
+            sys.exit()
+
+    if stations:
+        if animate:
+            print('ERROR! Optional arguments --animate and --stations cannot be used together. Exiting!')
+            sys.exit()
+        missing = [name for name in station_products
+                   if name not in [product['name'] for product in products if product['panels'] is None]]
+        if len(missing) > 0:
+            print('ERROR! Station product(s) not in the plot plan: ' + ', '.join(missing) + '. Exiting!')
+            sys.exit()
+        if station_file is None and not plot_stations:
+            print('ERROR! No stations to extract: set station_file or plot_stations. Exiting!')
+            sys.exit()
+        try:
+            station_funcs.check_station_format(station_format)
+            get_stations()
+        except (OSError, ValueError) as e:
+            print('ERROR! Cannot extract station time series: ' + str(e) + '. Exiting!')
+            sys.exit()
+
+    if workers < 1:
+        print('ERROR! Optional argument -n (workers) must be at least 1. Exiting!')
+        parser.print_help()
+        sys.exit()
+
     # Put all these configuration options into a dictionary, to make further development or customization easier
     script_config_opts = {
         'wrf_dir_parent': wrf_dir_parent,
@@ -679,6 +2083,16 @@ def parse_args():
         'end_lead_time': end_lead_time,
         'str_lead_time': str_lead_time,
         'domain': domain,
+        'products': products,
+        'workers': workers,
+        'force': force,
+        'dry_run': dry_run,
+        'follow': follow,
+        'follow_timeout': follow_timeout,
+        'timing_summary': timing_summary,
+        'animate': animate,
+        'stations': stations,
+        'run_id': dt.datetime.utcnow().strftime(fmt_dt),
         # 'exp_name': exp_name,
     }
 
@@ -690,12 +2104,18 @@ if __name__ == '__main__':
     # init_dt_first, init_dt_last, init_stride_h, plot_beg_lead_time, plot_end_lead_time, plot_stride, domain, exp_name = parse_args()
     # main(init_dt_first, init_dt_last, init_stride_h, plot_beg_lead_time, plot_end_lead_time, plot_stride, domain, exp_name)
     script_config_opts = parse_args()
-    main(script_config_opts)
+    results = main(script_config_opts)
+    n_failed = len([result for result in results if result['status'] == 'failed'])
     now_time_end = dt.datetime.utcnow()
     run_time_tot = now_time_end - now_time_beg
     now_time_beg_str = now_time_beg.strftime('%Y-%m-%d %H:%M:%S')
     now_time_end_str = now_time_end.strftime('%Y-%m-%d %H:%M:%S')
-    print('\nScript completed successfully.')
+    if n_failed == 0:
+        print('\nScript completed successfully.')
+    else:
+        print('\nScript completed with ' + str(n_failed) + ' failed plot task(s).')
     print('   Beg time: '+now_time_beg_str)
     print('   End time: '+now_time_end_str)
     print('   Run time: '+str(run_time_tot)+'\n')
+    if n_failed > 0:
+        sys.exit(1)
@@ -0,0 +1,138 @@
+"""
+refl_funcs.py
+
+This file contains functions to compute simulated radar reflectivity from the hydrometeors in wrfout files, with the
+same formula as wrf-python's dbz diagnostic (constant intercept parameters, no liquid skin, as wrf.getvar(ds, 'dbz')),
+but without computing it on every model level when only some are needed:
+    - the reflectivity on the lowest model level, from the bottom level of each input variable only
+    - the composite (column-maximum) reflectivity, as a running maximum over blocks of levels, so that the 3D
+      reflectivity field is never held in memory at once
+
+Composite reflectivity is also the field that is compared with NEXRAD composite reflectivity to verify simulations.
+"""
+
+import numpy as np
+
+# Raw wrfout variables read to compute the reflectivity (the snow & graupel mixing ratios are optional)
+refl_raw_vars = ['T', 'P', 'PB', 'QVAPOR', 'QRAIN', 'QSNOW', 'QGRAUP']
+
+# Constants of the reflectivity formula, as in wrf-python (wrf_user_dbz.f90)
+gamma_seven = 720.0
+rho_water = 1000.0
+rho_snow = 100.0
+rho_graupel = 400.0
+alpha = 0.224
+rn0_rain = 8.0e6
+rn0_snow = 2.0e7
+rn0_graupel = 4.0e6
+t_freeze = 273.15
+t_base = 300.0
+p_base = 100000.0
+eps = 0.622
+Rd = 287.0
+Cp = 7.0 * Rd / 2.0
+
+# Reflectivity factor of each hydrometeor per (density x mixing ratio)^1.75 [mm^6 m^-3]
+factor_rain = gamma_seven * 1.0e18 * (1.0 / (np.pi * rho_water)) ** 1.75 / rn0_rain ** 0.75
+factor_snow = (gamma_seven * 1.0e18 * (1.0 / (np.pi * rho_snow)) ** 1.75 * (rho_snow / rho_water) ** 2 * alpha /
+               rn0_snow ** 0.75)
+factor_graupel = (gamma_seven * 1.0e18 * (1.0 / (np.pi * rho_graupel)) ** 1.75 * (rho_graupel / rho_water) ** 2 *
+                  alpha / rn0_graupel ** 0.75)
+
+# Number of model levels read & computed at once for the composite reflectivity (see get_composite_refl)
+levels_per_read = 8
+
+def calc_refl(t, p, pb, qv, qr, qs=None, qg=None, sn0=True):
+    """
+    Function to compute the simulated radar reflectivity from the raw wrfout variables, on any number of levels.
+    -- Inputs:
+        - t: array of perturbation potential temperature [K] (T)
+        - p, pb: arrays of perturbation & base state pressure [Pa] (P, PB)
+        - qv, qr, qs, qg: arrays of water vapor, rain, snow, and graupel mixing ratios [kg kg-1] (QVAPOR, QRAIN,
+                          QSNOW, QGRAUP; qs & qg may be None if the microphysics scheme does not have them)
+        - sn0: boolean, True if the microphysics scheme has snow; if False, rain below freezing is taken as snow
+    -- Output:
+        - dbz: float32 array of the same shape, reflectivity [dBZ]
+    """
+    pres = np.asarray(p, np.float64) + pb
+    tk = (np.asarray(t, np.float64) + t_base) * (pres / p_base) ** (Rd / Cp)
+    qv = np.maximum(qv, 0.0)
+    qr = np.maximum(qr, 0.0)
+    qs = np.zeros_like(qr) if qs is None else np.maximum(qs, 0.0)
+    qg = np.zeros_like(qr) if qg is None else np.maximum(qg, 0.0)
+    if not sn0:
+        qs = np.where(tk < t_freeze, qr, qs)
+        qr = np.where(tk < t_freeze, 0.0, qr)
+    rho_air = pres / (Rd * tk * (eps + qv) / (eps * (1.0 + qv)))
+    z_e = (factor_rain * (rho_air * qr) ** 1.75 + factor_snow * (rho_air * qs) ** 1.75 +
+           factor_graupel * (rho_air * qg) ** 1.75)
+    return (10.0 * np.log10(np.maximum(z_e, 0.001))).astype(np.float32)
+
+def read_refl_inputs(ds_wrf_nc, k_beg, k_end, timeidx=0, cache=None, rows=slice(None)):
+    """
+    Function to read a block of model levels of the raw variables of the reflectivity.
+    -- Inputs:
+        - ds_wrf_nc: netCDF4 Dataset for a wrfout file
+        - k_beg, k_end: integers, first & last + 1 model levels to read
+        - timeidx: integer, time index to read (default: 0)
+        - cache: dictionary of raw variable name to array (Time, bottom_top, south_north, west_east) already read
+                 in full (see wrf_funcs.read_diag_cache), used instead of reading those variables again
+        - rows: slice of the grid rows (south_north) to read (default: all rows)
+    -- Output:
+        - inputs: dictionary of raw variable name (see refl_raw_vars) to 3D array (level, south_north, west_east),
+                  with None for the optional variables that are not in the file
+    """
+    inputs = {}
+    for raw_var in refl_raw_vars:
+        if cache is not None and raw_var in cache:
+            inputs[raw_var] = cache[raw_var][0, k_beg:k_end, rows, :]
+        elif raw_var in ds_wrf_nc.variables:
+            inputs[raw_var] = np.asarray(ds_wrf_nc.variables[raw_var][timeidx, k_beg:k_end, rows, :])
+        else:
+            inputs[raw_var] = None
+    return inputs
+
+def get_lowest_refl(ds_wrf_nc, timeidx=0, cache=None, rows=slice(None)):
+    """
+    Function to compute the reflectivity on the lowest model level, reading only the bottom level of its inputs.
+    NOTE: Whether the microphysics scheme has snow is taken from whether QSNOW is in the file, whereas wrf-python
+          checks whether QSNOW is zero everywhere in the 3D field (they only differ if QSNOW is in the file but zero
+          everywhere, and then only where rain is below freezing).
+    -- Inputs:
+        - ds_wrf_nc: netCDF4 Dataset for a wrfout file
+        - timeidx: integer, time index to read (default: 0)
+        - cache: dictionary of raw variables already read in full (see read_refl_inputs)
+        - rows: slice of the grid rows (south_north) to compute (default: all rows)
+    -- Output:
+        - dbz: 2D float32 array, reflectivity [dBZ]
+    """
+    inputs = read_refl_inputs(ds_wrf_nc, 0, 1, timeidx=timeidx, cache=cache, rows=rows)
+    return calc_refl(inputs['T'], inputs['P'], inputs['PB'], inputs['QVAPOR'], inputs['QRAIN'], inputs['QSNOW'],
+                     inputs['QGRAUP'], sn0=inputs['QSNOW'] is not None)[0, :, :]
+
+def get_composite_refl(ds_wrf_nc, timeidx=0, cache=None, n_levels=None, rows=slice(None)):
+    """
+    Function to compute the composite (column-maximum) reflectivity as a running maximum over blocks of model
+    levels, so that only n_levels levels of its inputs and of the 3D reflectivity are in memory at once.
+    (See get_lowest_refl for how the snow of the microphysics scheme is detected.)
+    -- Inputs:
+        - ds_wrf_nc: netCDF4 Dataset for a wrfout file
+        - timeidx: integer, time index to read (default: 0)
+        - cache: dictionary of raw variables already read in full (see read_refl_inputs)
+        - n_levels: integer, number of levels read at once (default: levels_per_read)
+        - rows: slice of the grid rows (south_north) to compute (default: all rows)
+    -- Output:
+        - dbz: 2D float32 array, composite reflectivity [dBZ]
+    """
+    if n_levels is None:
+        n_levels = levels_per_read
+    nz = ds_wrf_nc.dimensions['bottom_top'].size
+    sn0 = 'QSNOW' in ds_wrf_nc.variables
+    dbz_max = None
+    for k_beg in range(0, nz, max(1, n_levels)):
+        inputs = read_refl_inputs(ds_wrf_nc, k_beg, min(nz, k_beg + n_levels), timeidx=timeidx, cache=cache,
+                                  rows=rows)
+        dbz = calc_refl(inputs['T'], inputs['P'], inputs['PB'], inputs['QVAPOR'], inputs['QRAIN'], inputs['QSNOW'],
+                        inputs['QGRAUP'], sn0=sn0).max(axis=0)
+        dbz_max = dbz if dbz_max is None else np.maximum(dbz_max, dbz)
+    return dbz_max
@@ -0,0 +1,236 @@
+"""
+station_funcs.py
+
+This file contains functions to extract time series of WRF fields at point locations (stations), write them to tidy
+CSV or Parquet files, and plot them as meteograms.
+
+Finding the grid points around each station (get_station_index) only depends on the grid, so it is done once per
+domain with a KD-tree of the projected grid points, and reused for every field and valid time. Extracting the values
+of a set of fields at all stations (extract_stations) is then a single gather from the stacked fields, so the cost
+does not depend on the number of stations in Python:
+    station_index = station_funcs.get_station_index(proj_x, proj_y, cart_proj, stn_lats, stn_lons, 'bilinear')
+    values = station_funcs.extract_stations(np.stack([t2, rh2, slp]), station_index)   # (3, n_stations)
+"""
+
+import os
+import re
+import importlib.util
+import numpy as np
+import pandas as pd
+import matplotlib as mpl
+import matplotlib.pyplot as plt
+import cartopy.crs as ccrs
+from scipy.spatial import cKDTree
+
+# Station interpolation methods, with the number of grid points each station value is taken from
+station_interps = {'nearest': 1, 'bilinear': 4}
+
+# File name extension of each station time series format
+station_formats = {'csv': 'csv', 'parquet': 'parquet'}
+
+def check_station_format(station_format):
+    """
+    Procedure to check that station time series can be written in a format, before any are extracted.
+    -- Input:
+        - station_format: string, 'csv' or 'parquet'
+    """
+    if station_format not in station_formats:
+        raise ValueError('Unknown station format ' + str(station_format) + ', expected one of: ' +
+                         ', '.join(station_formats))
+    if station_format == 'parquet' and all(importlib.util.find_spec(engine) is None
+                                           for engine in ['pyarrow', 'fastparquet']):
+        raise ValueError('Parquet files need the pyarrow or fastparquet package')
+
+def read_stations(fname):
+    """
+    Function to read a list of stations from a CSV file with the columns name, lat, and lon (other columns are
+    ignored).
+    -- Input:
+        - fname: string or pathlib object, CSV file name
+    -- Output:
+        - stations: dictionary with the keys name (array of strings), lat & lon (arrays of floats) [degrees]
+    """
+    df = pd.read_csv(fname, skipinitialspace=True, comment='#')
+    missing = [col for col in ['name', 'lat', 'lon'] if col not in df.columns]
+    if len(missing) > 0:
+        raise ValueError('Missing column(s) in station file ' + str(fname) + ': ' + ', '.join(missing))
+    if df['name'].duplicated().any():
+        raise ValueError('Station names are not unique in ' + str(fname))
+    return {'name': df['name'].astype(str).to_numpy(), 'lat': df['lat'].to_numpy(float),
+            'lon': df['lon'].to_numpy(float)}
+
+def get_station_index(proj_x, proj_y, cart_proj, stn_lats, stn_lons, interp='nearest'):
+    """
+    Function to find the grid points to take the values of a set of stations from, and their weights.
+    The nearest grid point of each station is found with a KD-tree of the grid points in map projection coordinates.
+    For bilinear interpolation, the weights of the 4 grid points around the station are then computed from its
+    position in the grid cell, assuming the grid is regular in its map projection, as WRF grids are.
+    -- Inputs:
+        - proj_x, proj_y: 2D arrays of the grid projected to cart_proj coordinates (see map_funcs.get_projected_coords)
+        - cart_proj: Cartopy object, map projection of the grid
+        - stn_lats, stn_lons: 1D arrays of station latitudes & longitudes [degrees]
+        - interp: string, 'nearest' (value of the nearest grid point) or 'bilinear' (default: 'nearest')
+    -- Output:
+        - station_index: dictionary with the keys
+            - index: 2D array of int (station, point) of the flat (row-major) indices of the grid points
+            - weights: 2D array of float (station, point) of their weights, NaN for stations outside the grid
+            - inside: 1D boolean array, stations inside the grid
+            - grid_lat, grid_lon: 1D arrays of the latitude & longitude of the nearest grid point of each station
+            - dist_km: 1D array of the distance from each station to its nearest grid point [km of map coordinates]
+    """
+    if interp not in station_interps:
+        raise ValueError('Unknown station interpolation ' + str(interp) + ', expected one of: ' +
+                         ', '.join(station_interps))
+    n_y, n_x = proj_x.shape
+    stn_xyz = cart_proj.transform_points(ccrs.PlateCarree(), np.asarray(stn_lons, float), np.asarray(stn_lats, float))
+    stn_x = stn_xyz[:, 0]
+    stn_y = stn_xyz[:, 1]
+
+    tree = cKDTree(np.column_stack([np.ravel(proj_x), np.ravel(proj_y)]))
+    dist, nearest = tree.query(np.column_stack([stn_x, stn_y]))
+    jj, ii = np.unravel_index(nearest, proj_x.shape)
+
+    # A station is inside the grid if it is within half a grid cell of the outer grid points
+    dx = (proj_x[0, -1] - proj_x[0, 0]) / max(n_x - 1, 1)
+    dy = (proj_y[-1, 0] - proj_y[0, 0]) / max(n_y - 1, 1)
+    fi = ii + (stn_x - proj_x[jj, ii]) / dx
+    fj = jj + (stn_y - proj_y[jj, ii]) / dy
+    inside = (fi >= -0.5) & (fi <= n_x - 0.5) & (fj >= -0.5) & (fj <= n_y - 0.5)
+
+    if interp == 'nearest':
+        index = nearest[:, np.newaxis]
+        weights = np.ones((len(nearest), 1))
+    else:
+        # Lower left grid point of the cell around the station, kept inside the grid at its edges
+        i0 = np.clip(np.floor(fi).astype(int), 0, max(n_x - 2, 0))
+        j0 = np.clip(np.floor(fj).astype(int), 0, max(n_y - 2, 0))
+        wx = np.clip(fi - i0, 0.0, 1.0)
+        wy = np.clip(fj - j0, 0.0, 1.0)
+        i1 = np.minimum(i0 + 1, n_x - 1)
+        j1 = np.minimum(j0 + 1, n_y - 1)
+        index = np.column_stack([j0 * n_x + i0, j0 * n_x + i1, j1 * n_x + i0, j1 * n_x + i1])
+        weights = np.column_stack([(1 - wx) * (1 - wy), wx * (1 - wy), (1 - wx) * wy, wx * wy])
+    weights[~inside] = np.nan
+
+    grid_lonlat = ccrs.PlateCarree().transform_points(cart_proj, proj_x[jj, ii], proj_y[jj, ii])
+    return {'index': index, 'weights': weights, 'inside': inside,
+            'grid_lat': grid_lonlat[:, 1], 'grid_lon': grid_lonlat[:, 0], 'dist_km': dist / 1000.0}
+
+def extract_stations(fields, station_index):
+    """
+    Function to get the values of a stack of fields at a set of stations, with one gather of the grid points of all
+    stations from all fields.
+    -- Inputs:
+        - fields: 3D array (field, south_north, west_east), e.g., np.stack of 2D fields on the grid of station_index
+        - station_index: dictionary from get_station_index
+    -- Output:
+        - values: 2D array (field, station), NaN for stations outside the grid and for masked values
+    """
+    fields = np.ma.filled(np.ma.asarray(fields, dtype=float), np.nan)
+    points = fields.reshape(fields.shape[0], -1)[:, station_index['index']]
+    return np.sum(points * station_index['weights'], axis=-1)
+
+def get_station_table(stations, station_index, cycle_dt, valid_dts, names, units, values):
+    """
+    Function to build the tidy table of station time series: one row per station, valid time, and variable.
+    -- Inputs:
+        - stations: dictionary with the keys name, lat, and lon (see read_stations)
+        - station_index: dictionary from get_station_index
+        - cycle_dt: pandas Timestamp, forecast cycle
+        - valid_dts: list of pandas Timestamps, valid times
+        - names, units: lists of strings, variable names & units
+        - values: 3D array (valid time, variable, station)
+    -- Output:
+        - df: pandas DataFrame with the columns cycle, valid, lead_h, station, lat, lon, grid_lat, grid_lon, variable,
+              units, and value
+    """
+    n_times, n_vars, n_stations = values.shape
+    valid = pd.DatetimeIndex(valid_dts)
+    # Index arrays in the order of the values (time, variable, station), repeated or tiled instead of looped over
+    tt = np.repeat(np.arange(n_times), n_vars * n_stations)
+    vv = np.tile(np.repeat(np.arange(n_vars), n_stations), n_times)
+    ss = np.tile(np.arange(n_stations), n_times * n_vars)
+    return pd.DataFrame({
+        'cycle': cycle_dt, 'valid': valid[tt], 'lead_h': ((valid - cycle_dt) / pd.Timedelta(hours=1))[tt],
+        'station': stations['name'][ss], 'lat': stations['lat'][ss], 'lon': stations['lon'][ss],
+        'grid_lat': station_index['grid_lat'][ss], 'grid_lon': station_index['grid_lon'][ss],
+        'variable': np.asarray(names)[vv], 'units': np.asarray(units)[vv], 'value': values.ravel(),
+    })
+
+def write_station_table(df, fname, station_format):
+    """
+    Procedure to write a table of station time series. The file is written under a temporary name and then renamed,
+    so a partly written file never appears under its final name.
+    -- Inputs:
+        - df: pandas DataFrame from get_station_table
+        - fname: pathlib object, output file name
+        - station_format: string, 'csv' or 'parquet'
+    """
+    os.makedirs(fname.parent, exist_ok=True)
+    tmp_fname = fname.with_name(fname.name + '.tmp')
+    if station_format == 'csv':
+        df.to_csv(tmp_fname, index=False, float_format='%.6g', date_format='%Y-%m-%d %H:%M:%S')
+    else:
+        df.to_parquet(tmp_fname, index=False)
+    os.replace(tmp_fname, fname)
+
+def get_plain_units(units):
+    """
+    Function to turn units with Matplotlib math text into plain text for a table (e.g., 'm $\\mathregular{s^{-1}}$'
+    into 'm s-1').
+    -- Input:
+        - units: string
+    -- Output:
+        - units: string without math text markup
+    """
+    units = re.sub(r'\\mathregular\{(.*)\}', r'\1', units)
+    return re.sub(r'[${}^]', '', units)
+
+def get_station_fname_part(name):
+    """
+    Function to turn a station name into a part of a file name (e.g., 'St. Augustine' into 'St_Augustine').
+    -- Input:
+        - name: string, station name
+    -- Output:
+        - fname_part: string of letters, digits, dashes, and underscores
+    """
+    return re.sub(r'[^A-Za-z0-9-]+', '_', name).strip('_')
+
+def plot_meteograms(fname_fmt, stations, valid_dts, labels, units, values, title=None, fontsize=12):
+    """
+    Procedure to plot a meteogram of each station: one panel per variable, over the valid times. The figure is drawn
+    once and only the lines, limits, and titles are updated for each station.
+    -- Inputs:
+        - fname_fmt: string, output file name with a {station} field for the station name (see get_station_fname_part)
+        - stations: dictionary with the keys name, lat, and lon (see read_stations), of the stations to plot
+        - valid_dts: list of pandas Timestamps, valid times
+        - labels, units: lists of strings, variable labels & units
+        - values: 3D array (valid time, variable, station)
+        - title: string, first line of the figure title (default: None)
+        - fontsize: integer, font size of the labels (default: 12)
+    """
+    n_vars = len(labels)
+    rc = {'font.size': fontsize, 'axes.grid': True, 'grid.color': 'gray', 'grid.linestyle': ':',
+          'savefig.bbox': 'tight', 'savefig.dpi': 100}
+    with mpl.rc_context(rc):
+        fig, axes = plt.subplots(n_vars, 1, sharex=True, figsize=(9, 2.0 * n_vars + 1), squeeze=False)
+        fig.subplots_adjust(hspace=0.35)
+        axes = axes[:, 0]
+        lines = []
+        for vv, ax in enumerate(axes):
+            lines.append(ax.plot(valid_dts, np.full(len(valid_dts), np.nan), marker='o', markersize=3)[0])
+            ax.set_title(labels[vv], fontsize=fontsize, loc='left')
+            ax.set_ylabel(units[vv], fontsize=fontsize - 2)
+        axes[-1].xaxis.set_major_locator(mpl.dates.AutoDateLocator(minticks=3, maxticks=7))
+        axes[-1].xaxis.set_major_formatter(mpl.dates.DateFormatter('%d %b\n%H%M UTC'))
+        for ss, name in enumerate(stations['name']):
+            for vv, ax in enumerate(axes):
+                lines[vv].set_ydata(values[:, vv, ss])
+                ax.relim()
+                ax.autoscale_view()
+            stn_title = f'{name} ({stations["lat"][ss]:.2f}, {stations["lon"][ss]:.2f})'
+            fig.suptitle(stn_title if title is None else title + '\n' + stn_title)
+            fname = fname_fmt.format(station=get_station_fname_part(name))
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+            fig.savefig(fname)
+        plt.close(fig)
@@ -0,0 +1,224 @@
+"""
+tile_funcs.py
+
+This file contains functions to cut a WRF field into a pyramid of XYZ web map tiles: 256 x 256 pixel PNG images in
+the Web Mercator projection, named {z}/{x}/{y}.png, as used by Leaflet, OpenLayers, MapLibre, etc. The tiles are
+colored with the same colormap & contour levels as the maps of map_funcs.map_plot.
+
+Each tile pixel gets the color of the WRF grid cell it falls in. Finding that cell for every pixel (get_tile_index)
+only depends on the grid and the zoom levels, so it is done once per domain and reused for every field and valid
+time. Making the tiles of a field (write_tiles) is then only a lookup of the colors of its grid cells.
+"""
+
+import os
+import json
+import shutil
+import numpy as np
+import matplotlib.colors as mcolors
+import cartopy.crs as ccrs
+
+# Import functions from local files
+import map_funcs
+
+# Width & height of a tile [pixels]
+tile_size = 256
+
+# Web Mercator does not reach the poles; tiles cover latitudes up to this value
+max_lat = 85.05112878
+
+def lonlat_to_tile(lon, lat, zoom):
+    """
+    Function to convert longitudes & latitudes to tile coordinates (x from the antimeridian eastward, y from the
+    north edge southward) at a zoom level.
+    -- Inputs:
+        - lon, lat: floats or arrays [degrees]
+        - zoom: integer, zoom level (2**zoom tiles across the world)
+    -- Outputs:
+        - x, y: floats or arrays, tile coordinates (the integer part is the tile, the fraction the position in it)
+    """
+    n_tiles = 2 ** zoom
+    lat_rad = np.radians(np.clip(lat, -max_lat, max_lat))
+    x = (np.asarray(lon) + 180.0) / 360.0 * n_tiles
+    y = (1.0 - np.arcsinh(np.tan(lat_rad)) / np.pi) / 2.0 * n_tiles
+    return x, y
+
+def tile_to_lonlat(x, y, zoom):
+    """
+    Function to convert tile coordinates at a zoom level to longitudes & latitudes (the inverse of lonlat_to_tile).
+    -- Inputs:
+        - x, y: floats or arrays, tile coordinates
+        - zoom: integer, zoom level
+    -- Outputs:
+        - lon, lat: floats or arrays [degrees]
+    """
+    n_tiles = 2 ** zoom
+    lon = np.asarray(x) / n_tiles * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * np.asarray(y) / n_tiles))))
+    return lon, lat
+
+def get_tile_range(lons, lats, zoom):
+    """
+    Function to get the range of tiles at a zoom level that cover the bounding box of a lat/lon grid.
+    -- Inputs:
+        - lons, lats: 2D arrays of the grid longitudes & latitudes
+        - zoom: integer, zoom level
+    -- Outputs:
+        - x_beg, x_end, y_beg, y_end: integers, tile x & y ranges (end excluded)
+    """
+    x_min, y_max = lonlat_to_tile(np.min(lons), np.min(lats), zoom)
+    x_max, y_min = lonlat_to_tile(np.max(lons), np.max(lats), zoom)
+    n_tiles = 2 ** zoom
+    return (max(0, int(np.floor(x_min))), min(n_tiles, int(np.floor(x_max)) + 1),
+            max(0, int(np.floor(y_min))), min(n_tiles, int(np.floor(y_max)) + 1))
+
+def get_tile_index(proj_x, proj_y, lons, lats, cart_proj, zoom_min, zoom_max):
+    """
+    Function to find the grid cell of every pixel of the tiles that cover a grid, for a range of zoom levels.
+    -- Inputs:
+        - proj_x, proj_y: 2D arrays of the grid projected to cart_proj coordinates (see map_funcs.get_projected_coords)
+        - lons, lats: 2D arrays of the grid longitudes & latitudes
+        - cart_proj: Cartopy object, map projection of the grid
+        - zoom_min, zoom_max: integers, range of zoom levels (zoom_max included)
+    -- Output:
+        - tile_index: dictionary of zoom level to a dictionary with the keys
+            - tiles: list of (x, y) tiles that overlap the grid
+            - index: 3D array of int32 (tile, row, column) of the flat index of the grid cell of each pixel of each
+                     tile (row-major over proj_x.shape), or -1 for pixels outside the grid
+    """
+    # Every pixel falls in one cell of a grid that is regular in its own map projection, as WRF grids are
+    extent = map_funcs.get_raster_extent(proj_x, proj_y)
+    if extent is None:
+        raise ValueError('XYZ tiles need a grid that is regular in its map projection coordinates')
+    n_y, n_x = proj_x.shape
+    dx = (extent[1] - extent[0]) / n_x
+    dy = (extent[3] - extent[2]) / n_y
+    data_crs = ccrs.PlateCarree()
+
+    tile_index = {}
+    for zoom in range(zoom_min, zoom_max + 1):
+        x_beg, x_end, y_beg, y_end = get_tile_range(lons, lats, zoom)
+        # In Web Mercator, the longitude of a pixel only depends on its column, and its latitude only on its row
+        pix_lons, _ = tile_to_lonlat(x_beg + (np.arange((x_end - x_beg) * tile_size) + 0.5) / tile_size, 0.0, zoom)
+        tiles = []
+        blocks = []
+        # One row of tiles at a time, to bound the memory of projecting the pixel coordinates
+        for y in range(y_beg, y_end):
+            _, pix_lats = tile_to_lonlat(0.0, y + (np.arange(tile_size) + 0.5) / tile_size, zoom)
+            lon2d, lat2d = np.meshgrid(pix_lons, pix_lats)
+            pix_xy = cart_proj.transform_points(data_crs, lon2d, lat2d)
+            with np.errstate(invalid='ignore'):
+                ii = np.floor((pix_xy[:, :, 0] - extent[0]) / dx)
+                jj = np.floor((pix_xy[:, :, 1] - extent[2]) / dy)
+                inside = (ii >= 0) & (ii < n_x) & (jj >= 0) & (jj < n_y)
+            index = np.where(inside, jj * n_x + ii, -1).astype(np.int32)
+            for i_tile, x in enumerate(range(x_beg, x_end)):
+                block = index[:, i_tile * tile_size:(i_tile + 1) * tile_size]
+                if np.any(block >= 0):
+                    tiles.append((x, y))
+                    blocks.append(np.ascontiguousarray(block))
+        tile_index[zoom] = {'tiles': tiles,
+                            'index': np.array(blocks, dtype=np.int32).reshape(-1, tile_size, tile_size)}
+    return tile_index
+
+def get_legend(cmap, norm, bounds, extend):
+    """
+    Function to describe the colors of the tiles, for a web map legend.
+    -- Inputs:
+        - cmap: Matplotlib colormap
+        - norm: Matplotlib norm
+        - bounds: array of contour levels
+        - extend: string, colorbar extension beyond the levels ('neither', 'min', 'max', or 'both')
+    -- Output:
+        - legend: dictionary with the keys levels, colors (hex color of each interval between levels), and under &
+                  over (hex color below the first & above the last level, or None)
+    """
+    centers = (np.asarray(bounds[:-1]) + np.asarray(bounds[1:])) / 2.0
+    legend = {'levels': [float(level) for level in bounds],
+              'colors': [mcolors.to_hex(color, keep_alpha=True) for color in cmap(norm(centers))],
+              'under': None, 'over': None}
+    if extend in ['min', 'both']:
+        legend['under'] = mcolors.to_hex(cmap(norm(bounds[0] - 1.0)), keep_alpha=True)
+    if extend in ['max', 'both']:
+        legend['over'] = mcolors.to_hex(cmap(norm(bounds[-1] + 1.0)), keep_alpha=True)
+    return legend
+
+def write_tiles(fill_var, tile_index, cmap, norm, bounds, extend, tile_dir, image_writer, image_opts=None):
+    """
+    Function to write the tiles of a field, colored as map_funcs.draw_raster colors its grid cells. Tiles in which
+    the field has no data (e.g., no rain) are not written. Any tiles already in tile_dir are removed first, so no tile
+    of an earlier run is left behind. The tiles are encoded in parallel by the threads of image_writer.
+    -- Inputs:
+        - fill_var: 2D array of values, on the grid of tile_index
+        - tile_index: dictionary from get_tile_index
+        - cmap: Matplotlib colormap
+        - norm: Matplotlib norm
+        - bounds: array of contour levels
+        - extend: string, colorbar extension beyond the levels ('neither', 'min', 'max', or 'both')
+        - tile_dir: pathlib object, directory of the {z}/{x}/{y}.png tiles
+        - image_writer: image_funcs.ImageWriter object
+        - image_opts: dictionary of image encoding options (default: PNG with the default compression)
+    -- Output:
+        - tile_stats: dictionary with the keys n_tiles (written), n_empty (skipped), bytes, encode_s, and zooms
+                      (number of tiles written at each zoom level)
+    """
+    if image_opts is None:
+        image_opts = {'format': 'png'}
+    values = map_funcs.get_raster_values(fill_var, bounds, extend)
+    # Color each grid cell once; pixels outside the grid (-1) get the transparent color at the end
+    cell_rgba = cmap(norm(values.ravel()), bytes=True)
+    cell_rgba[np.ma.getmaskarray(values).ravel()] = 0
+    cell_rgba = np.concatenate([cell_rgba, np.zeros((1, 4), dtype=np.uint8)])
+
+    if tile_dir.is_dir():
+        shutil.rmtree(tile_dir)
+    futures = []
+    tile_stats = {'n_tiles': 0, 'n_empty': 0, 'bytes': 0, 'encode_s': 0.0, 'zooms': {}}
+    for zoom, zoom_index in tile_index.items():
+        tile_stats['zooms'][zoom] = 0
+        for (x, y), index in zip(zoom_index['tiles'], zoom_index['index']):
+            rgba = cell_rgba[index]
+            if not np.any(rgba[:, :, 3]):
+                tile_stats['n_empty'] += 1
+                continue
+            fname = tile_dir.joinpath(str(zoom), str(x), str(y) + '.png')
+            futures.append(image_writer.submit(rgba, fname, image_opts))
+            tile_stats['zooms'][zoom] += 1
+    for future in futures:
+        image_stats = future.result()
+        tile_stats['n_tiles'] += 1
+        tile_stats['bytes'] += image_stats['bytes']
+        tile_stats['encode_s'] += image_stats['encode_s']
+    return tile_stats
+
+def write_tile_manifest(tile_dir, tile_index, tile_stats, meta):
+    """
+    Procedure to write the manifest of a set of tiles (tiles.json in tile_dir), in the TileJSON format read by web
+    map libraries, with the description of the product & legend colors added.
+    -- Inputs:
+        - tile_dir: pathlib object, directory of the {z}/{x}/{y}.png tiles
+        - tile_index: dictionary from get_tile_index
+        - tile_stats: dictionary from write_tiles
+        - meta: dictionary of product details to add (e.g., name, label, units, valid time, legend)
+    """
+    zooms = sorted(tile_index)
+    # The bounds are those of the tiles of the last (finest) zoom level that overlap the grid
+    zoom_end = zooms[-1]
+    x_beg = min(x for x, _ in tile_index[zoom_end]['tiles'])
+    x_end = max(x for x, _ in tile_index[zoom_end]['tiles']) + 1
+    y_beg = min(y for _, y in tile_index[zoom_end]['tiles'])
+    y_end = max(y for _, y in tile_index[zoom_end]['tiles']) + 1
+    west, north = tile_to_lonlat(x_beg, y_beg, zoom_end)
+    east, south = tile_to_lonlat(x_end, y_end, zoom_end)
+    manifest = {
+        'tilejson': '2.2.0', 'scheme': 'xyz', 'tiles': ['{z}/{x}/{y}.png'],
+        'minzoom': zooms[0], 'maxzoom': zooms[-1],
+        'bounds': [float(west), float(south), float(east), float(north)],
+        'center': [float(west + east) / 2.0, float(south + north) / 2.0, zooms[0]],
+        'tile_count': tile_stats['n_tiles'], 'empty_tiles_skipped': tile_stats['n_empty'],
+        'tile_count_by_zoom': {str(zoom): count for zoom, count in tile_stats['zooms'].items()},
+        'bytes': tile_stats['bytes'],
+    }
+    manifest.update(meta)
+    os.makedirs(tile_dir, exist_ok=True)
+    with open(tile_dir.joinpath('tiles.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
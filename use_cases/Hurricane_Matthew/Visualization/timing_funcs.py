@@ -0,0 +1,184 @@
+"""
+timing_funcs.py
+
+This file contains functions to record the wall time, CPU time, and memory use of the stages of making plots
+(e.g., opening a file, computing a diagnostic, contouring, saving the figure), so that a stage or product
+that got slower can be found from the records of a normal run, without attaching a profiler.
+
+Code to be timed is wrapped in a stage context manager:
+    with timing_funcs.stage('contourf'):
+        ax.contourf(...)
+Each stage appends a record to the records list of the process, with the labels set by set_labels (e.g., the
+product and valid time of the plot being made). Stages may be nested (e.g., each diagnostic within the plot
+task), in which case the outer stage's time includes the inner ones.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import resource
+import contextlib
+
+# Set to False to stop recording stages (the wrapped code still runs)
+enabled = True
+
+# Labels added to each record, e.g., the product & valid time of the current plot (see set_labels)
+labels = {}
+
+# Records of the stages run in this process since the last call to pop_records
+records = []
+
+# Keys of each record (after the labels)
+record_keys = ['stage', 'wall_s', 'cpu_s', 'rss_mb', 'peak_rss_mb']
+
+def get_rss_mb():
+    """
+    Function to get the current resident set size (RSS) of this process.
+    -- Output:
+        - rss_mb: float, RSS [MB], or None if it is not available on this platform (only Linux /proc is read)
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            n_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return n_pages * os.sysconf('SC_PAGE_SIZE') / 1e6
+
+def get_peak_rss_mb():
+    """
+    Function to get the peak resident set size of this process since it started.
+    -- Output:
+        - peak_rss_mb: float, peak RSS [MB]
+    """
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, and in kilobytes on Linux
+    if sys.platform == 'darwin':
+        return peak_rss / 1e6
+    return peak_rss * 1024 / 1e6
+
+def set_labels(**kwargs):
+    """
+    Procedure to set the labels added to each following record, replacing any previous labels.
+    -- Input:
+        - kwargs: label names and values (e.g., product='T2', valid_time='2016-10-06_03:00:00')
+    """
+    labels.clear()
+    labels.update(kwargs)
+
+def new_record(name, wall_s, cpu_s, record_labels=None):
+    """
+    Function to make a stage record, e.g., for work timed in another thread (which must not use stage, as the labels
+    may have changed by the time it ends).
+    -- Inputs:
+        - name: string, stage name
+        - wall_s: float, wall time of the stage [s]
+        - cpu_s: float, CPU time of the stage [s]
+        - record_labels: dictionary of labels (default: the current labels, see set_labels)
+    -- Output:
+        - record: record dictionary (see record_keys), with the current memory use of the process
+    """
+    record = dict(labels if record_labels is None else record_labels)
+    record['stage'] = name
+    record['wall_s'] = round(wall_s, 6)
+    record['cpu_s'] = round(cpu_s, 6)
+    rss_mb = get_rss_mb()
+    record['rss_mb'] = None if rss_mb is None else round(rss_mb, 1)
+    record['peak_rss_mb'] = round(get_peak_rss_mb(), 1)
+    return record
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Context manager to record the wall time, CPU time, and memory use of the code run within it.
+    -- Input:
+        - name: string, stage name (e.g., 'open', 'diag:slp', 'contourf', 'savefig')
+    """
+    if not enabled:
+        yield
+        return
+    wall_beg = time.perf_counter()
+    cpu_beg = time.process_time()
+    try:
+        yield
+    finally:
+        records.append(new_record(name, time.perf_counter() - wall_beg, time.process_time() - cpu_beg))
+
+def pop_records():
+    """
+    Function to get and clear the records of the stages run in this process.
+    -- Output:
+        - stage_records: list of record dictionaries, in the order the stages ended
+    """
+    stage_records = list(records)
+    records.clear()
+    return stage_records
+
+def write_records(stage_records, fname, fmt='jsonl'):
+    """
+    Procedure to append stage records to a JSON-lines or CSV file. A CSV file gets a header line when it is created,
+    from the keys of the first record (so all records written to a CSV file should have the same labels).
+    -- Inputs:
+        - stage_records: list of record dictionaries (see stage)
+        - fname: string or pathlib object, output file name
+        - fmt: string, 'jsonl' (one JSON object per line) or 'csv'
+    """
+    if len(stage_records) == 0:
+        return
+    if fmt == 'jsonl':
+        with open(fname, 'a') as f:
+            for record in stage_records:
+                f.write(json.dumps(record, default=str) + '\n')
+    elif fmt == 'csv':
+        new_file = not os.path.isfile(fname)
+        with open(fname, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(stage_records[0].keys()), extrasaction='ignore')
+            if new_file:
+                writer.writeheader()
+            writer.writerows(stage_records)
+    else:
+        raise ValueError('Unknown timing record format: ' + str(fmt))
+
+def summarize_records(stage_records, group_keys):
+    """
+    Function to summarize stage records by group (e.g., by stage, or by product & stage).
+    -- Inputs:
+        - stage_records: list of record dictionaries (see stage)
+        - group_keys: list of record keys to group by
+    -- Output:
+        - summary: dictionary of group (tuple of values of group_keys) to a dictionary with the keys count, wall_s
+                   (total), wall_mean_s, wall_max_s, cpu_s (total), and peak_rss_mb (largest), in order of first record
+    """
+    summary = {}
+    for record in stage_records:
+        group = tuple(record.get(key) for key in group_keys)
+        group_summary = summary.setdefault(group, {'count': 0, 'wall_s': 0.0, 'wall_max_s': 0.0, 'cpu_s': 0.0,
+                                                   'peak_rss_mb': 0.0})
+        group_summary['count'] += 1
+        group_summary['wall_s'] += record['wall_s']
+        group_summary['wall_max_s'] = max(group_summary['wall_max_s'], record['wall_s'])
+        group_summary['cpu_s'] += record['cpu_s']
+        group_summary['peak_rss_mb'] = max(group_summary['peak_rss_mb'], record['peak_rss_mb'])
+    for group_summary in summary.values():
+        group_summary['wall_mean_s'] = group_summary['wall_s'] / group_summary['count']
+    return summary
+
+def print_summary(stage_records, group_keys=('stage',)):
+    """
+    Procedure to print a table summarizing stage records by group, slowest total wall time first.
+    -- Inputs:
+        - stage_records: list of record dictionaries (see stage)
+        - group_keys: list of record keys to group by (default: by stage)
+    """
+    summary = summarize_records(stage_records, group_keys)
+    if len(summary) == 0:
+        return
+    names = {group: ' '.join(str(val) for val in group) for group in summary}
+    width = max(len(' '.join(group_keys)), max(len(name) for name in names.values()))
+    print('   ' + ' '.join(group_keys).ljust(width) +
+          '  count   wall [s]   mean [s]    max [s]    cpu [s]  peak RSS [MB]')
+    for group, group_summary in sorted(summary.items(), key=lambda item: -item[1]['wall_s']):
+        print('   {:s}  {:5d} {:10.3f} {:10.3f} {:10.3f} {:10.3f} {:14.1f}'.format(
+            names[group].ljust(width), group_summary['count'], group_summary['wall_s'], group_summary['wall_mean_s'],
+            group_summary['wall_max_s'], group_summary['cpu_s'], group_summary['peak_rss_mb']))
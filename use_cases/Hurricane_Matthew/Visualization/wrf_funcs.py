@@ -0,0 +1,541 @@
+"""
+wrf_funcs.py
+
+This file contains common functions and procedures useful for reading WRF model output and computing diagnostics
+from it, typically for plotting with map_funcs.
+"""
+
+import os
+import collections
+import numpy as np
+import netCDF4
+import wrf
+
+# Import functions from local files
+import chunk_funcs
+import diag_funcs
+import refl_funcs
+import timing_funcs
+
+# Global attributes of a wrfout file that define its grid & map projection
+grid_attrs = ['MAP_PROJ', 'TRUELAT1', 'TRUELAT2', 'STAND_LON', 'CEN_LAT', 'CEN_LON', 'MOAD_CEN_LAT', 'POLE_LAT',
+              'POLE_LON', 'DX', 'DY', 'WEST_EAST_GRID_DIMENSION', 'SOUTH_NORTH_GRID_DIMENSION']
+
+# Raw wrfout variables read to compute each diagnostic (see diag_funcs; named as in wrf.getvar)
+# (uvmet10 only needs XLAT/XLONG to rotate the winds on Lambert conformal or polar stereographic grids)
+diag_raw_vars = {
+    'uvmet10': ['U10', 'V10', 'XLAT', 'XLONG'],
+    'slp': ['T', 'P', 'PB', 'QVAPOR', 'PH', 'PHB'],
+    'rh2': ['T2', 'PSFC', 'Q2'],
+}
+
+# Variable holding the vertical levels of the 3D fields in each stream of WRF output files
+level_coords = {'wrfout': None, 'zlev': 'Z_ZL', 'plev': 'P_PL'}
+
+# Index of each level of the zlev/plev streams located so far in this process, by stream, number of levels, and level
+# (the levels are set once for a run in namelist.input, e.g., press_levels for the plev stream)
+level_indexes = {}
+
+# Wind components in each stream, for wind barb overlays (u10 & v10 are rotated to earth-relative by uvmet10)
+wind_vars = {'wrfout': ('u10', 'v10'), 'zlev': ('U_ZL', 'V_ZL'), 'plev': ('U_PL', 'V_PL')}
+
+# Derived fields that can be plotted from wrfout files, with the diagnostics and raw 2D variables they need
+# (any other wrfout field name is read directly as a raw 2D variable, e.g., T2 or HGT)
+derived_fields = {
+    'wspd10': {'diags': ['uvmet10'], 'raw': []},
+    'u10': {'diags': ['uvmet10'], 'raw': []},
+    'v10': {'diags': ['uvmet10'], 'raw': []},
+    'slp': {'diags': ['slp'], 'raw': []},
+    'rh2': {'diags': ['rh2'], 'raw': []},
+    't2c': {'diags': [], 'raw': ['T2']},
+    'dbz': {'diags': [], 'raw': []},
+    'mdbz': {'diags': [], 'raw': []},
+    'rain': {'diags': [], 'raw': ['RAINC', 'RAINNC']},
+}
+
+# Reflectivity fields computed by refl_funcs instead of wrf-python: on the lowest model level (read from the bottom
+# level of each input only), and the composite (column-maximum) reflectivity (read in blocks of levels)
+refl_fields = {'dbz': refl_funcs.get_lowest_refl, 'mdbz': refl_funcs.get_composite_refl}
+
+# Fields computed from 3D inputs that can be computed in tiles of grid rows to fit a memory budget (see
+# read_tiled_field), with their raw inputs, the number of levels of the inputs read at once (None: all levels), and the
+# memory used to compute a tile per byte of its inputs (measured with tracemalloc, with some margin)
+tiled_fields = {
+    'slp': {'raw': diag_raw_vars['slp'], 'levels': None, 'work_factor': 2.5},
+    'dbz': {'raw': refl_funcs.refl_raw_vars, 'levels': 1, 'work_factor': 3.5},
+    'mdbz': {'raw': refl_funcs.refl_raw_vars, 'levels': refl_funcs.levels_per_read, 'work_factor': 3.5},
+}
+
+# Global attributes of a wrfout file used to rotate the winds of its projection to earth-relative winds
+map_attrs = ['MAP_PROJ', 'TRUELAT1', 'TRUELAT2', 'STAND_LON']
+
+# Fields accumulated since the start of the forecast, which can be plotted as interval accumulations (e.g., 3-h rain)
+accum_fields = ['rain', 'RAINC', 'RAINNC']
+
+def get_raw_vars(diags):
+    """
+    Function to get the union of the raw wrfout variables needed to compute a list of diagnostics.
+    -- Input:
+        - diags: list of strings, diagnostic names (keys of diag_raw_vars)
+    -- Output:
+        - raw_vars: list of strings, raw variable names (each listed once, in order of first use)
+    """
+    raw_vars = []
+    for diag in diags:
+        for raw_var in diag_raw_vars[diag]:
+            if raw_var not in raw_vars:
+                raw_vars.append(raw_var)
+    return raw_vars
+
+def get_grid_key(ds_wrf_nc):
+    """
+    Function to get a key that identifies the grid of a wrfout file, to check whether anything computed from the
+    grid (e.g., projected coordinates) can be reused for another file. Besides the projection attributes, the
+    lat/lon of the grid corners are part of the key, so that moving nests get a new key whenever they move.
+    -- Input:
+        - ds_wrf_nc: netCDF4 Dataset for a wrfout file
+    -- Output:
+        - grid_key: tuple of projection attributes and corner latitudes & longitudes
+    """
+    attr_vals = []
+    for attr in grid_attrs:
+        val = getattr(ds_wrf_nc, attr, None)
+        if isinstance(val, np.generic):
+            val = val.item()
+        attr_vals.append(val)
+    corners = []
+    for raw_var in ['XLAT', 'XLONG']:
+        var_corners = ds_wrf_nc.variables[raw_var][0, [0, -1], [0, -1]]
+        corners = corners + [round(float(val), 4) for val in np.ravel(var_corners)]
+    return tuple(attr_vals) + tuple(corners)
+
+def get_field_inputs(stream, field, level=None):
+    """
+    Function to get the raw variables (and levels) that are read to get a field from a stream of WRF output files.
+    -- Inputs:
+        - stream: string, 'wrfout', 'zlev', or 'plev' (keys of level_coords)
+        - field: string, derived field (key of derived_fields) or raw variable name
+        - level: float, level of a 3D field in the zlev/plev streams (Z_ZL [m] or P_PL [Pa] value)
+    -- Outputs:
+        - inputs: list of (raw variable name, level) tuples, with level None for variables read in full
+    """
+    if stream == 'wrfout':
+        if field == 'dbz':
+            # Level 0: only the lowest model level of each input is read
+            return [(raw_var, 0) for raw_var in refl_funcs.refl_raw_vars]
+        if field == 'mdbz':
+            return [(raw_var, None) for raw_var in refl_funcs.refl_raw_vars]
+        if field not in derived_fields:
+            return [(field, None)]
+        return [(raw_var, None) for raw_var in get_raw_vars(derived_fields[field]['diags'])] + \
+               [(raw_var, None) for raw_var in derived_fields[field]['raw']]
+    return [(level_coords[stream], None), (field, level)]
+
+def get_input_bytes(ds_wrf_nc, raw_var, level=None):
+    """
+    Function to get the number of bytes read for one time of a raw variable (or one level of it), from its shape
+    in the file and without reading it.
+    -- Inputs:
+        - ds_wrf_nc: netCDF4 Dataset for a WRF output file
+        - raw_var: string, raw variable name
+        - level: level of a 3D variable (None to read the variable in full)
+    -- Outputs:
+        - n_bytes: integer (0 if the variable is not in the file)
+    """
+    if raw_var not in ds_wrf_nc.variables:
+        return 0
+    nc_var = ds_wrf_nc.variables[raw_var]
+    shape = nc_var.shape[1:]
+    if level is not None:
+        shape = shape[1:]
+    return int(np.prod(shape)) * nc_var.dtype.itemsize
+
+def get_level_index(ds_wrf_nc, stream, level, timeidx=0):
+    """
+    Function to get the index of a level in the vertical levels of a zlev/plev file. The level coordinate (Z_ZL or
+    P_PL) is only read the first time a level is located for a stream with that number of levels; later files of the
+    run reuse the index (see level_indexes).
+    -- Inputs:
+        - ds_wrf_nc: netCDF4 Dataset for a wrfout_zlev or wrfout_plev file
+        - stream: string, 'zlev' or 'plev'
+        - level: float, Z_ZL [m] or P_PL [Pa] value
+        - timeidx: integer, time index to read (default: 0)
+    -- Outputs:
+        - ind_level: integer
+    """
+    level_var = ds_wrf_nc.variables[level_coords[stream]]
+    level_key = (stream, level_var.shape[-1], float(level))
+    if level_key not in level_indexes:
+        levels = np.asarray(level_var[timeidx])
+        ind_level = np.nonzero(np.isclose(levels, level))[0]
+        if len(ind_level) == 0:
+            raise ValueError('Level ' + str(level) + ' is not one of the ' + level_coords[stream] + ' levels ' +
+                             str(levels.tolist()))
+        level_indexes[level_key] = int(ind_level[0])
+    return level_indexes[level_key]
+
+def read_fields(ds_wrf_nc, stream, fields, timeidx=0, buffers=None, memory_budget=None, minmax_box=None,
+                field_minmax=None):
+    """
+    Function to read a set of fields from a WRF output file, reading each raw variable only once and only the
+    levels needed from 3D variables. Diagnostics share one cache of raw variables (see read_diag_cache).
+    -- Inputs:
+        - ds_wrf_nc: netCDF4 Dataset for a WRF output file of the stream
+        - stream: string, 'wrfout', 'zlev', or 'plev' (keys of level_coords)
+        - fields: list of (field, level) tuples (see get_field_inputs)
+        - timeidx: integer, time index to read (default: 0)
+        - buffers: diag_funcs.DiagBuffers object to write the diagnostics into (default: None, new arrays); the
+                   diagnostics of the previous file read with the same buffers are then overwritten
+        - memory_budget: integer, memory budget [bytes] to compute each of the tiled_fields in tiles of grid rows,
+                         without reading their 3D inputs in full (default: None, read them in full)
+        - minmax_box: tuple of (j,i) slices to compute the min/max of the tiled fields over (default: None)
+        - field_minmax: dictionary to add the (min, max) of each tiled field over minmax_box to, by (field, level)
+                        (default: None)
+    -- Outputs:
+        - field_vals: dictionary of (field, level) to 2D numpy array
+    """
+    field_vals = {}
+    if stream != 'wrfout':
+        # Read only the 2D slabs of the requested levels, with any missing values (e.g., below ground) set to NaN;
+        # all levels of a variable (e.g., the 80, 100, and 200-m winds) are read in one pass
+        field_levels = {}
+        for field, level in fields:
+            field_levels.setdefault(field, []).append(level)
+        for field, levels in field_levels.items():
+            with timing_funcs.stage('read:' + field):
+                ind_levels = [get_level_index(ds_wrf_nc, stream, level, timeidx=timeidx) for level in levels]
+                ind_read = sorted(set(ind_levels))
+                if ind_read == list(range(ind_read[0], ind_read[-1] + 1)):
+                    # Consecutive levels are read as one hyperslab
+                    slabs = ds_wrf_nc.variables[field][timeidx, ind_read[0]:ind_read[-1] + 1, :, :]
+                else:
+                    slabs = ds_wrf_nc.variables[field][timeidx, ind_read, :, :]
+                slabs = np.ma.filled(np.ma.asarray(slabs, dtype=np.float32), np.nan)
+                for level, ind_level in zip(levels, ind_levels):
+                    field_vals[(field, level)] = slabs[ind_read.index(ind_level)]
+        return field_vals
+
+    tiled = []
+    if memory_budget is not None:
+        tiled = [field for field, level in fields if field in tiled_fields]
+    diags = []
+    raw_vars = []
+    for field, level in fields:
+        if field in tiled:
+            # Tiled fields read their own inputs, one tile at a time
+            continue
+        if field in derived_fields:
+            diags = diags + [diag for diag in derived_fields[field]['diags'] if diag not in diags]
+            raw_vars = raw_vars + [raw_var for raw_var in derived_fields[field]['raw'] if raw_var not in raw_vars]
+        elif field not in raw_vars:
+            raw_vars.append(field)
+    cache = {}
+    with timing_funcs.stage('read:wrfout'):
+        if len(diags) > 0:
+            cache, stats = read_diag_cache(ds_wrf_nc, diags, timeidx=timeidx)
+        raw_vars = [raw_var for raw_var in raw_vars if raw_var not in cache]
+        if len(raw_vars) > 0:
+            cache.update(wrf.extract_vars(ds_wrf_nc, timeidx, raw_vars, squeeze=False, meta=False))
+
+    def get_out(name):
+        # Output array of a 2D diagnostic, reused from the previous file if there are buffers
+        if buffers is None:
+            return None
+        return buffers.get(name, (ds_wrf_nc.dimensions['south_north'].size, ds_wrf_nc.dimensions['west_east'].size))
+
+    for field, level in fields:
+        if (field, level) in field_vals:
+            continue
+        if field in tiled:
+            # Same stages as when the inputs are read in full, but including the reads of the tiles
+            with timing_funcs.stage(('refl:' if field in refl_fields else 'diag:') + field):
+                field_vals[(field, level)], minmax = read_tiled_field(ds_wrf_nc, field, memory_budget,
+                                                                      timeidx=timeidx, out=get_out(field),
+                                                                      minmax_box=minmax_box)
+            if field_minmax is not None and minmax is not None:
+                field_minmax[(field, level)] = minmax
+        elif field in ['wspd10', 'u10', 'v10']:
+            with timing_funcs.stage('diag:uvmet10'):
+                u10, v10 = diag_funcs.calc_uvmet10(cache['U10'][0], cache['V10'][0], cache['XLAT'][0],
+                                                   cache['XLONG'][0], get_map_attrs(ds_wrf_nc),
+                                                   out_u=get_out('u10'), out_v=get_out('v10'))
+                field_vals[('u10', None)] = u10
+                field_vals[('v10', None)] = v10
+                field_vals[('wspd10', None)] = diag_funcs.calc_wspd(u10, v10, out=get_out('wspd10'))
+        elif field == 'slp':
+            with timing_funcs.stage('diag:slp'):
+                field_vals[(field, level)] = diag_funcs.calc_slp(cache['T'][0], cache['P'][0], cache['PB'][0],
+                                                                 cache['QVAPOR'][0], cache['PH'][0], cache['PHB'][0],
+                                                                 out=get_out('slp'))
+        elif field == 'rh2':
+            with timing_funcs.stage('diag:rh2'):
+                field_vals[(field, level)] = diag_funcs.calc_rh2(cache['T2'][0], cache['PSFC'][0], cache['Q2'][0],
+                                                                 out=get_out('rh2'))
+        elif field == 't2c':
+            field_vals[(field, level)] = diag_funcs.calc_t2c(cache['T2'][0], out=get_out('t2c'))
+        elif field in refl_fields:
+            # Inputs already read in full for other diagnostics (e.g., T, P, PB, QVAPOR for slp) are not read again
+            with timing_funcs.stage('refl:' + field):
+                field_vals[(field, level)] = refl_fields[field](ds_wrf_nc, timeidx=timeidx, cache=cache)
+        elif field == 'rain':
+            field_vals[(field, level)] = cache['RAINC'][0, :, :] + cache['RAINNC'][0, :, :]
+        else:
+            field_vals[(field, level)] = cache[field][0, :, :]
+    return field_vals
+
+def get_tile_row_bytes(ds_wrf_nc, field):
+    """
+    Function to estimate the memory used to compute one grid row of a tiled field, from the shapes of its inputs in
+    the file and without reading them.
+    -- Inputs:
+        - ds_wrf_nc: netCDF4 Dataset for a wrfout file
+        - field: string, key of tiled_fields
+    -- Output:
+        - row_bytes: integer [bytes]
+    """
+    row_bytes = 0
+    for raw_var in tiled_fields[field]['raw']:
+        if raw_var not in ds_wrf_nc.variables:
+            continue
+        nc_var = ds_wrf_nc.variables[raw_var]
+        n_levels = nc_var.shape[1] if tiled_fields[field]['levels'] is None else tiled_fields[field]['levels']
+        row_bytes += min(n_levels, nc_var.shape[1]) * nc_var.shape[-1] * nc_var.dtype.itemsize
+    return int(row_bytes * tiled_fields[field]['work_factor'])
+
+def read_tiled_field(ds_wrf_nc, field, memory_budget, timeidx=0, out=None, minmax_box=None):
+    """
+    Function to compute a 2D field from 3D inputs (sea-level pressure or reflectivity) in tiles of grid rows, reading
+    only the rows of its inputs needed for each tile, so that the memory used is bounded by a budget instead of
+    growing with the size of the domain. The min/max of the field over a box are computed tile by tile.
+    -- Inputs:
+        - ds_wrf_nc: netCDF4 Dataset for a wrfout file
+        - field: string, key of tiled_fields
+        - memory_budget: integer, memory budget [bytes] (tiles have at least one row, even if it needs more)
+        - timeidx: integer, time index to read (default: 0)
+        - out: float32 array to write the result into (default: None, a new array)
+        - minmax_box: tuple of (j,i) slices to compute the min/max over (default: None, not computed)
+    -- Outputs:
+        - vals: 2D float32 array
+        - minmax: tuple of floats (min, max) over minmax_box, or None
+    """
+    shape = (ds_wrf_nc.dimensions['south_north'].size, ds_wrf_nc.dimensions['west_east'].size)
+    vals = diag_funcs.get_out(out, shape)
+    tile_rows = chunk_funcs.get_tile_rows(shape[0], get_tile_row_bytes(ds_wrf_nc, field), memory_budget)
+    minmax = None if minmax_box is None else chunk_funcs.MinMax(minmax_box, shape)
+    for rows in chunk_funcs.iter_row_tiles(shape[0], tile_rows):
+        if field == 'slp':
+            inputs = {raw_var: np.asarray(ds_wrf_nc.variables[raw_var][timeidx, :, rows, :])
+                      for raw_var in tiled_fields[field]['raw']}
+            diag_funcs.calc_slp(inputs['T'], inputs['P'], inputs['PB'], inputs['QVAPOR'], inputs['PH'], inputs['PHB'],
+                                out=vals[rows])
+        else:
+            vals[rows] = refl_fields[field](ds_wrf_nc, timeidx=timeidx, rows=rows)
+        if minmax is not None:
+            minmax.update(vals[rows], rows)
+    return vals, None if minmax is None else minmax.get()
+
+def get_map_attrs(ds_wrf_nc):
+    """
+    Function to get the global attributes of a wrfout file used to rotate its winds (see diag_funcs.calc_uvmet10).
+    -- Input:
+        - ds_wrf_nc: netCDF4 Dataset for a wrfout file
+    -- Output:
+        - attrs: dictionary of attribute name (see map_attrs) to value (STAND_LON defaults to CEN_LON)
+    """
+    attrs = {attr: getattr(ds_wrf_nc, attr, None) for attr in map_attrs}
+    if attrs['STAND_LON'] is None:
+        attrs['STAND_LON'] = getattr(ds_wrf_nc, 'CEN_LON', None)
+    return attrs
+
+def read_diag_cache(ds_wrf_nc, diags, timeidx=0):
+    """
+    Function to read all the raw variables needed by a list of diagnostics from a wrfout file in one pass, so that
+    fields shared between diagnostics (e.g., P, PB, T, QVAPOR for both slp and reflectivity) are only read and decoded
+    once. The diagnostics are then computed from the cache by diag_funcs (see read_fields), and refl_funcs uses the
+    inputs of the reflectivity that are already in it.
+    NOTE: The cached arrays keep the Time dimension and have no metadata, as from wrf.extract_vars with squeeze=False
+          and meta=False (so the cache can also be passed to wrf.getvar with those arguments, e.g., to check diag_funcs).
+    -- Inputs:
+        - ds_wrf_nc: netCDF4 Dataset for a wrfout file
+        - diags: list of strings, diagnostic names (keys of diag_raw_vars)
+        - timeidx: integer, time index to read (default: 0)
+    -- Outputs:
+        - cache: dictionary of raw variable name to numpy array
+        - stats: dictionary with the keys:
+            - bytes_read: integer, number of bytes of raw variables read into the cache
+            - bytes_baseline: integer, number of bytes the diagnostics would read without a shared cache
+    """
+    # Optional hydrometeors (e.g., QGRAUP) may not be in the file, in which case wrf-python handles them itself
+    raw_vars = [raw_var for raw_var in get_raw_vars(diags) if raw_var in ds_wrf_nc.variables]
+    cache = wrf.extract_vars(ds_wrf_nc, timeidx, raw_vars, squeeze=False, meta=False)
+
+    bytes_read = sum(cache[raw_var].nbytes for raw_var in raw_vars)
+    bytes_baseline = 0
+    for diag in diags:
+        bytes_baseline += sum(cache[raw_var].nbytes for raw_var in diag_raw_vars[diag] if raw_var in cache)
+    stats = {'bytes_read': bytes_read, 'bytes_baseline': bytes_baseline}
+
+    return cache, stats
+
+class DatasetPool:
+    """
+    Class to share open netCDF4 Datasets between everything that reads the same WRF output files in a process, while
+    keeping at most max_open files open: when another file is needed, the least recently used one is closed. This
+    bounds the file descriptors and HDF5 chunk caches held by long runs over many cycles and valid times.
+    A file that changed on disk (size or modification time) since it was opened is reopened.
+    Use it as a context manager, or call close_all, to close every file it holds.
+    """
+
+    def __init__(self, max_open=8, chunk_cache_mb=None):
+        """
+        -- Inputs:
+            - max_open: integer, maximum number of files kept open at once
+            - chunk_cache_mb: float, size of the HDF5 chunk cache of each variable read from files opened from now on
+                              in this process [MB] (default: None, to keep the netCDF library default)
+        """
+        self.max_open = max(1, max_open)
+        self.datasets = collections.OrderedDict()
+        self.n_opened = 0
+        self.n_reused = 0
+        self.n_evicted = 0
+        self.max_in_use = 0
+        if chunk_cache_mb is not None:
+            # The chunk cache size is a process-wide default for files opened later (along with its slots & preemption)
+            _, n_elems, preemption = netCDF4.get_chunk_cache()
+            netCDF4.set_chunk_cache(int(chunk_cache_mb * 1024 * 1024), n_elems, preemption)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close_all()
+
+    def get(self, fname):
+        """
+        Function to get an open Dataset for a file, opening it (and closing the least recently used file if needed)
+        unless it is already open.
+        -- Input:
+            - fname: string or pathlib object, file name
+        -- Output:
+            - ds_nc: netCDF4 Dataset, open for reading (do not close it; the pool does)
+        """
+        key = os.path.abspath(fname)
+        fstat = os.stat(key)
+        file_id = (fstat.st_size, fstat.st_mtime_ns)
+        if key in self.datasets:
+            ds_nc, open_id = self.datasets[key]
+            if open_id == file_id:
+                self.datasets.move_to_end(key)
+                self.n_reused += 1
+                return ds_nc
+            self.close(key)
+        while len(self.datasets) >= self.max_open:
+            _, (ds_old, _) = self.datasets.popitem(last=False)
+            ds_old.close()
+            self.n_evicted += 1
+        with timing_funcs.stage('open'):
+            ds_nc = netCDF4.Dataset(key, mode='r')
+        self.datasets[key] = (ds_nc, file_id)
+        self.n_opened += 1
+        self.max_in_use = max(self.max_in_use, len(self.datasets))
+        return ds_nc
+
+    def close(self, fname):
+        """
+        Procedure to close a file if it is open in the pool.
+        -- Input:
+            - fname: string or pathlib object, file name
+        """
+        entry = self.datasets.pop(os.path.abspath(fname), None)
+        if entry is not None:
+            entry[0].close()
+
+    def close_all(self):
+        """
+        Procedure to close all the files open in the pool.
+        """
+        for ds_nc, _ in self.datasets.values():
+            ds_nc.close()
+        self.datasets.clear()
+
+    def get_stats(self):
+        """
+        Function to get counts of the files handled by the pool, and the memory use of the process.
+        -- Output:
+            - stats: dictionary with the keys n_open (files open now), max_open (most files open at once), n_opened,
+                     n_reused (requests served by an already open file), n_evicted (files closed to stay within
+                     max_open), and rss_mb (current resident memory of the process [MB], or None if unknown)
+        """
+        return {'n_open': len(self.datasets), 'max_open': self.max_in_use, 'n_opened': self.n_opened,
+                'n_reused': self.n_reused, 'n_evicted': self.n_evicted, 'rss_mb': timing_funcs.get_rss_mb()}
+
+class AccumBuffer:
+    """
+    Class that keeps the accumulated fields (e.g., rain = RAINC + RAINNC, accumulated since the start of the forecast)
+    of the most recent valid times of a forecast, so that interval accumulations (e.g., 3-h rain) can be taken as the
+    difference with an earlier valid time without reopening its file. Like a ring buffer for each accumulated field,
+    it only keeps the valid times of that field within max_window of its latest one, and of its latest forecast, so
+    its memory use does not grow with the number of valid times, and the fields do not evict each other.
+    -- Usage:
+        - accum_buffer = AccumBuffer(pd.Timedelta(hours=24))
+        - accum_buffer.put(forecast, field, valid_dt, vals) for each valid time read, in any order
+        - vals_beg = accum_buffer.get(forecast, field, valid_dt - pd.Timedelta(hours=3)), None if it is not in the
+          buffer
+    """
+
+    def __init__(self, max_window):
+        """
+        -- Input:
+            - max_window: timedelta, longest interval that will be asked for
+        """
+        self.max_window = max_window
+        self.fields = {}
+        self.n_hits = 0
+        self.n_misses = 0
+        self.max_len = 0
+
+    def put(self, forecast, field, valid_dt, vals):
+        """
+        Procedure to add an accumulated field of a valid time, and drop the valid times of that field no longer
+        needed: those of other forecasts, and those more than max_window before its latest valid time.
+        -- Inputs:
+            - forecast: tuple identifying the forecast, e.g., (cycle date/time, domain)
+            - field: string, name of the accumulated field (e.g., 'rain')
+            - valid_dt: datetime, valid time of the field
+            - vals: 2D array (it must not be changed after)
+        """
+        field_forecast, field_vals = self.fields.get(field, (None, {}))
+        if field_forecast != forecast:
+            field_vals = {}
+        field_vals[valid_dt] = vals
+        valid_dt_last = max(field_vals)
+        self.fields[field] = (forecast, {field_dt: vals for field_dt, vals in field_vals.items()
+                                         if field_dt >= valid_dt_last - self.max_window})
+        self.max_len = max(self.max_len, sum(len(field_vals) for _, field_vals in self.fields.values()))
+
+    def get(self, forecast, field, valid_dt):
+        """
+        Function to get an accumulated field of a valid time, if it is in the buffer.
+        -- Inputs:
+            - forecast: tuple identifying the forecast (see put)
+            - field: string, name of the accumulated field
+            - valid_dt: datetime, valid time of the field
+        -- Output:
+            - vals: 2D array, or None
+        """
+        field_forecast, field_vals = self.fields.get(field, (None, {}))
+        vals = field_vals.get(valid_dt) if field_forecast == forecast else None
+        if vals is None:
+            self.n_misses += 1
+        else:
+            self.n_hits += 1
+        return vals
+
+    def get_stats(self):
+        """
+        Function to get counts of the requests served by the buffer.
+        -- Output:
+            - stats: dictionary with the keys n_hits, n_misses (fields that had to be read again), and max_len (most
+                     fields kept at once, over all accumulated fields & valid times)
+        """
+        return {'n_hits': self.n_hits, 'n_misses': self.n_misses, 'max_len': self.max_len}